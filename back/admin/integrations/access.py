@@ -0,0 +1,174 @@
+import logging
+
+from django.conf import settings
+from django.core.cache import cache
+from django_q.tasks import async_task
+
+from admin.integrations.executor import iter_concurrently
+
+logger = logging.getLogger(__name__)
+
+# State of a background check (see `start_access_checks`)
+CHECKING = "checking"
+FAILED = "failed"
+
+
+def get_access_cache_key(integration_id, user_id):
+    return f"integration_access_{integration_id}_{user_id}"
+
+
+def get_access_check_cache_key(integration_id, user_id):
+    return f"integration_access_check_{integration_id}_{user_id}"
+
+
+def get_access_snapshot_cache_key(user_id):
+    # Access of the user to all integrations, see `User.check_integration_access`
+    return f"integration_access_snapshot_{user_id}"
+
+
+def clear_cached_access(integration, user):
+    """
+    Forget the last check of this user (and the snapshot of all their access), i.e.
+    after access has been given or revoked
+
+    :param integration Integration:
+    :param user User:
+    """
+    cache.delete_many(
+        [
+            get_access_cache_key(integration.id, user.id),
+            get_access_check_cache_key(integration.id, user.id),
+            get_access_snapshot_cache_key(user.id),
+        ]
+    )
+
+
+def iter_access(integrations, user):
+    """
+    Check if the user has an account in each of the integrations. Recent results
+    come from the cache, all other integrations are checked at the same time.
+    Results are yielded as soon as they are known, failed checks (`None`) are not
+    cached.
+
+    :param integrations list: integrations with an `exists` part in their manifest
+    :param user User: the user to check
+    :return generator: `(integration, found user)` tuples, in the order they finish
+    """
+    keys = {
+        integration.id: get_access_cache_key(integration.id, user.id)
+        for integration in integrations
+    }
+    cached = cache.get_many(keys.values())
+
+    to_check = []
+    for integration in integrations:
+        if keys[integration.id] in cached:
+            yield integration, cached[keys[integration.id]]
+        else:
+            to_check.append(integration)
+
+    for idx, found_user in iter_concurrently(
+        [
+            (integration, _user_exists_steps(integration, user))
+            for integration in to_check
+        ]
+    ):
+        integration = to_check[idx]
+        if found_user is not None:
+            cache.set(
+                keys[integration.id],
+                found_user,
+                settings.INTEGRATION_ACCESS_CACHE_TIMEOUT,
+            )
+        yield integration, found_user
+
+
+def _user_exists_steps(integration, user):
+    # A check that raises only fails for this integration
+    try:
+        return (yield from integration.user_exists_steps(user))
+    except Exception:
+        logger.exception(f"Checking access to {integration.name} failed")
+        return None
+
+
+def start_access_checks(integrations, user):
+    """
+    Check in the background (as a task) if the user has an account in each of the
+    integrations, see `get_checked_access` for the outcome. Integrations with a
+    recent result or a check that is still running are skipped.
+
+    :param integrations list: integrations with an `exists` part in their manifest
+    :param user User: the user to check
+    """
+    known = cache.get_many(
+        [get_access_cache_key(integration.id, user.id) for integration in integrations]
+        + [
+            get_access_check_cache_key(integration.id, user.id)
+            for integration in integrations
+        ]
+    )
+    to_check = [
+        integration
+        for integration in integrations
+        if get_access_cache_key(integration.id, user.id) not in known
+        and known.get(get_access_check_cache_key(integration.id, user.id)) != CHECKING
+    ]
+    if not len(to_check):
+        return
+
+    # Checks that never finish (i.e. the task got lost) are started again after the
+    # timeout
+    cache.set_many(
+        {
+            get_access_check_cache_key(integration.id, user.id): CHECKING
+            for integration in to_check
+        },
+        settings.INTEGRATION_ACCESS_CHECK_TIMEOUT,
+    )
+    async_task(
+        "admin.integrations.tasks.check_access",
+        [integration.id for integration in to_check],
+        user.id,
+        task_name=f"Check access: {user.full_name}",
+    )
+
+
+def get_checked_access(integration, user):
+    """
+    Outcome of checking if the user has an account in the integration. Starts a
+    check in the background if there is nothing known yet.
+
+    :param integration Integration:
+    :param user User: the user to check
+    :return tuple: whether the check is done and the found user (`None` if the
+        check failed or isn't done)
+    """
+    for _attempt in range(2):
+        # The task stores the result before it clears the state, so read them the
+        # other way around
+        state = cache.get(get_access_check_cache_key(integration.id, user.id))
+        found_user = cache.get(get_access_cache_key(integration.id, user.id))
+        if found_user is not None:
+            return True, found_user
+        if state == CHECKING:
+            return False, None
+        if state == FAILED:
+            return True, None
+        start_access_checks([integration], user)
+    return False, None
+
+
+def finish_access_checks(integrations, user):
+    """
+    Run the checks that `start_access_checks` started and store their outcome
+
+    :param integrations list: integrations with an `exists` part in their manifest
+    :param user User: the user to check
+    """
+    for integration, found_user in iter_access(integrations, user):
+        key = get_access_check_cache_key(integration.id, user.id)
+        if found_user is None:
+            cache.set(key, FAILED, settings.INTEGRATION_ACCESS_CHECK_TIMEOUT)
+        else:
+            cache.delete(key)
@@ -0,0 +1,206 @@
+import json
+import re
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from django.conf import settings
+
+# Fields of a manifest step that get rendered with the params of the integration
+TEMPLATED_FIELDS = ["url", "data", "headers", "expected", "continue_if"]
+
+RESPONSE_REFERENCE = re.compile(r"\bresponses\b(\.\d+)?")
+
+
+def get_step_dependencies(steps, default_headers=None):
+    """
+    Build the dependency graph of manifest steps. A step depends on an earlier step
+    if it uses its response (`responses.0`), data it stored (`store_data`) or a
+    file it saved (`save_as_file`), or if it's listed in its `depends_on`. Steps
+    that poll or have a condition (`continue_if`) wait for all steps before them
+    and block all steps after them, just like they do when they run one by one.
+
+    :param steps list: steps of the manifest
+    :param default_headers dict: headers that are used if a step has none
+    :return list: for every step, a set with the indexes of the steps it depends on
+    """
+    dependencies = []
+    for idx, step in enumerate(steps):
+        templated = {field: step.get(field) for field in TEMPLATED_FIELDS}
+        if not templated["headers"]:
+            templated["headers"] = default_headers or {}
+        text = json.dumps(templated)
+
+        depends_on = {
+            earlier_idx
+            for earlier_idx in step.get("depends_on", [])
+            if earlier_idx < idx
+        }
+        if step.get("polling") or step.get("continue_if"):
+            depends_on |= set(range(idx))
+
+        for match in RESPONSE_REFERENCE.finditer(text):
+            if match.group(1) is None:
+                # Uses all responses (or one we can't figure out)
+                depends_on |= set(range(idx))
+            elif int(match.group(1)[1:]) < idx:
+                depends_on.add(int(match.group(1)[1:]))
+
+        for earlier_idx, earlier_step in enumerate(steps[:idx]):
+            if earlier_step.get("polling") or earlier_step.get("continue_if"):
+                depends_on.add(earlier_idx)
+            if any(
+                re.search(rf"\b{re.escape(name)}\b", text)
+                for name in earlier_step.get("store_data", {}).keys()
+            ):
+                depends_on.add(earlier_idx)
+            if earlier_step.get("save_as_file") in step.get("files", {}).values():
+                depends_on.add(earlier_idx)
+
+        dependencies.append(depends_on)
+    return dependencies
+
+
+def get_step_waves(steps, default_headers=None):
+    """
+    Group manifest steps in waves. All steps of a wave only depend on steps of
+    earlier waves, so they can be sent at the same time.
+
+    :param steps list: steps of the manifest
+    :param default_headers dict: headers that are used if a step has none
+    :return list: list of lists with the indexes of the steps
+    """
+    levels = []
+    for depends_on in get_step_dependencies(steps, default_headers):
+        levels.append(max((levels[idx] + 1 for idx in depends_on), default=0))
+
+    waves = [[] for _level in range(max(levels, default=-1) + 1)]
+    for idx, level in enumerate(levels):
+        waves[level].append(idx)
+    return waves
+
+
+def run_steps(integration, steps):
+    """
+    Run the steps of an integration one request at a time.
+
+    Steps are generators that yield lists of manifest items. They get the results
+    of the requests (`(success, response)` for every item) sent back and return the
+    outcome.
+
+    :param integration Integration: integration that sends the requests
+    :param steps generator: steps of the integration
+    :return: whatever the steps return
+    """
+    try:
+        items = next(steps)
+        while True:
+            items = steps.send([integration.run_request(item) for item in items])
+    except StopIteration as e:
+        return e.value
+
+
+def _advance(steps, results=None, error=None):
+    # Returns whether the steps are done and their outcome or the next items
+    try:
+        if error is not None:
+            return False, steps.throw(error)
+        if results is None:
+            return False, next(steps)
+        return False, steps.send(results)
+    except StopIteration as e:
+        return True, e.value
+
+
+def iter_concurrently(jobs):
+    """
+    Run the steps of one or more integrations at the same time and yield the outcome
+    of every job as soon as it's done. All items that are waiting get sent
+    concurrently; rendering the requests and logging the results (everything that
+    needs the database) happens in this thread.
+
+    An error while rendering, sending or logging the requests of a job is raised in
+    the steps of that job, so they can handle it without affecting the other jobs.
+    Errors the steps don't handle stop all jobs.
+
+    :param jobs list: list of `(integration, steps)` tuples, see `run_steps`
+    :return generator: `(index of the job, outcome)` tuples, in the order in which
+        the jobs finish
+    """
+    with ThreadPoolExecutor(
+        max_workers=settings.INTEGRATION_MAX_CONCURRENT_REQUESTS
+    ) as executor:
+        # {index of the job: (items, prepared requests, futures)}
+        running = {}
+        # Jobs that can take their next step: (index of the job, results, error)
+        advancing = deque((idx, None, None) for idx in range(len(jobs)))
+
+        while len(advancing) or len(running):
+            while len(advancing):
+                idx, results, error = advancing.popleft()
+                integration, steps = jobs[idx]
+                done, items = _advance(steps, results, error)
+                if done:
+                    yield idx, items
+                    continue
+
+                try:
+                    requests = [integration._prepare_request(item) for item in items]
+                except Exception as e:
+                    advancing.append((idx, None, e))
+                    continue
+                running[idx] = (
+                    items,
+                    requests,
+                    [
+                        None
+                        if request["error"]
+                        else executor.submit(integration._send_request, request)
+                        for request in requests
+                    ],
+                )
+
+            if not len(running):
+                break
+
+            wait(
+                [
+                    future
+                    for _items, _requests, futures in running.values()
+                    for future in futures
+                    if future is not None
+                ],
+                return_when=FIRST_COMPLETED,
+            )
+            for idx, (items, requests, futures) in list(running.items()):
+                if not all(future is None or future.done() for future in futures):
+                    continue
+
+                del running[idx]
+                integration = jobs[idx][0]
+                try:
+                    results = [
+                        (False, request["error"])
+                        if future is None
+                        else integration._finish_request(
+                            item, request, *future.result()
+                        )
+                        for item, request, future in zip(items, requests, futures)
+                    ]
+                except Exception as e:
+                    advancing.append((idx, None, e))
+                else:
+                    advancing.append((idx, results, None))
+
+
+def run_concurrently(jobs):
+    """
+    Run the steps of one or more integrations at the same time, see
+    `iter_concurrently`.
+
+    :param jobs list: list of `(integration, steps)` tuples, see `run_steps`
+    :return list: the outcome of every job
+    """
+    outcomes = [None] * len(jobs)
+    for idx, outcome in iter_concurrently(jobs):
+        outcomes[idx] = outcome
+    return outcomes
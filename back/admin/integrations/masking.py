@@ -0,0 +1,33 @@
+import re
+
+
+def compile_secrets(secrets):
+    """
+    Build one pattern that matches all secrets. Longer secrets go first, so a
+    secret that contains another one gets masked as a whole.
+
+    :param secrets tuple: secret values
+    :return re.Pattern: `None` if there is nothing to mask
+    """
+    if not len(secrets):
+        return None
+    return re.compile(
+        "|".join(re.escape(secret) for secret in sorted(secrets, key=len, reverse=True))
+    )
+
+
+def mask_secrets(text, replacements, pattern=None):
+    """
+    Replace all secrets in the text in one pass
+
+    :param text str: text that could contain secrets
+    :param replacements dict: {secret value: text to show instead}
+    :param pattern re.Pattern: result of `compile_secrets` for these replacements,
+        compiled on the spot if not given
+    :return str:
+    """
+    if pattern is None:
+        pattern = compile_secrets(tuple(replacements.keys()))
+    if pattern is None:
+        return text
+    return pattern.sub(lambda match: replacements[match.group(0)], text)
@@ -0,0 +1,22 @@
+# Generated by Django 5.2.7 on 2026-10-18 18:37
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("integrations", "0026_alter_integration_integration"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="integrationtrackerstep",
+            name="connect_duration",
+            field=models.PositiveIntegerField(null=True),
+        ),
+        migrations.AddField(
+            model_name="integrationtrackerstep",
+            name="duration",
+            field=models.PositiveIntegerField(null=True),
+        ),
+    ]
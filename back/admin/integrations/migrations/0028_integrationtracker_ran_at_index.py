@@ -0,0 +1,17 @@
+# Generated by Django 5.2.7 on 2026-10-18 19:08
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("integrations", "0027_integrationtrackerstep_duration"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="integrationtracker",
+            name="ran_at",
+            field=models.DateTimeField(auto_now_add=True, db_index=True),
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.2.7 on 2026-10-18 19:08
+
+from django.db import migrations
+
+
+def add_schedule(apps, schema_editor):
+    from django_q.models import Schedule
+
+    Schedule.objects.get_or_create(
+        func="admin.integrations.tasks.prune_trackers",
+        defaults={
+            "name": "Prune integration trackers",
+            "schedule_type": Schedule.CRON,
+            "cron": "30 3 * * *",
+        },
+    )
+
+
+def remove_schedule(apps, schema_editor):
+    from django_q.models import Schedule
+
+    Schedule.objects.filter(func="admin.integrations.tasks.prune_trackers").delete()
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("integrations", "0028_integrationtracker_ran_at_index"),
+        ("django_q", "0018_task_success_index"),
+    ]
+
+    operations = [
+        migrations.RunPython(add_schedule, remove_schedule),
+    ]
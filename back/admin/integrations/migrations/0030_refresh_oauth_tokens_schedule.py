@@ -0,0 +1,34 @@
+# Generated by Django 5.2.7 on 2026-10-18 20:15
+
+from django.db import migrations
+
+
+def add_schedule(apps, schema_editor):
+    from django_q.models import Schedule
+
+    Schedule.objects.get_or_create(
+        func="admin.integrations.tasks.refresh_oauth_tokens",
+        defaults={
+            "name": "Refresh OAuth tokens of integrations",
+            "schedule_type": Schedule.CRON,
+            "cron": "*/5 * * * *",
+        },
+    )
+
+
+def remove_schedule(apps, schema_editor):
+    from django_q.models import Schedule
+
+    Schedule.objects.filter(
+        func="admin.integrations.tasks.refresh_oauth_tokens"
+    ).delete()
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("integrations", "0029_prune_trackers_schedule"),
+    ]
+
+    operations = [
+        migrations.RunPython(add_schedule, remove_schedule),
+    ]
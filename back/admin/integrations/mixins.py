@@ -1,6 +1,8 @@
 import logging
+from concurrent.futures import ThreadPoolExecutor
 from json.decoder import JSONDecodeError
 
+from django.utils.functional import cached_property
 from django.utils.translation import gettext_lazy as _
 
 from admin.integrations.exceptions import (
@@ -8,7 +10,11 @@ from admin.integrations.exceptions import (
     FailedPaginatedResponseError,
     KeyIsNotInDataError,
 )
-from admin.integrations.utils import get_value_from_notation
+from admin.integrations.utils import (
+    compile_notation,
+    get_value_from_notation,
+    get_value_from_path,
+)
 
 logger = logging.getLogger(__name__)
 
@@ -23,6 +29,14 @@ class PaginatedResponse:
     def __init__(self, integration):
         self.integration = integration
 
+    @cached_property
+    def data_structure(self):
+        # Parse the notations once, they get used for every user of every page
+        return [
+            (prop, notation, compile_notation(notation))
+            for prop, notation in self.integration.manifest["data_structure"].items()
+        ]
+
     def extract_data_from_list_response(self, response):
         # Building list of users from response. Dig into response to get to the users.
         data_from = self.integration.manifest["data_from"]
@@ -47,13 +61,12 @@ class PaginatedResponse:
                 }
             )
 
-        data_structure = self.integration.manifest["data_structure"]
         user_details = []
         for user_data in users:
             user = {}
-            for prop, notation in data_structure.items():
+            for prop, notation, path in self.data_structure:
                 try:
-                    user[prop] = get_value_from_notation(notation, user_data)
+                    user[prop] = get_value_from_path(path, user_data)
                 except KeyError:
                     # This is unlikely to go wrong - only when api changes or when
                     # configs are being setup
@@ -102,42 +115,74 @@ class PaginatedResponse:
         self.integration.params["NEXT_PAGE_TOKEN"] = token
         return self.integration._replace_vars(next_page)
 
-    def get_data_from_paginated_response(self):
+    def _request_page(self, executor, url):
+        # Start fetching a page in the background. Only sending the request happens
+        # in the other thread, everything that needs the database stays in this one
+        data = {"method": "GET", "url": url}
+        request = self.integration._prepare_request(data)
+        future = None
+        if not request["error"]:
+            future = executor.submit(self.integration._send_request, request)
+        return data, request, future
+
+    def _get_page(self, data, request, future):
+        if future is None:
+            success, response = False, request["error"]
+        else:
+            success, response = self.integration._finish_request(
+                data, request, *future.result()
+            )
+
+        if not success:
+            raise FailedPaginatedResponseError(
+                _("Paginated URL fetch: %(response)s")
+                % {"response": self.integration.clean_response(response)}
+            )
+        return response
+
+    def iter_pages(self):
+        """
+        Fetch the pages one by one and yield the users of every page. While the
+        users of a page are being processed, the next page is already being fetched.
+
+        :return generator: a list of users (dicts) per page
+        """
         success, response = self.integration.execute()
         if not success:
             raise FailedPaginatedResponseError(
                 self.integration.clean_response(response)
             )
 
-        users = self.extract_data_from_list_response(response)
-
+        data_from = self.integration.manifest["data_from"]
         amount_pages_to_fetch = self.integration.manifest.get(
             "amount_pages_to_fetch", 5
         )
         fetched_pages = 1
-        while amount_pages_to_fetch != fetched_pages:
-            # End everything if next page does not exist
-            next_page_url = self.get_next_page(response)
-            if next_page_url is None:
-                break
-
-            success, response = self.integration.run_request(
-                {"method": "GET", "url": next_page_url}
-            )
-            if not success:
-                raise FailedPaginatedResponseError(
-                    _("Paginated URL fetch: %(response)s")
-                    % {"response": self.integration.clean_response(response)}
-                )
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            while True:
+                users = self.extract_data_from_list_response(response)
 
-            # Check if there are any new results. Google could send no users back
-            try:
-                data_from = self.integration.manifest["data_from"]
-                get_value_from_notation(data_from, response.json())
-            except KeyIsNotInDataError:
-                break
+                next_page = None
+                if amount_pages_to_fetch != fetched_pages:
+                    next_page_url = self.get_next_page(response)
+                    if next_page_url is not None:
+                        next_page = self._request_page(executor, next_page_url)
+
+                yield users
 
-            users += self.extract_data_from_list_response(response)
-            fetched_pages += 1
+                # End everything if next page does not exist
+                if next_page is None:
+                    return
 
-        return users
+                response = self._get_page(*next_page)
+                fetched_pages += 1
+
+                # Check if there are any new results. Google could send no users
+                # back
+                try:
+                    get_value_from_notation(data_from, response.json())
+                except KeyError:
+                    return
+
+    def get_data_from_paginated_response(self):
+        return [user for users in self.iter_pages() for user in users]
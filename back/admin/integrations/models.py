@@ -1,22 +1,25 @@
 import base64
 import io
 import json
+import random
 import time
 import uuid
 from datetime import timedelta
 from json.decoder import JSONDecodeError as NativeJSONDecodeError
 
-import requests
 from django.conf import settings
+from django.contrib.auth import get_user_model
 from django.core.exceptions import ValidationError
-from django.db import models
-from django.db.models.signals import post_delete
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import models, transaction
+from django.db.models.signals import post_delete, post_save
 from django.dispatch import receiver
-from django.template import Context, Template
+from django.template import Context
 from django.template.loader import render_to_string
 from django.urls import reverse, reverse_lazy
 from django.utils import timezone
 from django.utils.crypto import get_random_string
+from django.utils.functional import cached_property
 from django.utils.translation import gettext_lazy as _
 from django_q.models import Schedule
 from django_q.tasks import schedule
@@ -35,15 +38,69 @@ from requests.exceptions import (
 )
 from twilio.rest import Client
 
+from admin.integrations.access import clear_cached_access
+from admin.integrations.executor import (
+    get_step_waves,
+    run_concurrently,
+    run_steps,
+)
+from admin.integrations.masking import compile_secrets, mask_secrets
 from admin.integrations.serializers import (
     SyncUsersManifestSerializer,
     WebhookManifestSerializer,
 )
+from admin.integrations.sessions import (
+    RequestTiming,
+    integration_sessions,
+    send_request,
+)
 from admin.integrations.utils import get_value_from_notation
 from misc.fernet_fields import EncryptedTextField
 from misc.fields import EncryptedJSONField
+from misc.template_cache import get_template
 from organization.models import Notification
 from organization.utils import has_manager_or_buddy_tags, send_email_with_notification
+from slack_bot.client import reset_client as reset_slack_client
+
+
+class IntegrationTrackerManager(models.Manager):
+    def _delete_in_batches(self, queryset, batch_size=1000):
+        while len(ids := list(queryset.values_list("id", flat=True)[:batch_size])):
+            IntegrationTrackerStep.objects.filter(tracker_id__in=ids).delete()
+            self.get_queryset().filter(id__in=ids).delete()
+
+    def prune(self):
+        """
+        Remove trackers (and their steps) that are older than the retention period
+        and the oldest ones of integrations that have more than the max amount.
+        """
+        if settings.INTEGRATION_TRACKER_RETENTION_DAYS > 0:
+            self._delete_in_batches(
+                self.get_queryset().filter(
+                    ran_at__lt=timezone.now()
+                    - timedelta(days=settings.INTEGRATION_TRACKER_RETENTION_DAYS)
+                )
+            )
+
+        max_amount = settings.INTEGRATION_TRACKER_MAX_PER_INTEGRATION
+        if max_amount <= 0:
+            return
+
+        for integration_id in (
+            self.get_queryset()
+            .values("integration_id")
+            .annotate(amount=models.Count("id"))
+            .filter(amount__gt=max_amount)
+            .values_list("integration_id", flat=True)
+        ):
+            trackers = self.get_queryset().filter(integration_id=integration_id)
+            if integration_id is None:
+                trackers = self.get_queryset().filter(integration__isnull=True)
+            # Ids go up with `ran_at`, keep everything from the last one we keep
+            oldest_to_keep = trackers.order_by("-id").values_list("id", flat=True)[
+                max_amount - 1
+            ]
+            self._delete_in_batches(trackers.filter(id__lt=oldest_to_keep))
 
 
 class IntegrationTracker(models.Model):
@@ -59,7 +116,9 @@ class IntegrationTracker(models.Model):
     )
     category = models.IntegerField(choices=Category.choices)
     for_user = models.ForeignKey("users.User", on_delete=models.CASCADE, null=True)
-    ran_at = models.DateTimeField(auto_now_add=True)
+    ran_at = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    objects = IntegrationTrackerManager()
 
     @property
     def ran_execute_block(self):
@@ -74,6 +133,53 @@ class IntegrationTracker(models.Model):
         return self.category == IntegrationTracker.Category.REVOKE
 
 
+def truncate_payload(value):
+    """
+    Cut payloads that are too big to keep. Text gets cut off, JSON gets stored as
+    the start of its text.
+
+    :param value: text or JSON
+    :return: the value, or the truncated text
+    """
+    max_length = settings.INTEGRATION_TRACKER_MAX_PAYLOAD
+    text = value if isinstance(value, str) else json.dumps(value)
+    if max_length <= 0 or len(text) <= max_length:
+        return value
+    return _("%(text)s... (truncated, %(length)s characters in total)") % {
+        "text": text[:max_length],
+        "length": len(text),
+    }
+
+
+class IntegrationTrackerStepManager(models.Manager):
+    def track(self, **kwargs):
+        """
+        Store a step, depending on the tracking mode. Failed steps (including the
+        ones that didn't get the expected value) are always stored, successful ones
+        only in the "all" mode or when they are sampled. Large payloads get
+        truncated.
+
+        :return IntegrationTrackerStep: the step, only saved when it's kept. Its
+            `found_expected` is based on the full response
+        """
+        step = self.model(**kwargs)
+        failed = step.error != "" or not step.has_succeeded or not step.found_expected
+        mode = settings.INTEGRATION_TRACKER_MODE
+        if not failed and (
+            mode == "errors"
+            or (
+                mode == "sampled"
+                and random.random() >= settings.INTEGRATION_TRACKER_SAMPLE_RATE
+            )
+        ):
+            return step
+
+        for field in ["json_response", "text_response", "post_data", "headers"]:
+            setattr(step, field, truncate_payload(getattr(step, field)))
+        step.save(force_insert=True)
+        return step
+
+
 class IntegrationTrackerStep(models.Model):
     tracker = models.ForeignKey(
         "integrations.IntegrationTracker",
@@ -89,12 +195,17 @@ class IntegrationTrackerStep(models.Model):
     headers = models.JSONField()
     expected = models.TextField()
     error = models.TextField()
+    # In milliseconds, empty if the request was never sent
+    duration = models.PositiveIntegerField(null=True)
+    connect_duration = models.PositiveIntegerField(null=True)
+
+    objects = IntegrationTrackerStepManager()
 
     @property
     def has_succeeded(self):
         return self.status_code >= 200 and self.status_code < 300
 
-    @property
+    @cached_property
     def found_expected(self):
         if self.expected == "":
             return True
@@ -105,17 +216,21 @@ class IntegrationTrackerStep(models.Model):
             return self.expected in json.dumps(self.json_response)
         return False
 
+    def _pretty(self, value):
+        # Truncated payloads are stored as text
+        return value if isinstance(value, str) else json.dumps(value, indent=4)
+
     @property
     def pretty_json_response(self):
-        return json.dumps(self.json_response, indent=4)
+        return self._pretty(self.json_response)
 
     @property
     def pretty_headers(self):
-        return json.dumps(self.headers, indent=4)
+        return self._pretty(self.headers)
 
     @property
     def pretty_post_data(self):
-        return json.dumps(self.post_data, indent=4)
+        return self._pretty(self.post_data)
 
 
 class IntegrationManager(models.Manager):
@@ -316,6 +431,20 @@ class Integration(models.Model):
         return value
 
     def run_request(self, data):
+        request = self._prepare_request(data)
+        if request["error"]:
+            return False, request["error"]
+
+        response, error, timing = self._send_request(request)
+        return self._finish_request(data, request, response, error, timing)
+
+    def _prepare_request(self, data):
+        """
+        Render everything that is needed to send the request of a manifest step
+
+        :param data dict: step from the manifest
+        :return dict: request details, `error` is filled if it can't be sent
+        """
         url = self._replace_vars(data["url"])
         if "data" in data:
             post_data = self._replace_vars(json.dumps(data["data"]))
@@ -323,43 +452,65 @@ class Integration(models.Model):
             post_data = {}
         if data.get("cast_data_to_json", True):
             post_data = self.cast_to_json(post_data)
+        headers = self.headers(data.get("headers", {}))
 
-        error = ""
+        request = {
+            "method": data.get("method", "POST"),
+            "url": url,
+            "headers": headers,
+            "post_data": post_data,
+            "files": {},
+            "error": "",
+        }
 
         # extract files from locally saved files and send them with the request
-        files_to_send = {}
         for field_name, file_name in data.get("files", {}).items():
             try:
-                files_to_send[field_name] = (file_name, self.params["files"][file_name])
+                request["files"][field_name] = (
+                    file_name,
+                    self.params["files"][file_name],
+                )
             except KeyError:
                 error = f"{file_name} could not be found in the locally saved files"
                 if hasattr(self, "tracker"):
-                    IntegrationTrackerStep.objects.create(
+                    IntegrationTrackerStep.objects.track(
                         status_code=0,
                         tracker=self.tracker,
                         json_response={},
                         text_response=error,
                         url=self.clean_response(url),
-                        method=data.get("method", "POST"),
+                        method=request["method"],
                         post_data=json.loads(
                             self.clean_response(self.cast_to_json(post_data))
                         ),
-                        headers=json.loads(
-                            self.clean_response(self.headers(data.get("headers", {})))
-                        ),
+                        headers=json.loads(self.clean_response(headers)),
                         error=error,
                     )
-                return False, error
+                request["error"] = error
+                return request
 
+        return request
+
+    def _send_request(self, request):
+        """
+        Send a prepared request. Doesn't touch the database, so requests can be sent
+        from other threads.
+
+        :param request dict: prepared request (see `_prepare_request`)
+        :return tuple: response (or `None`), error and timing
+        """
+        error = ""
         response = None
+        timing = RequestTiming()
         try:
-            response = requests.request(
-                data.get("method", "POST"),
-                url,
-                headers=self.headers(data.get("headers", {})),
-                data=post_data,
-                files=files_to_send,
-                timeout=120,
+            response = send_request(
+                self.pk,
+                request["method"],
+                request["url"],
+                timing,
+                headers=request["headers"],
+                data=request["post_data"],
+                files=request["files"],
             )
         except (InvalidJSONError, JSONDecodeError):
             error = "JSON is invalid"
@@ -385,6 +536,14 @@ class Integration(models.Model):
         except:  # noqa E722
             error = "There was an unexpected error with the request"
 
+        return response, error, timing
+
+    def _finish_request(self, data, request, response, error, timing):
+        """
+        Check and log the response of a manifest step
+
+        :return tuple: success and the response (or error)
+        """
         if response is not None and error == "":
             if len(data.get("status_code", [])) and str(
                 response.status_code
@@ -408,6 +567,7 @@ class Integration(models.Model):
             except (NativeJSONDecodeError, TypeError):
                 json_payload = self.clean_response(json_response)
 
+            post_data = request["post_data"]
             try:
                 json_post_payload = json.loads(
                     self.clean_response(self.cast_to_json(post_data))
@@ -417,14 +577,14 @@ class Integration(models.Model):
 
             try:
                 json_headers_payload = json.loads(
-                    self.clean_response(self.headers(data.get("headers", {})))
+                    self.clean_response(request["headers"])
                 )
             except (NativeJSONDecodeError, TypeError):
-                json_headers_payload = self.clean_response(
-                    self.headers(data.get("headers", {}))
-                )
+                json_headers_payload = self.clean_response(request["headers"])
 
-            IntegrationTrackerStep.objects.create(
+            # Whether the expected value was found is read from this step, it might
+            # not get stored
+            self.last_step = IntegrationTrackerStep.objects.track(
                 status_code=0 if response is None else response.status_code,
                 tracker=self.tracker,
                 json_response=json_payload,
@@ -433,12 +593,14 @@ class Integration(models.Model):
                     if data.get("save_as_file", False)
                     else self.clean_response(text_response)
                 ),
-                url=self.clean_response(url),
-                method=data.get("method", "POST"),
+                url=self.clean_response(request["url"]),
+                method=request["method"],
                 post_data=json_post_payload,
                 headers=json_headers_payload,
                 expected=self._replace_vars(data.get("expected", "")),
                 error=self.clean_response(error),
+                duration=timing.total,
+                connect_duration=timing.connect,
             )
 
         if error:
@@ -455,7 +617,7 @@ class Integration(models.Model):
         if hasattr(self, "new_hire") and self.new_hire is not None:
             text = self.new_hire.personalize(text, self.extra_args | params)
             return text
-        t = Template(text)
+        t = get_template(text)
         context = Context(self.extra_args | params)
         text = t.render(context)
         return text
@@ -478,9 +640,12 @@ class Integration(models.Model):
             # If Basic authentication then swap to base64
             if key == "Authorization" and value.startswith("Basic"):
                 auth_details = self._replace_vars(value.split(" ", 1)[1])
-                value = "Basic " + base64.b64encode(
-                    auth_details.encode("ascii")
-                ).decode("ascii")
+                encoded = base64.b64encode(auth_details.encode("ascii")).decode("ascii")
+                # Keep the encoded credentials, so they get masked too
+                if not hasattr(self, "encoded_secrets"):
+                    self.encoded_secrets = set()
+                self.encoded_secrets.add(encoded)
+                value = "Basic " + encoded
 
             # Adding an empty string to force to return a string instead of a
             # safestring. Ref: https://github.com/psf/requests/issues/6159
@@ -488,6 +653,13 @@ class Integration(models.Model):
         return new_headers
 
     def user_exists(self, new_hire, save_result=True):
+        return run_steps(self, self.user_exists_steps(new_hire, save_result))
+
+    def user_exists_steps(self, new_hire, save_result=True):
+        """
+        Steps (see `executor.run_steps`) to check if the user exists in the third
+        party app
+        """
         from users.models import IntegrationUser
 
         if not len(self.manifest.get("exists", [])):
@@ -517,12 +689,12 @@ class Integration(models.Model):
         if not self.renew_key():
             return
 
-        success, response = self.run_request(self.manifest["exists"])
+        [(success, response)] = yield [self.manifest["exists"]]
 
         if not success:
             return None
 
-        user_exists = self.tracker.steps.last().found_expected
+        user_exists = self.last_step.found_expected
 
         if save_result:
             IntegrationUser.objects.update_or_create(
@@ -548,6 +720,23 @@ class Integration(models.Model):
         return len(form) > 0 or needs_more_info
 
     def revoke_user(self, user):
+        return run_steps(
+            self, self._clearing_access(user, self.revoke_user_steps(user))
+        )
+
+    def _clearing_access(self, user, steps):
+        # Steps that change the access of the user, forget the cached access
+        # afterwards (even if they fail halfway)
+        try:
+            return (yield from steps)
+        finally:
+            if user is not None and self.pk is not None:
+                clear_cached_access(self, user)
+
+    def revoke_user_steps(self, user):
+        """
+        Steps (see `executor.run_steps`) to revoke the access of the user
+        """
         if self.skip_user_provisioning:
             # should never be triggered
             return False, "Cannot revoke manual integration"
@@ -570,43 +759,96 @@ class Integration(models.Model):
         )
 
         for item in revoke_manifest:
-            success, response = self.run_request(item)
+            [(success, response)] = yield [item]
 
-            if not success or not self.tracker.steps.last().found_expected:
+            if not success or not self.last_step.found_expected:
                 return False, self.clean_response(response)
 
         return True, ""
 
-    def renew_key(self):
-        # Oauth2 refreshing access token if needed
-        success = True
-        if (
+    def revoke_existing_user_steps(self, user):
+        """
+        Steps (see `executor.run_steps`) to revoke the access of the user, only if
+        the user exists in the third party app
+        """
+        if (yield from self.user_exists_steps(user)):
+            return (
+                yield from self._clearing_access(user, self.revoke_user_steps(user))
+            )
+        return None
+
+    def token_expires_within(self, seconds):
+        """
+        Check if the OAuth token expires (or has expired) within this amount of
+        seconds. Always `False` for integrations without an expiring token.
+
+        :param seconds int:
+        :return bool:
+        """
+        return bool(
             self.has_oauth
             and "expires_in" in self.extra_args.get("oauth", {})
-            and self.expiring < timezone.now()
-        ):
-            success, response = self.run_request(self.manifest["oauth"]["refresh"])
-
-            if not success:
-                user = self.new_hire if self.has_user_context else None
-                Notification.objects.create(
-                    notification_type=Notification.Type.FAILED_INTEGRATION,
-                    extra_text=self.name,
-                    created_for=user,
-                    description="Refresh url: " + str(response),
-                )
-                return success
+            and self.expiring < timezone.now() + timedelta(seconds=seconds)
+        )
 
-            self.extra_args["oauth"] |= response.json()
-            if "expires_in" in response.json():
-                self.expiring = timezone.now() + timedelta(
-                    seconds=response.json()["expires_in"]
-                )
-            self.save(update_fields=["expiring", "extra_args"])
-            if hasattr(self, "tracker"):
-                # we need to clean the last step as we now probably got new secret keys
-                # that need to be masked
-                last_step = self.tracker.steps.last()
+    def renew_key(self):
+        # Oauth2 refreshing access token if needed. Tokens are normally refreshed
+        # ahead of time by `tasks.refresh_oauth_tokens`, this is the fallback for
+        # tokens that are about to expire anyway
+        if not self.token_expires_within(settings.INTEGRATION_TOKEN_REFRESH_MARGIN):
+            return True
+        return self.refresh_oauth_token(settings.INTEGRATION_TOKEN_REFRESH_MARGIN)
+
+    def refresh_oauth_token(self, seconds):
+        """
+        Refresh the OAuth token if it expires within this amount of seconds. The
+        integration gets locked while refreshing, so only one worker refreshes the
+        token. Others wait for it and use the new token.
+
+        :param seconds int: refresh if the token expires within this time
+        :return bool: whether a valid token is available
+        """
+        if self.pk is None:
+            return self._refresh_oauth_token()
+
+        with transaction.atomic():
+            locked = Integration.objects.select_for_update().get(pk=self.pk)
+            # Continue with the latest token (and refresh token), another worker
+            # might have refreshed it already
+            self.extra_args["oauth"] = locked.extra_args.get("oauth", {})
+            self.expiring = locked.expiring
+            if not self.token_expires_within(seconds):
+                return True
+            return self._refresh_oauth_token(locked)
+
+    def _refresh_oauth_token(self, locked=None):
+        success, response = self.run_request(self.manifest["oauth"]["refresh"])
+
+        if not success:
+            user = self.new_hire if getattr(self, "has_user_context", False) else None
+            Notification.objects.create(
+                notification_type=Notification.Type.FAILED_INTEGRATION,
+                extra_text=self.name,
+                created_for=user,
+                description="Refresh url: " + str(response),
+            )
+            return success
+
+        self.extra_args["oauth"] |= response.json()
+        if "expires_in" in response.json():
+            self.expiring = timezone.now() + timedelta(
+                seconds=response.json()["expires_in"]
+            )
+        if locked is not None:
+            # Only store the token, keep everything else as it is in the database
+            locked.extra_args["oauth"] = self.extra_args["oauth"]
+            locked.expiring = self.expiring
+            locked.save(update_fields=["expiring", "extra_args"])
+        if hasattr(self, "tracker"):
+            # we need to clean the last step as we now probably got new secret keys
+            # that need to be masked
+            last_step = getattr(self, "last_step", None)
+            if last_step is not None and last_step.pk is not None:
                 last_step.json_response = self.clean_response(last_step.json_response)
                 last_step.save()
 
@@ -646,19 +888,143 @@ class Integration(models.Model):
         # if exceeding the max amounts, then fail
         return False, response
 
-    def execute(self, new_hire=None, params=None, retry_on_failure=False):
-        self.params = params or {}
-        self.params["responses"] = []
-        self.params["files"] = {}
-        self.new_hire = new_hire
-        self.has_user_context = new_hire is not None
+    def execute(
+        self, new_hire=None, params=None, retry_on_failure=False, defer_polling=False
+    ):
+        """
+        Run the execute part of the manifest
+
+        :param defer_polling bool: poll in scheduled tasks instead of waiting for
+            the result. Returns `(None, None)` if the outcome is not known yet.
+        :return tuple: success and the response (or error)
+        """
+        return self._run_execute_steps(
+            self._clearing_access(
+                new_hire,
+                self.execute_steps(new_hire, params, retry_on_failure, defer_polling),
+            )
+        )
 
-        self.tracker = IntegrationTracker.objects.create(
-            category=IntegrationTracker.Category.EXECUTE,
-            integration=self if self.pk is not None else None,
-            for_user=self.new_hire,
+    def resume_execute(self, state):
+        """
+        Continue the execute part with the next polling attempt
+
+        :param state str: encrypted state of the integration, see `_schedule_polling`
+        :return tuple: success and the response (or error)
+        """
+        state = json.loads(self._fernet.decrypt(state.encode()))
+        new_hire = get_user_model().objects.get(id=state["new_hire_id"])
+        return self._run_execute_steps(
+            self._clearing_access(
+                new_hire,
+                self.execute_steps(
+                    new_hire,
+                    state["params"],
+                    state["retry_on_failure"],
+                    defer_polling=True,
+                    resume=state,
+                ),
+            )
         )
 
+    def _run_execute_steps(self, steps):
+        if settings.INTEGRATION_EXECUTE_MODE != "concurrent":
+            return run_steps(self, steps)
+
+        [outcome] = run_concurrently([(self, steps)])
+        return outcome
+
+    def _get_execute_waves(self):
+        steps = self.manifest["execute"]
+        if settings.INTEGRATION_EXECUTE_MODE != "concurrent":
+            return [[idx] for idx in range(len(steps))]
+        return get_step_waves(steps, self.manifest.get("headers", {}))
+
+    @property
+    def _fernet(self):
+        # Encrypt the same way as the secrets of the integration
+        return Integration._meta.get_field("extra_args").fernet
+
+    def _schedule_polling(self, step, tried, retry_on_failure):
+        # All data that is needed to continue. Generated secrets are not saved on
+        # the integration, so they need to be kept as well.
+        state = {
+            "new_hire_id": self.new_hire.id,
+            "tracker_id": self.tracker.id,
+            "step": step,
+            "tried": tried,
+            "retry_on_failure": retry_on_failure,
+            "params": {
+                name: value for name, value in self.params.items() if name != "files"
+            },
+            "files": {
+                name: base64.b64encode(file.getvalue()).decode("ascii")
+                for name, file in self.params["files"].items()
+            },
+            "generated": {
+                item["id"]: self.extra_args[item["id"]]
+                for item in self.manifest.get("initial_data_form", [])
+                if item.get("name") == "generate"
+            },
+        }
+        interval = self.manifest["execute"][step]["polling"]["interval"]
+        schedule(
+            "admin.integrations.tasks.poll_integration",
+            self.id,
+            self._fernet.encrypt(
+                json.dumps(state, cls=DjangoJSONEncoder).encode()
+            ).decode(),
+            name=(
+                f"Polling integration {self.id} for new hire {self.new_hire.id} "
+                f"(attempt {tried})"
+            ),
+            next_run=timezone.now() + timedelta(seconds=interval),
+            schedule_type=Schedule.ONCE,
+        )
+
+    def execute_steps(
+        self,
+        new_hire=None,
+        params=None,
+        retry_on_failure=False,
+        defer_polling=False,
+        resume=None,
+    ):
+        """
+        Steps (see `executor.run_steps`) to run the execute part of the manifest
+
+        :param resume dict: state of an earlier run that is waiting for a polling
+            attempt, continues with that attempt
+        """
+        self.new_hire = new_hire
+        self.has_user_context = new_hire is not None
+        # Polling can only continue later on if we can find everything back
+        defer_polling = defer_polling and self.pk is not None and new_hire is not None
+
+        if resume is None:
+            self.params = params or {}
+            self.params["responses"] = []
+            self.params["files"] = {}
+            self.tracker = IntegrationTracker.objects.create(
+                category=IntegrationTracker.Category.EXECUTE,
+                integration=self if self.pk is not None else None,
+                for_user=self.new_hire,
+            )
+        else:
+            self.params = params
+            self.params["files"] = {
+                name: io.BytesIO(base64.b64decode(content))
+                for name, content in resume["files"].items()
+            }
+            self.extra_args |= resume["generated"]
+            self.tracker = IntegrationTracker.objects.filter(
+                id=resume["tracker_id"]
+            ).first() or IntegrationTracker.objects.create(
+                category=IntegrationTracker.Category.EXECUTE,
+                integration=self,
+                for_user=self.new_hire,
+            )
+
         if self.has_user_context:
             self.params |= new_hire.extra_fields
             self.new_hire = new_hire
@@ -667,92 +1033,117 @@ class Integration(models.Model):
         if not self.renew_key():
             return False, None
 
-        # Add generated secrets
-        for item in self.manifest.get("initial_data_form", []):
-            if "name" in item and item["name"] == "generate":
-                self.extra_args[item["id"]] = get_random_string(length=10)
-
-        response = None
-        # Run all requests
-        for item in self.manifest["execute"]:
-            success, response = self.run_request(item)
-
-            # check if we need to poll before continuing
-            if polling := item.get("polling", False):
-                success, response = self._polling(item, response)
+        if resume is None:
+            # Add generated secrets
+            for item in self.manifest.get("initial_data_form", []):
+                if "name" in item and item["name"] == "generate":
+                    self.extra_args[item["id"]] = get_random_string(length=10)
 
-            # check if we need to block this integration based on condition
-            if continue_if := item.get("continue_if", False):
-                got_expected_result = self._check_condition(response, continue_if)
-                if not got_expected_result:
-                    response = self.clean_response(response=response)
-                    Notification.objects.create(
-                        notification_type=Notification.Type.BLOCKED_INTEGRATION,
-                        extra_text=self.name,
-                        created_for=new_hire,
-                        description=f"Execute url ({item['url']}): {response}",
-                    )
-                    return False, response
+        steps = self.manifest["execute"]
+        start = 0 if resume is None else resume["step"]
+        waves = [wave for wave in self._get_execute_waves() if wave[0] >= start]
 
-            # No need to retry or log when we are importing users
-            if not success:
-                if self.has_user_context:
-                    response = self.clean_response(response=response)
-                    if polling:
-                        response = "Polling timed out: " + response
-                    Notification.objects.create(
-                        notification_type=Notification.Type.FAILED_INTEGRATION,
-                        extra_text=self.name,
-                        created_for=new_hire,
-                        description=f"Execute url ({item['url']}): {response}",
-                    )
-                if retry_on_failure:
-                    # Retry url in one hour
-                    schedule(
-                        "admin.integrations.tasks.retry_integration",
-                        new_hire.id,
-                        self.id,
-                        params,
-                        name=(
-                            f"Retrying integration {self.id} for new hire {new_hire.id}"
-                        ),
-                        next_run=timezone.now() + timedelta(hours=1),
-                        schedule_type=Schedule.ONCE,
-                    )
-                return False, response
-
-            # save if file, so we can reuse later
-            save_as_file = item.get("save_as_file")
-            if save_as_file is not None:
-                self.params["files"][save_as_file] = io.BytesIO(response.content)
-
-            # save json response temporarily to be reused in other parts
-            try:
-                self.params["responses"].append(response.json())
-            except:  # noqa E722
-                # if we save a file, then just append an empty dict
-                self.params["responses"].append({})
-
-            # store data coming back from response to the user, so we can reuse in other
-            # integrations
-            if store_data := item.get("store_data", {}):
-                for new_hire_prop, notation_for_response in store_data.items():
-                    try:
-                        value = get_value_from_notation(
-                            notation_for_response, response.json()
+        last_response = None
+        # Run all requests
+        for wave in waves:
+            results = yield [steps[idx] for idx in wave]
+            # Handle them in the same order as the manifest
+            for idx, (success, response) in zip(wave, results):
+                item = steps[idx]
+
+                # check if we need to poll before continuing
+                if (polling := item.get("polling", False)) and defer_polling:
+                    tried = resume["tried"] if resume and idx == start else 1
+                    success = self._check_condition(response, item["continue_if"])
+                    if not success and polling["amount"] > tried:
+                        # Try again later, without keeping the worker busy
+                        self._schedule_polling(idx, tried + 1, retry_on_failure)
+                        return None, None
+                elif polling:
+                    success, response = self._polling(item, response)
+
+                # check if we need to block this integration based on condition
+                if continue_if := item.get("continue_if", False):
+                    got_expected_result = self._check_condition(response, continue_if)
+                    if not got_expected_result:
+                        response = self.clean_response(response=response)
+                        Notification.objects.create(
+                            notification_type=Notification.Type.BLOCKED_INTEGRATION,
+                            extra_text=self.name,
+                            created_for=new_hire,
+                            description=f"Execute url ({item['url']}): {response}",
                         )
-                    except KeyError:
-                        return (
-                            False,
-                            f"Could not store data to new hire: {notation_for_response}"
-                            f" not found in {self.clean_response(response.json())}",
+                        return False, response
+
+                # No need to retry or log when we are importing users
+                if not success:
+                    if self.has_user_context:
+                        response = self.clean_response(response=response)
+                        if polling:
+                            response = "Polling timed out: " + response
+                        Notification.objects.create(
+                            notification_type=Notification.Type.FAILED_INTEGRATION,
+                            extra_text=self.name,
+                            created_for=new_hire,
+                            description=f"Execute url ({item['url']}): {response}",
                         )
+                    if retry_on_failure:
+                        # Retry url in one hour
+                        schedule(
+                            "admin.integrations.tasks.retry_integration",
+                            new_hire.id,
+                            self.id,
+                            params,
+                            name=(
+                                f"Retrying integration {self.id} for new hire "
+                                f"{new_hire.id}"
+                            ),
+                            next_run=timezone.now() + timedelta(hours=1),
+                            schedule_type=Schedule.ONCE,
+                        )
+                    return False, response
 
-                    # save to new hire and to temp var `params` on this model for use in
-                    # the same integration
-                    new_hire.extra_fields[new_hire_prop] = value
-                    self.params[new_hire_prop] = value
-                new_hire.save()
+                # save if file, so we can reuse later
+                save_as_file = item.get("save_as_file")
+                if save_as_file is not None:
+                    self.params["files"][save_as_file] = io.BytesIO(response.content)
+
+                # save json response temporarily to be reused in other parts. Keep
+                # the index of the step, steps might finish in a different order
+                responses = self.params["responses"]
+                responses.extend([{}] * (idx + 1 - len(responses)))
+                try:
+                    responses[idx] = response.json()
+                except:  # noqa E722
+                    # if we save a file, then just keep an empty dict
+                    responses[idx] = {}
+
+                # store data coming back from response to the user, so we can reuse in
+                # other integrations
+                if store_data := item.get("store_data", {}):
+                    for new_hire_prop, notation_for_response in store_data.items():
+                        try:
+                            value = get_value_from_notation(
+                                notation_for_response, response.json()
+                            )
+                        except KeyError:
+                            return (
+                                False,
+                                "Could not store data to new hire: "
+                                f"{notation_for_response} not found in "
+                                f"{self.clean_response(response.json())}",
+                            )
+
+                        # save to new hire and to temp var `params` on this model for
+                        # use in the same integration
+                        new_hire.extra_fields[new_hire_prop] = value
+                        self.params[new_hire_prop] = value
+                    new_hire.save()
+
+                if idx == len(steps) - 1:
+                    last_response = response
+
+        response = last_response
 
         # Run all post requests (notifications)
         for item in self.manifest.get("post_execute_notification", []):
@@ -806,35 +1197,61 @@ class Integration(models.Model):
 
         return IntegrationConfigForm(instance=self, data=data)
 
-    def clean_response(self, response) -> str:
-        if isinstance(response, dict):
-            try:
-                response = json.dumps(response)
-            except ValueError:
-                response = str(response)
+    def get_secret_replacements(self):
+        """
+        All secret values of this integration (including the values we got through
+        OAuth and the encoded Basic auth credentials) with the text that should be
+        shown instead of them.
 
+        :return dict: {secret value: replacement}
+        """
+        replacements = {}
         for name, value in self.extra_args.items():
             if isinstance(value, dict):
                 for inner_name, inner_value in value.items():
-                    response = response.replace(
+                    replacements.setdefault(
                         str(inner_value),
                         _("***Secret value for %(name)s***")
                         % {"name": name + "." + inner_name},
                     )
-            elif value != "":
-                response = response.replace(
+            else:
+                replacements.setdefault(
                     str(value), _("***Secret value for %(name)s***") % {"name": name}
                 )
 
-            if name == "Authorization" and value.startswith("Basic"):
-                response.replace(
-                    base64.b64encode(value.split(" ", 1)[1].encode("ascii")).decode(
-                        "ascii"
-                    ),
+            if (
+                name == "Authorization"
+                and isinstance(value, str)
+                and value.startswith("Basic ")
+            ):
+                replacements.setdefault(
+                    base64.b64encode(value.split(" ", 1)[1].encode()).decode("ascii"),
                     "BASE64 ENCODED SECRET",
                 )
 
-        return response
+        # Basic auth headers from the manifest (see `headers`)
+        for encoded in getattr(self, "encoded_secrets", set()):
+            replacements.setdefault(encoded, "BASE64 ENCODED SECRET")
+
+        # An empty value would match everywhere
+        replacements.pop("", None)
+        return replacements
+
+    def clean_response(self, response) -> str:
+        if isinstance(response, (dict, list)):
+            try:
+                response = json.dumps(response)
+            except (TypeError, ValueError):
+                response = str(response)
+        elif not isinstance(response, str):
+            response = str(response)
+
+        replacements = self.get_secret_replacements()
+        # Only kept on this object, so old secrets are gone together with it
+        secrets = tuple(replacements.keys())
+        if getattr(self, "secret_pattern", (None,))[0] != secrets:
+            self.secret_pattern = (secrets, compile_secrets(secrets))
+        return mask_secrets(response, replacements, self.secret_pattern[1])
 
     objects = IntegrationManager()
     inactive = IntegrationInactiveManager()
@@ -843,3 +1260,12 @@ class Integration(models.Model):
 @receiver(post_delete, sender=Integration)
 def delete_schedule(sender, instance, **kwargs):
     Schedule.objects.filter(name=instance.schedule_name).delete()
+    integration_sessions.close(instance.id)
+
+
+@receiver([post_save, post_delete], sender=Integration)
+def reset_slack_bot_client(sender, instance, **kwargs):
+    # The token of the bot might have changed, other processes check it again after
+    # SLACK_CLIENT_CACHE_TIMEOUT
+    if instance.integration == Integration.Type.SLACK_BOT:
+        reset_slack_client()
@@ -0,0 +1,153 @@
+import threading
+import time
+from collections import OrderedDict
+from http.cookiejar import DefaultCookiePolicy
+from urllib.parse import urlparse
+
+import requests
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+
+# Time spent on opening connections (including the TLS handshake) by this thread
+_connect_timing = threading.local()
+
+
+class TimedConnectionMixin:
+    def connect(self):
+        started = time.perf_counter()
+        try:
+            super().connect()
+        finally:
+            if hasattr(_connect_timing, "seconds"):
+                _connect_timing.seconds += time.perf_counter() - started
+
+
+class TimedHTTPConnection(TimedConnectionMixin, HTTPConnection):
+    pass
+
+
+class TimedHTTPSConnection(TimedConnectionMixin, HTTPSConnection):
+    pass
+
+
+class TimedHTTPConnectionPool(HTTPConnectionPool):
+    ConnectionCls = TimedHTTPConnection
+
+
+class TimedHTTPSConnectionPool(HTTPSConnectionPool):
+    ConnectionCls = TimedHTTPSConnection
+
+
+class TimedHTTPAdapter(HTTPAdapter):
+    """
+    Adapter that keeps track of the time it took to open new connections. Reused
+    (keep-alive) connections don't add anything.
+    """
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            "http": TimedHTTPConnectionPool,
+            "https": TimedHTTPSConnectionPool,
+        }
+
+
+class RequestTiming:
+    """
+    Timing of one request of a manifest step, in milliseconds. Both stay `None` if
+    the request was never sent.
+    """
+
+    def __init__(self):
+        self.connect = None
+        self.total = None
+
+
+class IntegrationSessions:
+    """
+    Pooled sessions for the requests of integrations. Every integration gets its
+    own session per host, so connections are kept alive between the steps of a
+    manifest, polling attempts and pages, but are never shared between
+    integrations.
+
+    :param max_size int: amount of sessions to keep open
+    """
+
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self._sessions = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _create_session(self):
+        session = requests.Session()
+        # Sessions are shared between users, never send cookies of an earlier
+        # request along
+        session.cookies.set_policy(DefaultCookiePolicy(allowed_domains=[]))
+        adapter = TimedHTTPAdapter(
+            pool_connections=1,
+            pool_maxsize=settings.INTEGRATION_POOL_MAXSIZE,
+        )
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+        return session
+
+    def get(self, integration_id, url):
+        """
+        Get the session for requests to the host of this url
+
+        :param integration_id int: id of the integration, `None` if not saved
+        :param url str: url that will be requested
+        :return requests.Session:
+        """
+        parsed_url = urlparse(url)
+        key = (integration_id, parsed_url.scheme, parsed_url.netloc)
+        with self._lock:
+            session = self._sessions.get(key)
+            if session is None:
+                session = self._sessions[key] = self._create_session()
+            self._sessions.move_to_end(key)
+            while len(self._sessions) > self.max_size:
+                _key, old_session = self._sessions.popitem(last=False)
+                old_session.close()
+        return session
+
+    def close(self, integration_id=None):
+        """
+        Close the sessions (and their connections) of one or all integrations
+
+        :param integration_id int: id of the integration, `None` for all of them
+        """
+        with self._lock:
+            for key in list(self._sessions.keys()):
+                if integration_id is None or key[0] == integration_id:
+                    self._sessions.pop(key).close()
+
+
+integration_sessions = IntegrationSessions(max_size=settings.INTEGRATION_SESSIONS_MAX)
+
+
+def send_request(integration_id, method, url, timing, **kwargs):
+    """
+    Send a request through the pooled session of the integration
+
+    :param integration_id int: id of the integration, `None` if not saved
+    :param method str: HTTP method
+    :param url str: url to request
+    :param timing RequestTiming: gets filled with the connect and total time
+    :return requests.Response:
+    """
+    kwargs.setdefault(
+        "timeout",
+        (settings.INTEGRATION_CONNECT_TIMEOUT, settings.INTEGRATION_READ_TIMEOUT),
+    )
+    session = integration_sessions.get(integration_id, url)
+    _connect_timing.seconds = 0
+    started = time.perf_counter()
+    try:
+        return session.request(method, url, **kwargs)
+    finally:
+        timing.total = round((time.perf_counter() - started) * 1000)
+        timing.connect = round(_connect_timing.seconds * 1000)
+        del _connect_timing.seconds
@@ -15,25 +15,26 @@ class SyncUsers(PaginatedResponse):
     1. Creating new users.
     2. Updating the users with a specific value.
     These two options can be available through the same manifest and can be scheduled.
-    Paginated response is supported.
+    Paginated response is supported. Pages are processed one at a time, so only one
+    page of users is kept in memory.
     """
 
     def __init__(self, integration):
         super().__init__(integration)
-        self.users = self.get_data_from_paginated_response()
+        self._ignored_user_emails = None
 
     def run(self):
         action = self.integration.manifest.get("action", "create")
-        if action == "create":
-            new_users = self.get_import_user_candidates()
-            self.create_users(new_users)
+        for users in self.iter_pages():
+            if action == "create":
+                self.create_users(self.exclude_known_users(users))
 
-        elif action == "update":
-            self.update_users()
+            elif action == "update":
+                self.update_users(users)
 
-    def update_users(self, commit=True):
+    def update_users(self, users, commit=True):
         # Email param is currently hardcoded, no way to change
-        users_dict = {u["email"]: u for u in self.users}
+        users_dict = {u["email"]: u for u in users}
         emails = list(users_dict.keys())
 
         if not commit:
@@ -72,20 +73,37 @@ class SyncUsers(PaginatedResponse):
         if len(valid_ones):
             self.create_users(valid_ones)
 
-    def get_import_user_candidates(self):
-        # Remove users that are already in the system or have been ignored
-        existing_user_emails = list(
-            get_user_model().objects.all().values_list("email", flat=True)
+    def exclude_known_users(self, users):
+        """
+        Remove users that are already in the system or have been ignored. Only the
+        emails of these users are looked up, so this can be done page by page.
+
+        :param users list: users (dicts) from the API
+        :return list: users that can be imported
+        """
+        if self._ignored_user_emails is None:
+            self._ignored_user_emails = set(
+                Organization.objects.get().ignored_user_emails
+            )
+
+        emails = {user_data.get("email", "") for user_data in users}
+        excluded_emails = set(
+            get_user_model()
+            .objects.filter(email__in=emails - {"", None})
+            .values_list("email", flat=True)
         )
-        ignored_user_emails = Organization.objects.get().ignored_user_emails
-        excluded_emails = (
-            existing_user_emails + ignored_user_emails + ["", None]
-        )  # also add blank emails to ignore
+        # also add blank emails to ignore
+        excluded_emails |= self._ignored_user_emails | {"", None}
 
-        user_candidates = [
+        return [
             user_data
-            for user_data in self.users
+            for user_data in users
             if user_data.get("email", "") not in excluded_emails
         ]
 
-        return user_candidates
+    def get_import_user_candidates(self):
+        return [
+            user_data
+            for users in self.iter_pages()
+            for user_data in self.exclude_known_users(users)
+        ]
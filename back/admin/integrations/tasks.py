@@ -1,13 +1,26 @@
+from datetime import timedelta
+
+from django.conf import settings
 from django.contrib.auth import get_user_model
+from django.utils import timezone
 
-from admin.integrations.models import Integration
+from admin.integrations.access import finish_access_checks
+from admin.integrations.models import Integration, IntegrationTracker
 from admin.integrations.sync_userinfo import SyncUsers
 
 
 def retry_integration(new_hire_id, integration_id, params):
     integration = Integration.objects.get(id=integration_id)
     new_hire = get_user_model().objects.get(id=new_hire_id)
-    integration.execute(new_hire, params)
+    integration.execute(new_hire, params, defer_polling=True)
+
+
+def poll_integration(integration_id, state):
+    # Next polling attempt of an integration, see `Integration._schedule_polling`
+    integration = Integration.objects.filter(id=integration_id).first()
+    if integration is None:
+        return
+    return integration.resume_execute(state)
 
 
 def sync_user_info(integration_id):
@@ -15,3 +28,27 @@ def sync_user_info(integration_id):
     # users or we will add new users. This is done in the background.
     integration = Integration.objects.get(id=integration_id)
     SyncUsers(integration).run()
+
+
+def check_access(integration_ids, user_id):
+    # Fills the access cache for the cards on the access pages, see
+    # `access.start_access_checks`
+    user = get_user_model().objects.get(id=user_id)
+    finish_access_checks(list(Integration.objects.filter(id__in=integration_ids)), user)
+
+
+def prune_trackers():
+    # Enforce the retention of the integration trackers, runs daily
+    IntegrationTracker.objects.prune()
+
+
+def refresh_oauth_tokens():
+    # Refresh tokens before they expire, so requests don't have to wait for it.
+    # Runs every few minutes
+    ahead = settings.INTEGRATION_TOKEN_REFRESH_AHEAD
+    for integration in Integration.objects.filter(
+        manifest__oauth__isnull=False,
+        expiring__lt=timezone.now() + timedelta(seconds=ahead),
+    ):
+        if integration.token_expires_within(ahead):
+            integration.refresh_oauth_token(ahead)
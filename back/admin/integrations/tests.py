@@ -1,6 +1,10 @@
+import ast
 import base64
 import json
+import threading
+import time
 from datetime import timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
 from unittest.mock import Mock, patch
 
 import pytest
@@ -9,10 +13,21 @@ from django.urls import reverse
 from django.utils import timezone
 from django_q.models import Schedule
 
-from admin.integrations.models import Integration, IntegrationTracker
+from admin.integrations import tasks
+from admin.integrations.executor import get_step_waves
+from admin.integrations.models import (
+    Integration,
+    IntegrationTracker,
+    IntegrationTrackerStep,
+)
+from admin.integrations.sessions import integration_sessions
 from admin.integrations.sync_userinfo import SyncUsers
-from admin.integrations.utils import get_value_from_notation
-from organization.models import Notification
+from admin.integrations.utils import (
+    compile_notation,
+    get_value_from_notation,
+    get_value_from_path,
+)
+from organization.models import Notification, Organization
 from users.factories import IntegrationUserFactory
 from users.models import IntegrationUser
 
@@ -601,6 +616,107 @@ def test_integration_refresh_token(
         )
 
 
+@pytest.mark.django_db
+def test_integration_refresh_token_single_flight(custom_integration_factory):
+    integration = custom_integration_factory(
+        manifest={
+            "oauth": {
+                "refresh": {"url": "http://localhost:8000/test", "method": "GET"}
+            },
+            "initial_data_form": [],
+            "execute": [],
+        },
+        extra_args={
+            "SECRET": "123",
+            "oauth": {"access_token": "old", "expires_in": 500},
+        },
+        expiring=timezone.now() - timedelta(minutes=1),
+    )
+    # Two workers that loaded the integration before it got refreshed
+    worker1 = Integration.objects.get(id=integration.id)
+    worker2 = Integration.objects.get(id=integration.id)
+    # The second worker changed something else in the meantime
+    integration.extra_args["SECRET"] = "456"
+    integration.save()
+
+    request_mock = Mock(
+        return_value=(
+            True,
+            Mock(json=lambda: {"access_token": "new", "expires_in": 3600}),
+        )
+    )
+    with patch("admin.integrations.models.Integration.run_request", request_mock):
+        assert worker1.renew_key()
+        assert worker2.renew_key()
+
+    # Only refreshed once, the second worker uses the token of the first
+    assert request_mock.call_count == 1
+    assert worker2.extra_args["oauth"]["access_token"] == "new"
+    assert worker2.expiring == worker1.expiring
+
+    integration.refresh_from_db()
+    assert integration.extra_args == {
+        "SECRET": "456",
+        "oauth": {"access_token": "new", "expires_in": 3600},
+    }
+
+    # Not close to expiring, so nothing is requested
+    with patch("admin.integrations.models.Integration.run_request", request_mock):
+        assert integration.renew_key()
+    assert request_mock.call_count == 1
+
+
+@pytest.mark.django_db
+def test_refresh_oauth_tokens_task(settings, custom_integration_factory):
+    settings.INTEGRATION_TOKEN_REFRESH_AHEAD = 900
+
+    def create_integration(expires_in_minutes):
+        integration = custom_integration_factory(
+            manifest={
+                "oauth": {
+                    "refresh": {"url": "http://localhost:8000/test", "method": "GET"}
+                },
+                "initial_data_form": [],
+                "execute": [],
+            },
+            extra_args={"oauth": {"access_token": "old", "expires_in": 500}},
+        )
+        # `expiring` gets set to now when it's created
+        Integration.objects.filter(id=integration.id).update(
+            expiring=timezone.now() + timedelta(minutes=expires_in_minutes)
+        )
+        integration.refresh_from_db()
+        return integration
+
+    expiring_soon = create_integration(10)
+    expiring_later = create_integration(60)
+
+    request_mock = Mock(
+        return_value=(
+            True,
+            Mock(json=lambda: {"access_token": "new", "expires_in": 3600}),
+        )
+    )
+    with patch("admin.integrations.models.Integration.run_request", request_mock):
+        tasks.refresh_oauth_tokens()
+
+    assert request_mock.call_count == 1
+    expiring_soon.refresh_from_db()
+    assert expiring_soon.extra_args["oauth"]["access_token"] == "new"
+    assert expiring_soon.expiring > timezone.now() + timedelta(minutes=55)
+    expiring_later.refresh_from_db()
+    assert expiring_later.extra_args["oauth"]["access_token"] == "old"
+
+    # Requests don't refresh tokens that the task will refresh in time
+    with patch("admin.integrations.models.Integration.run_request", request_mock):
+        assert expiring_later.renew_key()
+    assert request_mock.call_count == 1
+
+    assert Schedule.objects.filter(
+        func="admin.integrations.tasks.refresh_oauth_tokens"
+    ).exists()
+
+
 @pytest.mark.django_db
 def test_integration_send_email(
     client, django_user_model, new_hire_factory, mailoutbox, custom_integration_factory
@@ -711,6 +827,107 @@ def test_integration_clean_error_data(custom_integration_factory):
     )
 
 
+@pytest.mark.django_db
+def test_integration_clean_response_masks_all_secrets(custom_integration_factory):
+    integration = custom_integration_factory(
+        extra_args={
+            "SECRET_KEY": "123",
+            "LONGER_SECRET_KEY": "12345",
+            "EMPTY": "",
+            "TEAM_ID": 987,
+            "Authorization": "Basic user:password",
+            "oauth": {"access_token": "token-abc", "refresh_token": "refresh-def"},
+        }
+    )
+
+    encoded = base64.b64encode(b"user:password").decode()
+    response = integration.clean_response(
+        {
+            "url": "http://localhost/?key=12345&short=123",
+            "headers": {
+                "Authorization": f"Basic {encoded}",
+                "X-Plain": "Basic user:password",
+                "Bearer": "Bearer token-abc",
+            },
+            "refresh": "refresh-def",
+            "team": 987,
+            "text": "nothing secret here",
+        }
+    )
+
+    for secret in ["123", "user:password", encoded, "token-abc", "refresh-def", "987"]:
+        assert secret not in response
+    assert "key=***Secret value for LONGER_SECRET_KEY***" in response
+    assert "short=***Secret value for SECRET_KEY***" in response
+    assert "Basic BASE64 ENCODED SECRET" in response
+    assert "***Secret value for Authorization***" in response
+    assert "Bearer ***Secret value for oauth.access_token***" in response
+    assert "***Secret value for oauth.refresh_token***" in response
+    assert "***Secret value for TEAM_ID***" in response
+    # empty values are not masked
+    assert "nothing secret here" in response
+
+    # lists and non-text values are masked too
+    assert integration.clean_response([{"key": "123"}]) == (
+        '[{"key": "***Secret value for SECRET_KEY***"}]'
+    )
+    assert integration.clean_response(12345) == (
+        "***Secret value for LONGER_SECRET_KEY***"
+    )
+
+
+@pytest.mark.django_db
+def test_integration_clean_response_follows_new_secrets(custom_integration_factory):
+    integration = custom_integration_factory(extra_args={"oauth": {}})
+    assert integration.clean_response("token-abc") == "token-abc"
+
+    # refreshed tokens get masked right away
+    integration.extra_args["oauth"] |= {"access_token": "token-abc"}
+    assert (
+        integration.clean_response("token-abc")
+        == "***Secret value for oauth.access_token***"
+    )
+
+
+@pytest.mark.django_db
+def test_integration_tracker_masks_manifest_basic_auth(
+    settings, new_hire_factory, custom_integration_factory
+):
+    settings.INTEGRATION_TRACKER_MODE = "all"
+    new_hire = new_hire_factory()
+    integration = custom_integration_factory(
+        manifest={
+            "headers": {"Authorization": "Basic {{ USER }}:{{ PASS }}"},
+            "exists": {
+                "url": "http://localhost/users",
+                "method": "GET",
+                "expected": "{{ email }}",
+            },
+        },
+        extra_args={"USER": "user", "PASS": "password"},
+    )
+    encoded = base64.b64encode(b"user:password").decode()
+
+    # The server echoes the headers it got
+    send_request = Mock(
+        return_value=Mock(
+            status_code=200,
+            json=Mock(return_value={"auth": f"Basic {encoded}"}),
+        )
+    )
+    with patch("admin.integrations.models.send_request", send_request):
+        integration.user_exists(new_hire)
+
+    # The encoded credentials are sent, but never stored
+    assert send_request.call_args.kwargs["headers"] == {
+        "Authorization": f"Basic {encoded}"
+    }
+    step = IntegrationTrackerStep.objects.get(tracker__integration=integration)
+    assert step.headers == {"Authorization": "Basic BASE64 ENCODED SECRET"}
+    assert step.json_response == {"auth": "Basic BASE64 ENCODED SECRET"}
+    assert encoded not in integration.clean_response(f"Basic {encoded}")
+
+
 @pytest.mark.django_db
 # Returns text instead of request object
 @patch(
@@ -803,6 +1020,38 @@ def test_get_value_from_notation():
         get_value_from_notation("two", test_data)
 
 
+@pytest.mark.django_db
+def test_compiled_notation():
+    assert compile_notation("") == ()
+    assert compile_notation("one.0.deep") == (
+        ("one", None),
+        ("0", 0),
+        ("deep", None),
+    )
+    # parsed once and reused
+    assert compile_notation("one.0.deep") is compile_notation("one.0.deep")
+
+    path = compile_notation("one.0.deep")
+    assert get_value_from_path(path, {"one": [{"deep": "yes"}]}) == "yes"
+    assert get_value_from_path(path, {"one": {"0": {"deep": "yes"}}}) == "yes"
+    assert get_value_from_path((), {"one": 1}) == {"one": 1}
+
+    # every failing lookup is a KeyError
+    for value in [
+        {"one": []},
+        {"one": {"deep": "yes"}},
+        {"one": "text"},
+        {"one": None},
+        {"one": [["yes"]]},
+        [],
+    ]:
+        with pytest.raises(KeyError):
+            get_value_from_path(path, value)
+
+    with pytest.raises(KeyError):
+        get_value_from_path(compile_notation("one.first"), {"one": [1]})
+
+
 @pytest.mark.django_db
 @patch(
     "admin.integrations.models.Integration.run_request",
@@ -927,11 +1176,11 @@ def test_polling_not_getting_correct_state(
 
 @pytest.mark.django_db
 @patch(
-    "requests.request",
+    "requests.Session.request",
     Mock(return_value=Mock(status_code=200, content=b"0123456", json=lambda: dict({}))),
 )
 @patch(
-    "requests.request",
+    "requests.Session.request",
     Mock(return_value=Mock(status_code=201, json=lambda: dict({}))),
 )
 def test_receiving_and_sending_file(new_hire_factory, custom_integration_factory):
@@ -961,11 +1210,11 @@ def test_receiving_and_sending_file(new_hire_factory, custom_integration_factory
 
 @pytest.mark.django_db
 @patch(
-    "requests.request",
+    "requests.Session.request",
     Mock(return_value=Mock(status_code=200, content=b"0123456", json=lambda: dict({}))),
 )
 @patch(
-    "requests.request",
+    "requests.Session.request",
     Mock(return_value=Mock(status_code=201, json=lambda: dict({}))),
 )
 def test_receiving_and_sending_file_invalid_lookup(
@@ -1233,6 +1482,116 @@ def test_integration_sync_data_create_users(
     )
 
 
+@pytest.mark.django_db
+def test_integration_sync_data_pages(new_hire_factory, custom_integration_factory):
+    new_hire_factory(email="existing@chiefonboarding.com")
+    org = Organization.object.get()
+    org.ignored_user_emails = ["ignored@chiefonboarding.com"]
+    org.save()
+
+    pages = [
+        [
+            {
+                "email": "page1@chiefonboarding.com",
+                "firstName": "page1",
+                "lastName": "Do",
+            },
+            {
+                "email": "ignored@chiefonboarding.com",
+                "firstName": "ignored",
+                "lastName": "Do",
+            },
+        ],
+        [
+            {
+                "email": "existing@chiefonboarding.com",
+                "firstName": "existing",
+                "lastName": "Do",
+            },
+            {
+                "email": "page2@chiefonboarding.com",
+                "firstName": "page2",
+                "lastName": "Do",
+            },
+            {"firstName": "no email", "lastName": "Do"},
+        ],
+        [
+            # Was already created with the first page
+            {
+                "email": "page1@chiefonboarding.com",
+                "firstName": "page1",
+                "lastName": "Do",
+            },
+            {
+                "email": "page3@chiefonboarding.com",
+                "firstName": "page3",
+                "lastName": "Do",
+            },
+        ],
+    ]
+    requested = []
+    next_page_requested = threading.Event()
+
+    def send_request(method, url, **kwargs):
+        requested.append(url)
+        next_page_requested.set()
+        page = len(requested)
+        body = {"users": pages[page - 1]}
+        if page < len(pages):
+            body["next"] = f"http://localhost/users?page={page + 1}"
+        return Mock(status_code=200, json=lambda: body)
+
+    integration = custom_integration_factory(
+        manifest_type=Integration.ManifestType.SYNC_USERS,
+        manifest={
+            "execute": [{"url": "http://localhost/users", "method": "GET"}],
+            "data_from": "users",
+            "action": "create",
+            "next_page_from": "next",
+            "data_structure": {
+                "email": "email",
+                "first_name": "firstName",
+                "last_name": "lastName",
+            },
+        },
+    )
+
+    with patch("requests.Session.request", Mock(side_effect=send_request)):
+        sync = SyncUsers(integration)
+        page_iterator = sync.iter_pages()
+        first_page = next(page_iterator)
+        assert [user["email"] for user in first_page] == [
+            "page1@chiefonboarding.com",
+            "ignored@chiefonboarding.com",
+        ]
+        # The next page is already being fetched while this one gets processed
+        assert next_page_requested.wait(5)
+        assert requested == ["http://localhost/users", "http://localhost/users?page=2"]
+        page_iterator.close()
+
+        requested.clear()
+        assert [
+            user["email"]
+            for user in SyncUsers(integration).get_import_user_candidates()
+        ] == [
+            "page1@chiefonboarding.com",
+            "page2@chiefonboarding.com",
+            "page1@chiefonboarding.com",
+            "page3@chiefonboarding.com",
+        ]
+
+        requested.clear()
+        SyncUsers(integration).run()
+
+    assert len(requested) == 3
+    assert set(get_user_model().objects.values_list("email", flat=True)) == {
+        "existing@chiefonboarding.com",
+        "page1@chiefonboarding.com",
+        "page2@chiefonboarding.com",
+        "page3@chiefonboarding.com",
+    }
+
+
 @pytest.mark.django_db
 def test_integration_tracker(
     client, django_user_model, new_hire_factory, custom_integration_factory
@@ -1253,7 +1612,7 @@ def test_integration_tracker(
 
     # Didn't find user
     with patch(
-        "requests.request",
+        "requests.Session.request",
         Mock(
             return_value=Mock(
                 status_code=200,
@@ -1279,3 +1638,469 @@ def test_integration_tracker(
 
     assert integration.name + " for " + new_hire.full_name in response.content.decode()
     assert "not_found" in response.content.decode()
+
+
+@pytest.mark.django_db
+def test_integration_tracker_step_modes(settings, custom_integration_factory):
+    tracker = IntegrationTracker.objects.create(
+        integration=custom_integration_factory(),
+        category=IntegrationTracker.Category.EXISTS,
+    )
+
+    def track(status_code=200, error="", text_response=""):
+        return IntegrationTrackerStep.objects.track(
+            tracker=tracker,
+            status_code=status_code,
+            json_response={"users": ["test"] * 10},
+            text_response=text_response,
+            url="http://localhost/",
+            method="GET",
+            post_data={},
+            headers={},
+            expected="",
+            error=error,
+        )
+
+    assert track().pk is not None
+
+    settings.INTEGRATION_TRACKER_MODE = "errors"
+    assert track().pk is None
+    assert track(status_code=404).pk is not None
+    assert track(error="The request timed out").pk is not None
+
+    # Not getting the expected value counts as a failure
+    step = IntegrationTrackerStep.objects.track(
+        tracker=tracker,
+        status_code=200,
+        json_response={"users": []},
+        text_response="",
+        url="http://localhost/",
+        method="GET",
+        post_data={},
+        headers={},
+        expected="test@example.com",
+        error="",
+    )
+    assert step.pk is not None
+    assert not step.found_expected
+
+    settings.INTEGRATION_TRACKER_MODE = "sampled"
+    settings.INTEGRATION_TRACKER_SAMPLE_RATE = 0
+    assert track().pk is None
+    assert track(status_code=500).pk is not None
+    settings.INTEGRATION_TRACKER_SAMPLE_RATE = 1
+    assert track().pk is not None
+
+    # Large payloads get cut off
+    settings.INTEGRATION_TRACKER_MAX_PAYLOAD = 20
+    step = track(text_response="a" * 30)
+    step.refresh_from_db()
+    assert step.text_response.startswith("a" * 20 + "... (truncated, 30 characters")
+    assert (
+        step.json_response
+        == '{"users": ["test", "... (truncated, 91 characters in total)'
+    )
+    assert step.pretty_json_response == step.json_response
+    assert step.headers == {}
+    assert step.pretty_headers == "{}"
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize("mode", ["all", "errors", "sampled"])
+def test_integration_tracker_modes_user_exists_and_revoke(
+    settings, mode, new_hire_factory, custom_integration_factory
+):
+    settings.INTEGRATION_TRACKER_MODE = mode
+    settings.INTEGRATION_TRACKER_SAMPLE_RATE = 0
+    new_hire = new_hire_factory()
+    integration = custom_integration_factory(
+        manifest={
+            "exists": {
+                "url": "http://localhost/users",
+                "method": "GET",
+                "expected": "{{ email }}",
+            },
+            "revoke": [
+                {
+                    "url": "http://localhost/revoke",
+                    "method": "POST",
+                    "expected": "revoked",
+                }
+            ],
+        }
+    )
+
+    def respond(json_response):
+        return patch(
+            "admin.integrations.models.send_request",
+            Mock(
+                return_value=Mock(
+                    status_code=200, json=Mock(return_value=json_response)
+                )
+            ),
+        )
+
+    # The result comes from the response, also when the step isn't stored
+    with respond({"users": [new_hire.email]}):
+        assert integration.user_exists(new_hire)
+        # Revoking expects another value
+        assert not integration.revoke_user(new_hire)[0]
+    with respond({"users": []}):
+        assert not integration.user_exists(new_hire)
+    with respond({"status": "revoked"}):
+        assert integration.revoke_user(new_hire) == (True, "")
+
+    # Steps without the expected value are always kept
+    stored = IntegrationTrackerStep.objects.filter(
+        tracker__integration=integration
+    ).order_by("id")
+    assert [step.url for step in stored] == (
+        [
+            "http://localhost/users",
+            "http://localhost/revoke",
+            "http://localhost/users",
+            "http://localhost/revoke",
+        ]
+        if mode == "all"
+        else ["http://localhost/revoke", "http://localhost/users"]
+    )
+
+
+@pytest.mark.django_db
+def test_prune_integration_trackers(settings, custom_integration_factory):
+    settings.INTEGRATION_TRACKER_RETENTION_DAYS = 30
+    settings.INTEGRATION_TRACKER_MAX_PER_INTEGRATION = 3
+    integration1 = custom_integration_factory()
+    integration2 = custom_integration_factory()
+
+    def create_tracker(integration, days_ago=0):
+        tracker = IntegrationTracker.objects.create(
+            integration=integration, category=IntegrationTracker.Category.EXECUTE
+        )
+        IntegrationTrackerStep.objects.track(
+            tracker=tracker,
+            status_code=200,
+            json_response={},
+            text_response="",
+            url="http://localhost/",
+            method="GET",
+            post_data={},
+            headers={},
+            expected="",
+            error="",
+        )
+        IntegrationTracker.objects.filter(id=tracker.id).update(
+            ran_at=timezone.now() - timedelta(days=days_ago)
+        )
+        return tracker
+
+    old = create_tracker(integration1, days_ago=40)
+    trackers1 = [create_tracker(integration1) for _ in range(5)]
+    trackers2 = [create_tracker(integration2, days_ago=29) for _ in range(2)]
+
+    tasks.prune_trackers()
+
+    assert not IntegrationTracker.objects.filter(id=old.id).exists()
+    # Only the latest three of the first integration are kept
+    assert set(
+        IntegrationTracker.objects.filter(integration=integration1).values_list(
+            "id", flat=True
+        )
+    ) == {tracker.id for tracker in trackers1[2:]}
+    assert IntegrationTracker.objects.filter(integration=integration2).count() == 2
+    assert IntegrationTrackerStep.objects.count() == 5
+    assert len(trackers2) == 2
+
+    # Nothing gets removed when retention is disabled
+    settings.INTEGRATION_TRACKER_RETENTION_DAYS = 0
+    settings.INTEGRATION_TRACKER_MAX_PER_INTEGRATION = 0
+    create_tracker(integration2, days_ago=400)
+    tasks.prune_trackers()
+    assert IntegrationTracker.objects.count() == 6
+
+    assert Schedule.objects.filter(
+        func="admin.integrations.tasks.prune_trackers"
+    ).exists()
+
+
+@pytest.fixture
+def keep_alive_server():
+    # Local HTTP server that keeps connections open and counts them
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def setup(self):
+            super().setup()
+            self.server.connections += 1
+
+        def do_GET(self):
+            self.server.cookies.append(self.headers.get("Cookie"))
+            time.sleep(self.server.delay)
+            body = json.dumps({"status": "done", "path": self.path}).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.send_header("Set-Cookie", "session=123")
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    server.connections = 0
+    server.cookies = []
+    server.delay = 0
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    integration_sessions.close()
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.mark.django_db
+def test_integration_requests_reuse_connections(
+    keep_alive_server, new_hire_factory, custom_integration_factory
+):
+    url = f"http://127.0.0.1:{keep_alive_server.server_port}/"
+    integration = custom_integration_factory(
+        manifest={
+            "execute": [
+                {"url": url, "method": "GET"},
+                {"url": url + "second", "method": "GET"},
+                {"url": url + "third", "method": "GET"},
+            ]
+        }
+    )
+
+    success, _response = integration.execute(new_hire_factory(), {})
+
+    assert success is True
+    assert keep_alive_server.connections == 1
+    # Cookies are never sent back
+    assert keep_alive_server.cookies == [None, None, None]
+
+    steps = list(IntegrationTracker.objects.get().steps.order_by("id"))
+    assert all(step.duration is not None for step in steps)
+    assert steps[0].connect_duration is not None
+    # Connection was reused
+    assert steps[1].connect_duration == 0
+    assert steps[2].connect_duration == 0
+
+    # Other integrations get their own session
+    other_integration = custom_integration_factory(
+        manifest={"execute": [{"url": url, "method": "GET"}]}
+    )
+    other_integration.execute(new_hire_factory(), {})
+
+    assert keep_alive_server.connections == 2
+
+    # Deleting the integration closes its connections
+    session = integration_sessions.get(integration.id, url)
+    integration.delete()
+    assert integration_sessions.get(integration.id, url) is not session
+
+
+@pytest.mark.django_db
+def test_get_step_waves():
+    steps = [
+        {"url": "http://localhost/users", "store_data": {"USER_ID": "id"}},
+        {"url": "http://localhost/teams", "save_as_file": "avatar.png"},
+        {"url": "http://localhost/users/{{ USER_ID }}/teams"},
+        {"url": "http://localhost/teams/{{ responses.1.id }}"},
+        {"url": "http://localhost/avatar", "files": {"file": "avatar.png"}},
+        {"url": "http://localhost/groups", "headers": {"X-Total": "{{ responses }}"}},
+        {"url": "http://localhost/status", "continue_if": {"value": "done"}},
+        {"url": "http://localhost/done"},
+    ]
+
+    assert get_step_waves(steps) == [[0, 1], [2, 3, 4], [5], [6], [7]]
+
+    # Explicit dependencies
+    assert get_step_waves(
+        [{"url": "http://localhost/"}, {"url": "http://localhost/", "depends_on": [0]}]
+    ) == [[0], [1]]
+
+    # Default headers are taken into account
+    assert get_step_waves(
+        [steps[0], {"url": "http://localhost/"}], {"Authorization": "{{ USER_ID }}"}
+    ) == [[0], [1]]
+
+
+@pytest.mark.django_db
+def test_integration_execute_concurrently(
+    settings, keep_alive_server, new_hire_factory, custom_integration_factory
+):
+    settings.INTEGRATION_EXECUTE_MODE = "concurrent"
+    keep_alive_server.delay = 0.3
+    url = f"http://127.0.0.1:{keep_alive_server.server_port}/"
+    integration = custom_integration_factory(
+        manifest={
+            "execute": [
+                {"url": url + "first", "method": "GET"},
+                {"url": url + "second", "method": "GET"},
+                {"url": url + "third", "method": "GET"},
+                {"url": url + "{{ responses.1.path }}/fourth", "method": "GET"},
+            ]
+        }
+    )
+
+    started = time.perf_counter()
+    success, response = integration.execute(new_hire_factory(), {})
+
+    assert success is True
+    # Two waves: the first three steps at the same time and then the last one
+    assert time.perf_counter() - started < 1
+    assert response.json()["path"].endswith("/second/fourth")
+    assert [step.url for step in IntegrationTracker.objects.get().steps.all()] == [
+        url + "first",
+        url + "second",
+        url + "third",
+        url + "/second/fourth",
+    ]
+    assert Notification.objects.filter(
+        notification_type=Notification.Type.RAN_INTEGRATION
+    ).exists()
+
+
+@pytest.mark.django_db
+def test_integration_execute_concurrently_failing_step(
+    settings, keep_alive_server, new_hire_factory, custom_integration_factory
+):
+    settings.INTEGRATION_EXECUTE_MODE = "concurrent"
+    url = f"http://127.0.0.1:{keep_alive_server.server_port}/"
+    integration = custom_integration_factory(
+        manifest={
+            "execute": [
+                {"url": url + "first", "method": "GET", "status_code": ["201"]},
+                {"url": url + "second", "method": "GET"},
+                {"url": url + "{{ responses.1.path }}/third", "method": "GET"},
+            ]
+        }
+    )
+
+    success, response = integration.execute(new_hire_factory(), {})
+
+    # The third step never runs
+    assert success is False
+    assert response == "Status code (200) not in allowed list (['201'])"
+    assert IntegrationTracker.objects.get().steps.count() == 2
+    assert Notification.objects.filter(
+        notification_type=Notification.Type.FAILED_INTEGRATION
+    ).exists()
+
+
+@pytest.mark.django_db
+def test_deferred_polling(new_hire_factory, custom_integration_factory):
+    new_hire = new_hire_factory()
+    integration = custom_integration_factory(
+        manifest={
+            "initial_data_form": [
+                {"id": "PASSWORD", "name": "generate", "description": ""}
+            ],
+            "execute": [
+                {"url": "http://localhost/create", "save_as_file": "avatar.png"},
+                {
+                    "url": "http://localhost/status",
+                    "polling": {"interval": 10, "amount": 3},
+                    "continue_if": {"response_notation": "status", "value": "done"},
+                },
+                {
+                    "url": "http://localhost/{{ PASSWORD }}/{{ responses.0.id }}",
+                    "files": {"file": "avatar.png"},
+                },
+            ],
+        }
+    )
+
+    def run_next_poll():
+        polls = Schedule.objects.filter(
+            func="admin.integrations.tasks.poll_integration"
+        )
+        assert polls.count() == 1
+        poll = polls.get()
+        poll.delete()
+        tasks.poll_integration(*ast.literal_eval(poll.args))
+        return poll
+
+    with patch(
+        "admin.integrations.models.Integration.run_request",
+        Mock(
+            side_effect=[
+                [True, Mock(json=lambda: {"id": 1}, content=b"123")],
+                [True, Mock(json=lambda: {"status": "not_done"})],
+            ]
+        ),
+    ):
+        success, response = integration.execute(new_hire, {}, defer_polling=True)
+
+    # Not done yet, nothing is waiting
+    assert (success, response) == (None, None)
+    password = integration.extra_args["PASSWORD"]
+
+    with patch(
+        "admin.integrations.models.Integration.run_request",
+        Mock(return_value=[True, Mock(json=lambda: {"status": "not_done"})]),
+    ):
+        poll = run_next_poll()
+
+    assert "(attempt 2)" in poll.name
+    # Secrets are not readable in the scheduled task
+    assert password not in poll.args
+
+    with patch(
+        "admin.integrations.models.Integration.run_request",
+        Mock(
+            side_effect=[
+                [True, Mock(json=lambda: {"status": "done"})],
+                [True, Mock(json=lambda: {})],
+            ]
+        ),
+    ) as request_mock:
+        poll = run_next_poll()
+
+    assert "(attempt 3)" in poll.name
+    # Continues with the next step, with the state of the first run
+    last_step = request_mock.call_args_list[1].args[0]
+    assert last_step["url"] == "http://localhost/{{ PASSWORD }}/{{ responses.0.id }}"
+    assert not Schedule.objects.filter(
+        func="admin.integrations.tasks.poll_integration"
+    ).exists()
+    assert Notification.objects.filter(
+        notification_type=Notification.Type.RAN_INTEGRATION
+    ).exists()
+
+
+@pytest.mark.django_db
+@patch(
+    "admin.integrations.models.Integration.run_request",
+    Mock(return_value=(True, Mock(json=lambda: {"status": "not_done"}))),
+)
+def test_deferred_polling_gives_up(new_hire_factory, custom_integration_factory):
+    new_hire = new_hire_factory()
+    integration = custom_integration_factory(
+        manifest={
+            "execute": [
+                {
+                    "url": "http://localhost/status",
+                    "polling": {"interval": 10, "amount": 2},
+                    "continue_if": {"response_notation": "status", "value": "done"},
+                },
+            ],
+        }
+    )
+
+    integration.execute(new_hire, {}, defer_polling=True)
+    poll = Schedule.objects.get(func="admin.integrations.tasks.poll_integration")
+    poll.delete()
+
+    success, _response = tasks.poll_integration(*ast.literal_eval(poll.args))
+
+    assert success is False
+    assert not Schedule.objects.filter(
+        func="admin.integrations.tasks.poll_integration"
+    ).exists()
+    assert Notification.objects.filter(
+        notification_type=Notification.Type.BLOCKED_INTEGRATION
+    ).exists()
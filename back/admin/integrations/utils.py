@@ -1,28 +1,58 @@
+from functools import lru_cache
+
+
 def get_value_from_notation(notation, value):
-    # if we don't need to go into props, then just return the value
+    return get_value_from_path(compile_notation(notation), value)
+
+
+@lru_cache(maxsize=1024)
+def compile_notation(notation):
+    """
+    Parse a dot notation (`users.0.email`) once, so it can be applied to many
+    values. Every part is kept as the key and, if it's a number, the index to use
+    on lists.
+
+    :param notation str: dot notation, empty to use the value itself
+    :return tuple: tuple of `(key, index)` tuples
+    """
     if notation == "":
-        return value
+        return ()
 
-    notations = notation.split(".")
-    for notation in notations:
+    path = []
+    for key in notation.split("."):
         try:
-            value = value[notation]
-        except TypeError:
-            # check if array
-            if not isinstance(value, list):
-                raise KeyError
+            index = int(key)
+        except ValueError:
+            index = None
+        path.append((key, index))
+    return tuple(path)
 
-            try:
-                index = int(notation)
-            except (TypeError, ValueError):
-                # keep errors consistent, we are only expecting a KeyError
-                raise KeyError
 
+def get_value_from_path(path, value):
+    """
+    Dig into a value with a compiled notation
+
+    :param path tuple: see `compile_notation`
+    :param value: JSON data
+    :raises KeyError: if a part of the notation doesn't exist
+    :return: the value the notation points to
+    """
+    for key, index in path:
+        if isinstance(value, dict):
+            value = value[key]
+        elif isinstance(value, list):
+            # keep errors consistent, we are only expecting a KeyError
+            if index is None:
+                raise KeyError(key)
             try:
                 value = value[index]
-            except (TypeError, ValueError, IndexError):
-                # keep errors consistent, we are only expecting a KeyError
-                raise KeyError
+            except IndexError:
+                raise KeyError(key)
+        else:
+            try:
+                value = value[key]
+            except (TypeError, IndexError):
+                raise KeyError(key)
 
     return value
 
@@ -9,12 +9,37 @@ from django.views.generic import View
 from django.views.generic.detail import DetailView
 from django.views.generic.edit import DeleteView
 
+from admin.integrations.access import (
+    clear_cached_access,
+    get_checked_access,
+    start_access_checks,
+)
+from admin.integrations.executor import run_concurrently
 from admin.integrations.forms import IntegrationExtraUserInfoForm
 from admin.integrations.models import Integration
 from users.mixins import IsAdminOrNewHireManagerMixin
 from users.models import IntegrationUser
 
 
+def get_access_cards(user):
+    # Check all integrations at once in the background. The cards that aren't done
+    # yet poll for their outcome (see `UserCheckAccessView`)
+    integrations = list(Integration.objects.account_provision_options())
+    start_access_checks(integrations, user)
+    cards = []
+    for integration in integrations:
+        done, found_user = get_checked_access(integration, user)
+        cards.append(
+            {
+                "integration": integration,
+                "loading": not done,
+                "active": found_user,
+                "needs_user_info": integration.needs_user_info(user),
+            }
+        )
+    return cards
+
+
 class NewHireAccessView(IsAdminOrNewHireManagerMixin, DetailView):
     template_name = "new_hire_access.html"
     model = get_user_model()
@@ -23,8 +48,7 @@ class NewHireAccessView(IsAdminOrNewHireManagerMixin, DetailView):
         context = super().get_context_data(**kwargs)
         context["title"] = self.object.full_name
         context["subtitle"] = _("new hire")
-        context["loading"] = True
-        context["integrations"] = Integration.objects.account_provision_options()
+        context["cards"] = get_access_cards(self.object)
         return context
 
 
@@ -36,8 +60,7 @@ class ColleagueAccessView(IsAdminOrNewHireManagerMixin, DetailView):
         context = super().get_context_data(**kwargs)
         context["title"] = self.object.full_name
         context["subtitle"] = _("Employee")
-        context["loading"] = True
-        context["integrations"] = Integration.objects.account_provision_options()
+        context["cards"] = get_access_cards(self.object)
         return context
 
 
@@ -53,6 +76,8 @@ class UserDeleteView(IsAdminOrNewHireManagerMixin, SuccessMessageMixin, DeleteVi
         context["automated_provisioned_items"] = provision_options.exclude(
             manifest_type=Integration.ManifestType.MANUAL_USER_PROVISIONING
         )
+        # The rows poll for the outcome
+        start_access_checks(list(context["automated_provisioned_items"]), self.object)
         context["manual_provisioned_items"] = IntegrationUser.objects.filter(
             user=self.object, revoked=False
         ).select_related("integration")
@@ -66,16 +91,20 @@ class UserDeleteView(IsAdminOrNewHireManagerMixin, SuccessMessageMixin, DeleteVi
 class UserRevokeAllAccessView(IsAdminOrNewHireManagerMixin, SuccessMessageMixin, View):
     def post(self, request, *args, **kwargs):
         user = get_object_or_404(get_user_model(), id=self.kwargs.get("pk", -1))
-        for integration in Integration.objects.filter(
+        integrations = Integration.objects.filter(
             manifest_type=Integration.ManifestType.WEBHOOK,
             manifest__revoke__isnull=False,
             manifest__exists__isnull=False,
-        ):
-            if integration.user_exists(user):
-                # Any failed attempts will show up as it will refetch all items to
-                # check if the accounts have been deleted. So we can safely ignore
-                # response here
-                integration.revoke_user(user)
+        )
+        # Check and revoke all integrations at the same time. Any failed attempts
+        # will show up as it will refetch all items to check if the accounts have
+        # been deleted. So we can safely ignore the responses here
+        run_concurrently(
+            [
+                (integration, integration.revoke_existing_user_steps(user))
+                for integration in integrations
+            ]
+        )
 
         return redirect("people:delete", user.id)
 
@@ -95,12 +124,19 @@ class UserCheckAccessView(IsAdminOrNewHireManagerMixin, DetailView):
         integration = get_object_or_404(
             Integration, id=self.kwargs.get("integration_id", -1)
         )
-        found_user = integration.user_exists(self.object)
+        done, found_user = get_checked_access(integration, self.object)
         context["integration"] = integration
+        context["loading"] = not done
         context["active"] = found_user
         context["needs_user_info"] = integration.needs_user_info(self.object)
         return context
 
+    def render_to_response(self, context, **response_kwargs):
+        if not context["loading"]:
+            # Tells htmx to stop polling
+            response_kwargs["status"] = 286
+        return super().render_to_response(context, **response_kwargs)
+
 
 class UserGiveAccessView(IsAdminOrNewHireManagerMixin, DetailView):
     template_name = "give_user_access.html"
@@ -183,6 +219,7 @@ class UserToggleAccessView(IsAdminOrNewHireManagerMixin, View):
             if not created:
                 user_integration.revoked = not user_integration.revoked
                 user_integration.save()
+            clear_cached_access(integration, user)
 
             return render(
                 request,
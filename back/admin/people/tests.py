@@ -1,3 +1,4 @@
+import threading
 from datetime import datetime, timedelta
 from unittest.mock import Mock, patch
 
@@ -11,7 +12,9 @@ from freezegun import freeze_time
 from rest_framework.test import APIClient
 
 from admin.appointments.factories import AppointmentFactory
-from admin.integrations.models import Integration
+from admin.integrations.access import clear_cached_access, iter_access
+from admin.integrations.models import Integration, IntegrationTracker
+from admin.integrations.tasks import check_access
 from admin.introductions.factories import IntroductionFactory
 from admin.notes.models import Note
 from admin.preboarding.factories import PreboardingFactory
@@ -1679,6 +1682,15 @@ def test_new_hire_access_list(
     assert integration4.name in response.content.decode()
 
 
+def steps_without_requests(outcome):
+    # Steps that finish right away with this outcome
+    def steps(*args, **kwargs):
+        return outcome
+        yield
+
+    return steps
+
+
 @pytest.mark.django_db
 def test_new_hire_access_per_integration(
     client, django_user_model, new_hire_factory, custom_integration_factory
@@ -1692,7 +1704,8 @@ def test_new_hire_access_per_integration(
     integration1 = custom_integration_factory(name="Asana")
 
     with patch(
-        "admin.integrations.models.Integration.user_exists", Mock(return_value=True)
+        "admin.integrations.models.Integration.user_exists_steps",
+        Mock(side_effect=steps_without_requests(True)),
     ):
         # New hire already has an account (email matches with return)
         url = reverse(
@@ -1701,11 +1714,14 @@ def test_new_hire_access_per_integration(
 
         response = client.get(url)
 
+        # The check is done, so the card stops polling
+        assert response.status_code == 286
         assert integration1.name in response.content.decode()
         assert "Activated" in response.content.decode()
 
     with patch(
-        "admin.integrations.models.Integration.user_exists", Mock(return_value=False)
+        "admin.integrations.models.Integration.user_exists_steps",
+        Mock(side_effect=steps_without_requests(False)),
     ):
         # New hire has no account
         url = reverse(
@@ -1717,8 +1733,12 @@ def test_new_hire_access_per_integration(
         assert integration1.name in response.content.decode()
         assert "Give access" in response.content.decode()
 
+    # Results are reused for a bit
+    clear_cached_access(integration1, new_hire2)
+
     with patch(
-        "admin.integrations.models.Integration.user_exists", Mock(return_value=None)
+        "admin.integrations.models.Integration.user_exists_steps",
+        Mock(side_effect=steps_without_requests(None)),
     ):
         # New hire has no account
         url = reverse(
@@ -1727,10 +1747,182 @@ def test_new_hire_access_per_integration(
 
         response = client.get(url)
 
+        assert response.status_code == 286
         assert integration1.name in response.content.decode()
         assert "Error when trying to reach service" in response.content.decode()
 
 
+@pytest.mark.django_db
+def test_new_hire_access_checks_in_background(
+    client, django_user_model, new_hire_factory, custom_integration_factory
+):
+    client.force_login(
+        django_user_model.objects.create(role=get_user_model().Role.ADMIN)
+    )
+
+    new_hire1 = new_hire_factory(email="stan@example.com")
+    fast = custom_integration_factory(name="Asana")
+    slow = custom_integration_factory(name="Notion")
+    broken = custom_integration_factory(name="Jira")
+    for integration in [fast, slow, broken]:
+        integration.manifest["exists"]["url"] = (
+            f"https://{integration.name}.example.com/users/{{{{email}}}}"
+        )
+        integration.manifest["exists"]["status_code"] = ["200"]
+        integration.save()
+    # Can't be rendered, so checking it raises
+    broken.manifest["exists"]["url"] = "https://jira.example.com/{% if %}"
+    broken.save()
+
+    release = threading.Event()
+
+    def send_request(method, url, **kwargs):
+        if "Notion" in url:
+            release.wait(5)
+        return Mock(
+            status_code=200, json=lambda: {"email": "stan@example.com"}, text=""
+        )
+
+    def poll(integration):
+        return client.get(
+            reverse(
+                "people:user_check_integration", args=[new_hire1.id, integration.id]
+            )
+        )
+
+    # The page only starts the checks, all cards are loading and poll for the outcome
+    with patch("admin.integrations.access.async_task") as mock_async_task:
+        response = client.get(reverse("people:new_hire_access", args=[new_hire1.id]))
+        for integration in [fast, slow, broken]:
+            assert (
+                reverse(
+                    "people:user_check_integration",
+                    args=[new_hire1.id, integration.id],
+                )
+                in response.content.decode()
+            )
+        assert response.content.decode().count("Checking status") == 3
+
+        # Polling (or opening the page again) doesn't start them again
+        assert poll(fast).status_code == 200
+        client.get(reverse("people:new_hire_access", args=[new_hire1.id]))
+
+    mock_async_task.assert_called_once()
+    assert mock_async_task.call_args.args == (
+        "admin.integrations.tasks.check_access",
+        [fast.id, slow.id, broken.id],
+        new_hire1.id,
+    )
+
+    outcomes = []
+
+    def iter_access_and_poll(integrations, user):
+        for integration, found_user in iter_access(integrations, user):
+            yield integration, found_user
+            # The outcome got stored by now
+            outcomes.append(integration)
+            if len(outcomes) == 2:
+                # The slow check doesn't hold back the other cards
+                assert {broken, fast} == set(outcomes)
+                response = poll(fast)
+                assert response.status_code == 286
+                assert "Activated" in response.content.decode()
+                response = poll(broken)
+                assert response.status_code == 286
+                assert "Error when trying to reach service" in response.content.decode()
+                assert "Checking status" in poll(slow).content.decode()
+                release.set()
+
+    with (
+        patch("requests.Session.request", Mock(side_effect=send_request)),
+        patch("admin.integrations.access.iter_access", iter_access_and_poll),
+    ):
+        check_access([fast.id, slow.id, broken.id], new_hire1.id)
+
+    assert outcomes == [broken, fast, slow]
+    response = poll(slow)
+    assert response.status_code == 286
+    assert "Activated" in response.content.decode()
+
+
+@pytest.mark.django_db
+def test_new_hire_access_per_integration_cached(
+    client, django_user_model, new_hire_factory, custom_integration_factory
+):
+    client.force_login(
+        django_user_model.objects.create(role=get_user_model().Role.ADMIN)
+    )
+
+    new_hire1 = new_hire_factory(email="stan@example.com")
+    integration1 = custom_integration_factory(name="Asana")
+    integration2 = custom_integration_factory(name="Notion")
+
+    def send_request(method, url, **kwargs):
+        if "Notion" in url:
+            return Mock(status_code=500, json=lambda: {}, text="")
+        return Mock(
+            status_code=200, json=lambda: {"email": "stan@example.com"}, text=""
+        )
+
+    for integration in [integration1, integration2]:
+        integration.manifest["exists"]["url"] = (
+            f"https://{integration.name}.example.com/users/{{{{email}}}}"
+        )
+        integration.manifest["exists"]["status_code"] = ["200"]
+        integration.save()
+
+    def check(integration):
+        return client.get(
+            reverse(
+                "people:user_check_integration", args=[new_hire1.id, integration.id]
+            )
+        ).content.decode()
+
+    with patch(
+        "requests.Session.request", Mock(side_effect=send_request)
+    ) as request_mock:
+        assert "Activated" in check(integration1)
+        assert "Error when trying to reach service" in check(integration2)
+
+        # Outcomes are reused for a bit
+        assert "Activated" in check(integration1)
+        assert "Error when trying to reach service" in check(integration2)
+        assert request_mock.call_count == 2
+
+        # Opening the page checks the failed ones again
+        client.get(reverse("people:new_hire_access", args=[new_hire1.id]))
+
+    assert request_mock.call_count == 3
+    assert IntegrationTracker.objects.count() == 3
+
+    # Giving or revoking access checks again
+    with patch(
+        "admin.integrations.models.Integration.revoke_user_steps",
+        Mock(side_effect=steps_without_requests((True, ""))),
+    ):
+        with patch(
+            "admin.integrations.models.Integration.user_exists",
+            Mock(return_value=True),
+        ):
+            client.post(
+                reverse("people:toggle_access", args=[new_hire1.id, integration1.id])
+            )
+
+    with patch(
+        "requests.Session.request", Mock(side_effect=send_request)
+    ) as request_mock:
+        check(integration1)
+    assert request_mock.call_count == 1
+
+    # An unexpected error only fails the check
+    clear_cached_access(integration2, new_hire1)
+    with patch(
+        "admin.integrations.models.Integration.user_exists_steps",
+        Mock(side_effect=Exception("Something went wrong")),
+    ):
+        assert "Error when trying to reach service" in check(integration2)
+
+
 @pytest.mark.django_db
 def test_new_hire_access_per_integration_compact_view(
     client, django_user_model, new_hire_factory, custom_integration_factory
@@ -1743,7 +1935,8 @@ def test_new_hire_access_per_integration_compact_view(
     integration1 = custom_integration_factory(name="Asana")
 
     with patch(
-        "admin.integrations.models.Integration.user_exists", Mock(return_value=True)
+        "admin.integrations.models.Integration.user_exists_steps",
+        Mock(side_effect=steps_without_requests(True)),
     ):
         # New hire already has an account (email matches with return)
         url = reverse(
@@ -1753,6 +1946,7 @@ def test_new_hire_access_per_integration_compact_view(
 
         response = client.get(url)
 
+        assert response.status_code == 286
         assert "darkgreen" in response.content.decode()
 
 
@@ -2019,11 +2213,12 @@ def test_new_hire_access_revoke(
     url = reverse("people:revoke_all_access", args=[new_hire1.id])
     with (
         patch(
-            "admin.integrations.models.Integration.user_exists", Mock(return_value=True)
+            "admin.integrations.models.Integration.user_exists_steps",
+            Mock(side_effect=steps_without_requests(True)),
         ) as mock_user_exists,
         patch(
-            "admin.integrations.models.Integration.revoke_user",
-            Mock(return_value=(True, "")),
+            "admin.integrations.models.Integration.revoke_user_steps",
+            Mock(side_effect=steps_without_requests((True, ""))),
         ) as mock_revoke_user,
     ):
         # revoke all access
@@ -2930,75 +3125,71 @@ def test_fetching_employees(
 
 @pytest.mark.django_db
 @patch(
-    "admin.integrations.models.Integration.run_request",
+    "requests.Session.request",
     Mock(
         side_effect=(
-            [
-                True,
-                Mock(
-                    json=lambda: {
-                        "directory": {
-                            "employees": [
-                                {
-                                    "detail": {
-                                        "workEmail": "stan@chiefonboarding.com",
-                                        "firstName": "stan",
-                                        "lastName": "Do",
-                                    }
-                                },
-                                {
-                                    "detail": {
-                                        "workEmail": "test@chiefonboarding.com",
-                                        "firstName": "stan",
-                                        "lastName": "Do",
-                                    }
-                                },
-                                {
-                                    "detail": {
-                                        "workEmail": "jake@chiefonboarding.com",
-                                        "firstName": "Jake",
-                                        "lastName": "Weller",
-                                    }
-                                },
-                                {
-                                    "detail": {
-                                        "workEmail": "brian@chiefonboarding.com",
-                                        "firstName": "Brian",
-                                        "lastName": "Boss",
-                                    }
-                                },
-                            ]
-                        },
-                        "nextPageToken": "244",
-                    }
-                ),
-            ],
+            Mock(
+                status_code=200,
+                json=lambda: {
+                    "directory": {
+                        "employees": [
+                            {
+                                "detail": {
+                                    "workEmail": "stan@chiefonboarding.com",
+                                    "firstName": "stan",
+                                    "lastName": "Do",
+                                }
+                            },
+                            {
+                                "detail": {
+                                    "workEmail": "test@chiefonboarding.com",
+                                    "firstName": "stan",
+                                    "lastName": "Do",
+                                }
+                            },
+                            {
+                                "detail": {
+                                    "workEmail": "jake@chiefonboarding.com",
+                                    "firstName": "Jake",
+                                    "lastName": "Weller",
+                                }
+                            },
+                            {
+                                "detail": {
+                                    "workEmail": "brian@chiefonboarding.com",
+                                    "firstName": "Brian",
+                                    "lastName": "Boss",
+                                }
+                            },
+                        ]
+                    },
+                    "nextPageToken": "244",
+                },
+            ),
             # second call
-            [
-                True,
-                Mock(
-                    json=lambda: {
-                        "directory": {
-                            "employees": [
-                                {
-                                    "detail": {
-                                        "workEmail": "chris@chiefonboarding.com",
-                                        "firstName": "chris",
-                                        "lastName": "Do",
-                                    }
-                                },
-                                {
-                                    "detail": {
-                                        "workEmail": "emma@chiefonboarding.com",
-                                        "firstName": "emma",
-                                        "lastName": "Do",
-                                    }
-                                },
-                            ]
-                        }
+            Mock(
+                status_code=200,
+                json=lambda: {
+                    "directory": {
+                        "employees": [
+                            {
+                                "detail": {
+                                    "workEmail": "chris@chiefonboarding.com",
+                                    "firstName": "chris",
+                                    "lastName": "Do",
+                                }
+                            },
+                            {
+                                "detail": {
+                                    "workEmail": "emma@chiefonboarding.com",
+                                    "firstName": "emma",
+                                    "lastName": "Do",
+                                }
+                            },
+                        ]
                     }
-                ),
-            ],
+                },
+            ),
         )
     ),
 )
@@ -3036,105 +3227,93 @@ def test_fetching_employees_paginated_response(
 
 @pytest.mark.django_db
 @patch(
-    "admin.integrations.models.Integration.run_request",
+    "requests.Session.request",
     Mock(
         side_effect=(
             # first call
-            [
-                True,
-                Mock(
-                    json=lambda: {
-                        "employees": [
-                            {
-                                "workEmail": "stan1@chiefonboarding.com",
-                                "firstName": "stan",
-                                "lastName": "Do",
-                            },
-                        ],
-                        "nextPageToken": "244",
-                    }
-                ),
-            ],
+            Mock(
+                status_code=200,
+                json=lambda: {
+                    "employees": [
+                        {
+                            "workEmail": "stan1@chiefonboarding.com",
+                            "firstName": "stan",
+                            "lastName": "Do",
+                        },
+                    ],
+                    "nextPageToken": "244",
+                },
+            ),
             # second call
-            [
-                True,
-                Mock(
-                    json=lambda: {
-                        "employees": [
-                            {
-                                "workEmail": "stan2@chiefonboarding.com",
-                                "firstName": "stan",
-                                "lastName": "Do",
-                            },
-                        ],
-                        "nextPageToken": "244",
-                    }
-                ),
-            ],
+            Mock(
+                status_code=200,
+                json=lambda: {
+                    "employees": [
+                        {
+                            "workEmail": "stan2@chiefonboarding.com",
+                            "firstName": "stan",
+                            "lastName": "Do",
+                        },
+                    ],
+                    "nextPageToken": "244",
+                },
+            ),
             # third call
-            [
-                True,
-                Mock(
-                    json=lambda: {
-                        "employees": [
-                            {
-                                "workEmail": "stan3@chiefonboarding.com",
-                                "firstName": "stan",
-                                "lastName": "Do",
-                            },
-                        ],
-                        "nextPageToken": "244",
-                    }
-                ),
-            ],
+            Mock(
+                status_code=200,
+                json=lambda: {
+                    "employees": [
+                        {
+                            "workEmail": "stan3@chiefonboarding.com",
+                            "firstName": "stan",
+                            "lastName": "Do",
+                        },
+                    ],
+                    "nextPageToken": "244",
+                },
+            ),
             # fourth call
-            [
-                True,
-                Mock(
-                    json=lambda: {
-                        "employees": [
-                            {
-                                "workEmail": "stan4@chiefonboarding.com",
-                                "firstName": "stan",
-                                "lastName": "Do",
-                            },
-                        ],
-                        "nextPageToken": "244",
-                    }
-                ),
-            ],
+            Mock(
+                status_code=200,
+                json=lambda: {
+                    "employees": [
+                        {
+                            "workEmail": "stan4@chiefonboarding.com",
+                            "firstName": "stan",
+                            "lastName": "Do",
+                        },
+                    ],
+                    "nextPageToken": "244",
+                },
+            ),
             # fith call
-            [
-                True,
-                Mock(
-                    json=lambda: {
-                        "employees": [
-                            {
-                                "workEmail": "stan5@chiefonboarding.com",
-                                "firstName": "stan",
-                                "lastName": "Do",
-                            },
-                        ],
-                        "nextPageToken": "244",
-                    }
-                ),
-            ],
+            Mock(
+                status_code=200,
+                json=lambda: {
+                    "employees": [
+                        {
+                            "workEmail": "stan5@chiefonboarding.com",
+                            "firstName": "stan",
+                            "lastName": "Do",
+                        },
+                    ],
+                    "nextPageToken": "244",
+                },
+            ),
             # sixth call (doesn't exist)
-            [
-                True,
-                Mock(
-                    json=lambda: {
-                        "employees": [
-                            {
-                                "workEmail": "stan6@chiefonboarding.com",
-                                "firstName": "stan",
-                                "lastName": "Do",
-                            },
-                        ],
-                        "nextPageToken": "244",
-                    }
-                ),
-            ],
+            Mock(
+                status_code=200,
+                json=lambda: {
+                    "employees": [
+                        {
+                            "workEmail": "stan6@chiefonboarding.com",
+                            "firstName": "stan",
+                            "lastName": "Do",
+                        },
+                    ],
+                    "nextPageToken": "244",
+                },
+            ),
         )
     ),
 )
@@ -0,0 +1,217 @@
+from django.contrib.auth import get_user_model
+
+from admin.sequences.models import Condition
+from admin.sequences.triggers import rebuild_condition_schedule
+from organization.models import Organization
+
+# These m2m fields decide when a condition triggers, all others hold the items
+TRIGGER_FIELDS = ("condition_to_do", "condition_admin_tasks")
+
+
+class AssignedCondition:
+    """
+    In memory version of a condition of a user, with the ids of the items that
+    trigger it. The condition might not be saved yet.
+    """
+
+    def __init__(self, condition, to_do_ids, admin_task_ids):
+        self.condition = condition
+        self.to_do_ids = to_do_ids
+        self.admin_task_ids = admin_task_ids
+
+    def matches(self, condition, to_do_ids, admin_task_ids):
+        # Same rules as merging conditions one by one: timed conditions need to
+        # trigger at the same moment, item based ones on exactly the same items
+        own = self.condition
+        if own.condition_type != condition.condition_type:
+            return False
+        if condition.condition_type in [Condition.Type.BEFORE, Condition.Type.AFTER]:
+            return own.days == condition.days and own.time == condition.time
+        if condition.condition_type == Condition.Type.TODO:
+            return self.to_do_ids == to_do_ids
+        if condition.condition_type == Condition.Type.ADMIN_TASK:
+            return self.admin_task_ids == admin_task_ids
+        # Condition.Type.INTEGRATIONS_REVOKED, there is only one
+        return True
+
+
+def get_m2m_ids(field, condition_ids):
+    """
+    Get the ids of all items of one m2m field of the conditions in one query
+
+    :param field ManyToManyField: field of the condition model
+    :param condition_ids list: ids of the conditions
+    :return dict: {condition id: [item ids]}
+    """
+    through = field.remote_field.through
+    items = {}
+    for condition_id, item_id in (
+        through.objects.filter(**{f"{field.m2m_field_name()}_id__in": condition_ids})
+        .order_by("id")
+        .values_list(
+            f"{field.m2m_field_name()}_id", f"{field.m2m_reverse_field_name()}_id"
+        )
+    ):
+        items.setdefault(condition_id, []).append(item_id)
+    return items
+
+
+def assign_sequences(sequences, users):
+    """
+    Add the conditions of one or more sequences to one or more users. Conditions
+    that trigger at the same moment (or on the same items) as a condition the user
+    already has get merged into that one, all others are copied to the user.
+
+    Everything gets compared in memory and written with one bulk insert per table,
+    so the amount of queries doesn't depend on the amount of users or conditions.
+
+    :param sequences list: list or queryset of sequences, assigned in that order
+    :param users list: list or queryset of users
+    """
+    sequences = list(sequences)
+    users = list(users)
+    if not len(sequences) or not len(users):
+        return
+
+    # The conditions of the sequences, with all their items
+    sequence_conditions = list(
+        Condition.objects.filter(sequence__in=sequences).order_by("id")
+    )
+    sequence_condition_ids = [condition.id for condition in sequence_conditions]
+    sequence_items = {
+        field.name: get_m2m_ids(field, sequence_condition_ids)
+        for field in Condition._meta.many_to_many
+    }
+
+    # The conditions the users already have
+    user_conditions_through = get_user_model().conditions.through
+    user_condition_ids = list(
+        user_conditions_through.objects.filter(user__in=users)
+        .order_by("condition_id")
+        .values_list("user_id", "condition_id")
+    )
+    existing_conditions = Condition.objects.in_bulk(
+        [condition_id for _user_id, condition_id in user_condition_ids]
+    )
+    existing_triggers = {
+        field.name: get_m2m_ids(field, list(existing_conditions.keys()))
+        for field in Condition._meta.many_to_many
+        if field.name in TRIGGER_FIELDS
+    }
+
+    assigned = {user.id: [] for user in users}
+    for user_id, condition_id in user_condition_ids:
+        assigned[user_id].append(
+            AssignedCondition(
+                existing_conditions[condition_id],
+                frozenset(existing_triggers["condition_to_do"].get(condition_id, [])),
+                frozenset(
+                    existing_triggers["condition_admin_tasks"].get(condition_id, [])
+                ),
+            )
+        )
+
+    # Walk through the conditions like they would have been added one by one
+    new_conditions = []
+    # [(AssignedCondition, sequence condition id)], copy the items of the second
+    # into the first
+    merged_conditions = []
+    conditions_to_process = []
+    for sequence in sequences:
+        for sequence_condition in sequence_conditions:
+            if sequence_condition.sequence_id != sequence.id:
+                continue
+
+            if sequence_condition.condition_type not in [
+                Condition.Type.BEFORE,
+                Condition.Type.AFTER,
+                Condition.Type.TODO,
+                Condition.Type.ADMIN_TASK,
+                Condition.Type.INTEGRATIONS_REVOKED,
+            ]:
+                # Condition (always just one) that will be assigned directly
+                # (type == 3). Just run the condition with the users
+                conditions_to_process.append(sequence_condition)
+                continue
+
+            to_do_ids = frozenset(
+                sequence_items["condition_to_do"].get(sequence_condition.id, [])
+            )
+            admin_task_ids = frozenset(
+                sequence_items["condition_admin_tasks"].get(sequence_condition.id, [])
+            )
+            for user in users:
+                user_condition = next(
+                    (
+                        user_condition
+                        for user_condition in assigned[user.id]
+                        if user_condition.matches(
+                            sequence_condition, to_do_ids, admin_task_ids
+                        )
+                    ),
+                    None,
+                )
+                if user_condition is None:
+                    # Copy the condition (including its triggers) to the user
+                    user_condition = AssignedCondition(
+                        Condition(
+                            condition_type=sequence_condition.condition_type,
+                            days=sequence_condition.days,
+                            time=sequence_condition.time,
+                        ),
+                        to_do_ids,
+                        admin_task_ids,
+                    )
+                    assigned[user.id].append(user_condition)
+                    new_conditions.append((user.id, user_condition))
+                merged_conditions.append((user_condition, sequence_condition.id))
+
+    Condition.objects.bulk_create(
+        [user_condition.condition for _user_id, user_condition in new_conditions]
+    )
+
+    # Copy the triggers to the new conditions and the items to all of them
+    for field in Condition._meta.many_to_many:
+        through = field.remote_field.through
+        condition_attname = f"{field.m2m_field_name()}_id"
+        item_attname = f"{field.m2m_reverse_field_name()}_id"
+        rows = {}
+        if field.name in TRIGGER_FIELDS:
+            for _user_id, user_condition in new_conditions:
+                item_ids = (
+                    user_condition.to_do_ids
+                    if field.name == "condition_to_do"
+                    else user_condition.admin_task_ids
+                )
+                for item_id in item_ids:
+                    rows[(user_condition.condition.id, item_id)] = None
+        else:
+            for user_condition, sequence_condition_id in merged_conditions:
+                for item_id in sequence_items[field.name].get(
+                    sequence_condition_id, []
+                ):
+                    rows[(user_condition.condition.id, item_id)] = None
+
+        through.objects.bulk_create(
+            [
+                through(**{condition_attname: condition_id, item_attname: item_id})
+                for condition_id, item_id in rows
+            ],
+            ignore_conflicts=True,
+        )
+
+    user_conditions_through.objects.bulk_create(
+        [
+            user_conditions_through(
+                user_id=user_id, condition_id=user_condition.condition.id
+            )
+            for user_id, user_condition in new_conditions
+        ]
+    )
+
+    for sequence_condition in conditions_to_process:
+        sequence_condition.process_condition_for_users(users)
+
+    # Update when the timed conditions will trigger
+    org = Organization.object.get()
+    rebuild_condition_schedule(users, org.timezone, org.workday_calendar)
@@ -1,8 +1,5 @@
 from django.utils.translation import gettext as _
 
-from admin.badges.models import Badge
-from admin.resources.models import Resource
-from admin.to_do.models import ToDo
 from organization.models import Notification, Organization
 from organization.utils import send_email_with_notification
 
@@ -21,74 +18,11 @@ def send_sequence_message(new_hire, admin, message, subject):
     )
 
 
-def send_sequence_update_message(all_notifications, new_hire):
+def send_sequence_update_message(update, new_hire):
     # used to send updates to new hires based on things that got assigned to them
     org = Organization.object.get()
     subject = _("Here is an update!")
-    blocks = []
-
-    notifications = all_notifications.filter(
-        notification_type=Notification.Type.ADDED_TODO
-    )
-    if notifications.exists():
-        blocks.append(
-            {
-                "type": "paragraph",
-                "data": {
-                    "text": (
-                        _("Todo item")
-                        if notifications.count() == 1
-                        else _("Todo items")
-                    )
-                },
-            }
-        )
-        text = ""
-        for to_do in ToDo.objects.filter(
-            id__in=notifications.values_list("item_id", flat=True)
-        ):
-            text += f"- {to_do.name} <br />"
-        blocks.append({"type": "quote", "data": {"text": text}})
-
-    notifications = all_notifications.filter(
-        notification_type=Notification.Type.ADDED_RESOURCE
-    )
-    if notifications.exists():
-        blocks.append(
-            {
-                "type": "paragraph",
-                "data": {
-                    "text": (
-                        _("Resource") if notifications.count() == 1 else _("Resources")
-                    )
-                },
-            }
-        )
-        text = ""
-        for i in Resource.objects.filter(
-            id__in=notifications.values_list("item_id", flat=True)
-        ):
-            text += f"- {i.name} <br />"
-        blocks.append({"type": "quote", "data": {"text": text}})
-
-    notifications = all_notifications.filter(
-        notification_type=Notification.Type.ADDED_BADGE
-    )
-    if notifications.exists():
-        blocks.append(
-            {
-                "type": "paragraph",
-                "data": {
-                    "text": _("Badge") if notifications.count() == 1 else _("Badges")
-                },
-            }
-        )
-        text = ""
-        for i in Badge.objects.filter(
-            id__in=notifications.values_list("item_id", flat=True)
-        ):
-            text += f"- {i.name} <br />"
-        blocks.append({"type": "quote", "data": {"text": text}})
+    blocks = update.get_email_blocks()
 
     html_message = org.create_email({"org": org, "content": blocks, "user": new_hire})
     send_email_with_notification(
@@ -0,0 +1,141 @@
+# Generated by Django 5.2.7 on 2026-10-18 17:42
+
+from datetime import datetime, timedelta
+
+import django.db.models.deletion
+import pytz
+from django.conf import settings
+from django.db import migrations, models
+
+# Condition types at the time of this migration
+AFTER = 0
+BEFORE = 2
+
+
+# Firing times as they were calculated when this migration was written, so later
+# changes to the app code don't change what it does. There are no holidays yet.
+def is_workday(day):
+    return day.weekday() < 5
+
+
+def add_workdays(day, workdays):
+    step = 1 if workdays > 0 else -1
+    for _ in range(abs(workdays)):
+        day += timedelta(days=step)
+        while not is_workday(day):
+            day += timedelta(days=step)
+    return day
+
+
+def get_trigger_date(condition_type, days, start_day, termination_date):
+    if termination_date is not None:
+        if condition_type != BEFORE or days < 0:
+            return None
+        if not is_workday(termination_date):
+            days += 1
+        return add_workdays(termination_date, -days)
+
+    if start_day is None:
+        return None
+
+    if condition_type == BEFORE:
+        return start_day - timedelta(days=days) if days > 0 else None
+
+    if days < 1 or (days == 1 and not is_workday(start_day)):
+        return None
+
+    return add_workdays(start_day, days - 1)
+
+
+def get_fire_at(condition_type, days, time, start_day, termination_date, tz_name):
+    date = get_trigger_date(condition_type, days, start_day, termination_date)
+    if date is None:
+        return None
+
+    local_datetime = pytz.timezone(tz_name).localize(datetime.combine(date, time))
+    return local_datetime.astimezone(pytz.utc)
+
+
+def build_condition_schedules(apps, schema_editor):
+    User = apps.get_model("users", "User")
+    Organization = apps.get_model("organization", "Organization")
+    ConditionSchedule = apps.get_model("sequences", "ConditionSchedule")
+
+    org = Organization._default_manager.first()
+    if org is None:
+        return
+
+    users = {
+        user.id: user
+        for user in User.objects.filter(
+            models.Q(role=0, termination_date__isnull=True)
+            | models.Q(termination_date__isnull=False)
+        )
+    }
+    schedules = []
+    for user_condition in User.conditions.through.objects.filter(
+        user_id__in=users.keys(), condition__condition_type__in=[AFTER, BEFORE]
+    ).select_related("condition"):
+        user = users[user_condition.user_id]
+        condition = user_condition.condition
+        fire_at = get_fire_at(
+            condition.condition_type,
+            condition.days,
+            condition.time,
+            user.start_day,
+            user.termination_date,
+            org.timezone if user.timezone == "" else user.timezone,
+        )
+        if fire_at is not None:
+            schedules.append(
+                ConditionSchedule(
+                    user_id=user.id, condition_id=condition.id, fire_at=fire_at
+                )
+            )
+    ConditionSchedule.objects.bulk_create(schedules)
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("sequences", "0045_alter_condition_condition_type"),
+        ("organization", "0044_remove_organization_credentials_login_and_more"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ConditionSchedule",
+            fields=[
+                (
+                    "id",
+                    models.AutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("fire_at", models.DateTimeField(db_index=True)),
+                (
+                    "condition",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="schedules",
+                        to="sequences.condition",
+                    ),
+                ),
+                (
+                    "user",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="condition_schedules",
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+            ],
+            options={
+                "unique_together": {("user", "condition")},
+            },
+        ),
+        migrations.RunPython(build_condition_schedules, migrations.RunPython.noop),
+    ]
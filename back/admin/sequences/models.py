@@ -1,6 +1,9 @@
 from django.conf import settings
+from django.contrib.auth import get_user_model
 from django.db import models
 from django.db.models import Prefetch
+from django.db.models.signals import post_save
+from django.dispatch import receiver
 from django.template.loader import render_to_string
 from django.urls import reverse
 from django.utils.translation import gettext_lazy as _
@@ -82,117 +85,9 @@ class Sequence(models.Model):
         return self
 
     def assign_to_user(self, user):
-        # adding conditions
-        for sequence_condition in self.conditions.all():
-            user_condition = None
-
-            # Check what kind of condition it is
-            if sequence_condition.condition_type in [
-                Condition.Type.BEFORE,
-                Condition.Type.AFTER,
-            ]:
-                # Get the timed based condition or return None if not exist
-                user_condition = user.conditions.filter(
-                    condition_type=sequence_condition.condition_type,
-                    days=sequence_condition.days,
-                    time=sequence_condition.time,
-                ).first()
-
-            elif sequence_condition.condition_type == Condition.Type.TODO:
-                # For to_do items, filter all condition items to find if one matches
-                # Both the amount and the todos itself need to match exactly
-                conditions = user.conditions.filter(condition_type=Condition.Type.TODO)
-                original_condition_to_do_ids = (
-                    sequence_condition.condition_to_do.all().values_list(
-                        "id", flat=True
-                    )
-                )
-
-                for condition in conditions:
-                    # Quickly check if the amount of items match - if not match, drop
-                    if condition.condition_to_do.all().count() != len(
-                        original_condition_to_do_ids
-                    ):
-                        continue
-
-                    found_to_do_items = condition.condition_to_do.filter(
-                        id__in=original_condition_to_do_ids
-                    ).count()
-
-                    if found_to_do_items == len(original_condition_to_do_ids):
-                        # We found our match. Amount matches AND the todos match
-                        user_condition = condition
-                        break
-
-            elif sequence_condition.condition_type == Condition.Type.ADMIN_TASK:
-                # For admin to do items, filter all condition items to find if one
-                # matches. Both the amount and the admin to do itself need to match
-                # exactly
-                conditions = user.conditions.filter(
-                    condition_type=Condition.Type.ADMIN_TASK
-                )
-                original_condition_admin_tasks_ids = (
-                    sequence_condition.condition_admin_tasks.all().values_list(
-                        "id", flat=True
-                    )
-                )
+        from admin.sequences.assignment import assign_sequences
 
-                for condition in conditions:
-                    # Quickly check if the amount of items match - if not match, drop
-                    if condition.condition_admin_tasks.all().count() != len(  # noqa
-                        original_condition_admin_tasks_ids
-                    ):
-                        continue
-
-                    found_admin_tasks = condition.condition_admin_tasks.filter(
-                        id__in=original_condition_admin_tasks_ids
-                    ).count()
-
-                    if found_admin_tasks == len(original_condition_admin_tasks_ids):
-                        # We found our match. Amount matches AND the admin_tasks match
-                        user_condition = condition
-                        break
-
-            elif (
-                sequence_condition.condition_type == Condition.Type.INTEGRATIONS_REVOKED
-            ):
-                user_condition = user.conditions.filter(
-                    condition_type=Condition.Type.INTEGRATIONS_REVOKED
-                ).first()
-
-            else:
-                # Condition (always just one) that will be assigned directly (type == 3)
-                # Just run the condition with the new hire
-                sequence_condition.process_condition(user)
-                continue
-
-            # Let's add the condition to the new hire. Either through adding it to the
-            # exising one or creating a new one
-            if user_condition is not None:
-                # adding items to existing condition
-                user_condition.include_other_condition(sequence_condition)
-            else:
-                # duplicating condition and adding to user
-                # Force getting it, as we are about to duplicate it and set the pk to
-                # None
-                old_condition = Condition.objects.get(id=sequence_condition.id)
-
-                sequence_condition.pk = None
-                sequence_condition.sequence = None
-                sequence_condition.save()
-
-                # Add condition to_dos
-                sequence_condition.condition_to_do.set(
-                    old_condition.condition_to_do.all()
-                )
-
-                for condition_admin_task in old_condition.condition_admin_tasks.all():
-                    sequence_condition.condition_admin_tasks.add(condition_admin_task)
-                # Add all the things that get triggered
-                sequence_condition.include_other_condition(old_condition)
-
-                # Add newly created condition back to user
-                user.conditions.add(sequence_condition)
+        assign_sequences([self], [user])
 
     def remove_from_user(self, new_hire):
         from admin.admin_tasks.models import AdminTask
@@ -626,7 +521,10 @@ class IntegrationConfig(models.Model):
                 self.integration.revoke_user(user)
             else:
                 self.integration.execute(
-                    user, self.additional_data, retry_on_failure=True
+                    user,
+                    self.additional_data,
+                    retry_on_failure=True,
+                    defer_polling=True,
                 )
             return
 
@@ -879,6 +777,19 @@ class Condition(models.Model):
         return self, admin_tasks
 
     def process_condition(self, user, skip_notification=False):
+        self.process_condition_for_users([user], skip_notification)
+
+    def process_condition_for_users(self, users, skip_notification=False):
+        """
+        Add all items of this condition to the users. Every field gets added in one
+        insert for all users together, notifications are created in one go as well.
+
+        :param users list: list or queryset of users
+        :param skip_notification bool: mark the notifications as already sent
+        """
+        users = list(users)
+        notifications = []
+
         # Loop over all m2m fields and add the ones that can be easily added
         for field in [
             "to_do",
@@ -888,10 +799,34 @@ class Condition(models.Model):
             "introductions",
             "preboarding",
         ]:
-            for item in getattr(self, field).all():
-                getattr(user, field).add(item)
+            items = list(getattr(self, field).all())
+            if not len(items):
+                continue
 
-                Notification.objects.create(
+            # Skip the ones that users already have, like `.add()` would
+            user_field = get_user_model()._meta.get_field(field)
+            through = user_field.remote_field.through
+            user_attname = f"{user_field.m2m_field_name()}_id"
+            item_attname = f"{user_field.m2m_reverse_field_name()}_id"
+            existing = set(
+                through.objects.filter(
+                    **{
+                        f"{user_attname}__in": [user.id for user in users],
+                        f"{item_attname}__in": [item.id for item in items],
+                    }
+                ).values_list(user_attname, item_attname)
+            )
+            through.objects.bulk_create(
+                [
+                    through(**{user_attname: user.id, item_attname: item.id})
+                    for user in users
+                    for item in items
+                    if (user.id, item.id) not in existing
+                ]
+            )
+
+            notifications += [
+                Notification(
                     notification_type=item.notification_add_type,
                     extra_text=item.name,
                     created_for=user,
@@ -899,6 +834,11 @@ class Condition(models.Model):
                     notified_user=skip_notification,
                     public_to_new_hire=True,
                 )
+                for user in users
+                for item in items
+            ]
+
+        Notification.objects.bulk_create(notifications)
 
         # For the ones that aren't a quick copy/paste, follow back to their model and
         # execute them. It will also add an item to the notification model there.
@@ -909,4 +849,36 @@ class Condition(models.Model):
             "hardware",
         ]:
             for item in getattr(self, field).all():
-                item.execute(user)
+                for user in users:
+                    item.execute(user)
+
+
+class ConditionSchedule(models.Model):
+    """
+    Materialized firing time (in UTC) of a timed (BEFORE/AFTER) condition for a user.
+    Gets rebuilt whenever the conditions of a user change or when anything that has
+    an impact on the firing time changes (start day, termination date, timezone).
+    """
+
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name="condition_schedules",
+    )
+    condition = models.ForeignKey(
+        Condition, on_delete=models.CASCADE, related_name="schedules"
+    )
+    fire_at = models.DateTimeField(db_index=True)
+
+    class Meta:
+        unique_together = ["user", "condition"]
+
+
+@receiver(post_save, sender=Condition)
+def rebuild_condition_schedules(sender, instance, **kwargs):
+    # Conditions without a sequence are the copies that belong to users. If the
+    # type, days or time of those get changed, then the firing time changes too.
+    if instance.sequence_id is not None:
+        return
+    for user in instance.user_set.all():
+        user.rebuild_condition_schedule()
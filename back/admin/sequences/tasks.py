@@ -1,20 +1,17 @@
 from datetime import timedelta
 
+from django.conf import settings
 from django.contrib.auth import get_user_model
 from django.utils import timezone
-from django.utils.translation import gettext as _
+from django_q.brokers import get_broker
 from django_q.tasks import async_task
 
-from admin.badges.models import Badge
-from admin.introductions.models import Introduction
 from admin.sequences.emails import send_sequence_update_message
 from admin.sequences.models import Condition
-from organization.models import Notification, Organization
-from slack_bot.slack_intro import SlackIntro
-from slack_bot.slack_resource import SlackResource
-from slack_bot.slack_to_do import SlackToDo
-from slack_bot.utils import Slack, paragraph
-from users.models import ResourceUser, ToDoUser
+from admin.sequences.triggers import get_due_conditions, get_scheduled_conditions
+from admin.sequences.updates import SequenceUpdate
+from organization.models import Organization
+from slack_bot.utils import Slack
 
 
 def process_condition(condition_id, user_id, send_email=True):
@@ -31,100 +28,22 @@ def process_condition(condition_id, user_id, send_email=True):
     condition.process_condition(user)
 
     # Send notifications to user
-    notifications = Notification.objects.filter(
-        notification_type__in=[
-            Notification.Type.ADDED_TODO,
-            Notification.Type.ADDED_RESOURCE,
-            Notification.Type.ADDED_BADGE,
-            Notification.Type.ADDED_INTRODUCTION,
-        ],
-        created_for=user,
-        notified_user=False,
-    )
-
-    if not notifications.exists():
+    update = SequenceUpdate(user)
+    if not update:
         return
 
     if user.has_slack_account:
-        to_do_blocks = [
-            SlackToDo(
-                ToDoUser.objects.get(to_do__id=notif.item_id, user=user), user
-            ).get_block()
-            for notif in notifications.filter(
-                notification_type=Notification.Type.ADDED_TODO
-            )
-        ]
-
-        resource_blocks = [
-            SlackResource(
-                ResourceUser.objects.get(user=user, resource__id=notif.item_id), user
-            ).get_block()
-            for notif in notifications.filter(
-                notification_type=Notification.Type.ADDED_RESOURCE
-            )
-        ]
-
-        badge_blocks = []
-        for notif in notifications.filter(
-            notification_type=Notification.Type.ADDED_BADGE
-        ):
-            badge_blocks.append(
-                paragraph(
-                    _("*Congrats, you unlocked: %(item_name)s *")
-                    % {
-                        "item_name": user.personalize(
-                            Badge.objects.get(id=notif.item_id).name
-                        ),
-                    },
-                ),
-            )
-            badge_blocks += Badge.objects.get(id=notif.item_id).to_slack_block(user)
-
-        intro_blocks = [
-            SlackIntro(Introduction.objects.get(id=notif.item_id), user).format_block()
-            for notif in notifications.filter(
-                notification_type=Notification.Type.ADDED_INTRODUCTION
-            )
-        ]
-
-        if len(to_do_blocks):
-            # Send to do items separate as we need to update this block
-            Slack().send_message(
-                text=_("Here are some new items for you!"),
-                blocks=[
-                    paragraph(_("Here are some new items for you!")),
-                    *to_do_blocks,
-                ],
-                channel=user.slack_user_id,
-            )
-
-            if len(resource_blocks) or len(badge_blocks) or len(intro_blocks):
-                Slack().send_message(
-                    text=_("Here are some new items for you!"),
-                    blocks=[
-                        *intro_blocks,
-                        *badge_blocks,
-                        *resource_blocks,
-                    ],
-                    channel=user.slack_user_id,
-                )
-
-        else:
+        for message in update.get_slack_messages():
             Slack().send_message(
-                text=_("Here are some new items for you!"),
-                blocks=[
-                    paragraph(_("Here are some new items for you!")),
-                    *intro_blocks,
-                    *badge_blocks,
-                    *resource_blocks,
-                ],
+                text=message["text"],
+                blocks=message["blocks"],
                 channel=user.slack_user_id,
             )
     elif send_email:
-        send_sequence_update_message(notifications, user)
+        send_sequence_update_message(update, user)
 
     # Update notifications to not notify user again
-    notifications.update(notified_user=True)
+    update.mark_as_sent()
 
     # Update user amount completed
     user.update_progress()
@@ -139,8 +58,11 @@ def timed_triggers():
     if org is None:
         return
 
+    # The cursor is read and written on its own: the cached organization might be
+    # behind, and saving the organization would make every process drop its copy
+    org_cursor = Organization.objects.filter(pk=org.pk)
     current_datetime = timezone.now()
-    last_updated = org.timed_triggers_last_check
+    last_updated = org_cursor.values_list("timed_triggers_last_check", flat=True).get()
 
     # Round downwards (based on 5 minutes) - check if we might not be on 5/0 anymore.
     # A time of 16 minutes becomes 15
@@ -155,72 +77,108 @@ def timed_triggers():
         minute=last_updated.minute - off_by_minutes, second=0, microsecond=0
     )
 
+    if settings.TIMED_TRIGGERS_ENGINE == "schedule":
+        # The firing times are already known, so catching up after an outage is just a
+        # wider range on the schedule
+        if current_datetime > last_updated:
+            org_cursor.update(timed_triggers_last_check=current_datetime)
+            _enqueue_conditions(
+                get_scheduled_conditions(last_updated, current_datetime)
+            )
+        return
+
     # Generally this loop will only go through once. In the case of an outage, it will
     # walk through all the 5 minutes that it needs to catch up on based on the last
     # updated variable
     while current_datetime > last_updated:
         last_updated += timedelta(minutes=5)
-        org.timed_triggers_last_check = last_updated
-        org.save()
-
-        for user in get_user_model().new_hires.all():
-            amount_days = user.workday
-            amount_days_before = user.days_before_starting
-            current_time = user.get_local_time(last_updated).time()
-
-            # Get conditions before/after they started
-            # Generally, this should be only one, but just in case, we can handle more
-            conditions = Condition.objects.none()
-            if amount_days == 0:
-                # Before starting
-                conditions = user.conditions.filter(
-                    condition_type=Condition.Type.BEFORE,
-                    days=amount_days_before,
-                    time=current_time,
-                )
-            elif user.get_local_time(last_updated).weekday() < 5:
-                # On workday x
-                conditions = user.conditions.filter(
-                    condition_type=Condition.Type.AFTER,
-                    days=amount_days,
-                    time=current_time,
-                )
-
-            # Schedule conditions to be executed with new scheduled task, we do this to
-            # avoid long standing tasks. I.e. sending lots of emails might take more
-            # time.
-            for i in conditions:
-                async_task(
-                    process_condition,
-                    i.id,
-                    user.id,
-                    task_name=f"Process condition: {i.id} for {user.full_name}",
-                )
-
-        for user in get_user_model().offboarding.all():
-            amount_days_before = user.days_before_termination_date
-
-            if (
-                amount_days_before == -1
-                or user.get_local_time(last_updated).weekday() > 4  # 5 or 6 is weekend
-            ):
-                # we are past the termination date or in a weekend, move to the next
-                continue
-
-            current_time = user.get_local_time(last_updated).time()
+        org_cursor.update(timed_triggers_last_check=last_updated)
+
+        if settings.TIMED_TRIGGERS_ENGINE == "loop":
+            _trigger_conditions_per_user(last_updated, org.workday_calendar)
+        else:
+            _trigger_conditions_set_based(
+                last_updated, org.timezone, org.workday_calendar
+            )
+
+
+def _trigger_conditions_set_based(last_updated, org_timezone, calendar):
+    # Resolve all conditions for this tick at once
+    _enqueue_conditions(get_due_conditions(last_updated, org_timezone, calendar))
+
+
+def _enqueue_conditions(due_conditions):
+    # Share one broker connection for all the tasks that need to be created
+    broker = get_broker()
+    for condition_id, user_id, full_name in due_conditions:
+        async_task(
+            process_condition,
+            condition_id,
+            user_id,
+            task_name=f"Process condition: {condition_id} for {full_name}",
+            broker=broker,
+        )
+
+
+def _trigger_conditions_per_user(last_updated, calendar):
+    # Legacy engine: walks through every user and checks their conditions one by one
+    for user in get_user_model().new_hires.all():
+        amount_days = user.workday
+        amount_days_before = user.days_before_starting
+        current_time = user.get_local_time(last_updated).time()
+
+        # Get conditions before/after they started
+        # Generally, this should be only one, but just in case, we can handle more
+        conditions = Condition.objects.none()
+        if amount_days == 0:
+            # Before starting
             conditions = user.conditions.filter(
                 condition_type=Condition.Type.BEFORE,
                 days=amount_days_before,
                 time=current_time,
             )
+        elif calendar.is_workday(user.get_local_time(last_updated).date()):
+            # On workday x
+            conditions = user.conditions.filter(
+                condition_type=Condition.Type.AFTER,
+                days=amount_days,
+                time=current_time,
+            )
+
+        # Schedule conditions to be executed with new scheduled task, we do this to
+        # avoid long standing tasks. I.e. sending lots of emails might take more
+        # time.
+        for i in conditions:
+            async_task(
+                process_condition,
+                i.id,
+                user.id,
+                task_name=f"Process condition: {i.id} for {user.full_name}",
+            )
+
+    for user in get_user_model().offboarding.all():
+        amount_days_before = user.days_before_termination_date
 
-            # Schedule conditions to be executed with new scheduled task, we do this to
-            # avoid long standing tasks. I.e. sending lots of emails might take more
-            # time.
-            for i in conditions:
-                async_task(
-                    process_condition,
-                    i.id,
-                    user.id,
-                    task_name=f"Process condition: {i.id} for {user.full_name}",
-                )
+        if amount_days_before == -1 or not calendar.is_workday(
+            user.get_local_time(last_updated).date()
+        ):
+            # we are past the termination date or not on a workday, move to the next
+            continue
+
+        current_time = user.get_local_time(last_updated).time()
+        conditions = user.conditions.filter(
+            condition_type=Condition.Type.BEFORE,
+            days=amount_days_before,
+            time=current_time,
+        )
+
+        # Schedule conditions to be executed with new scheduled task, we do this to
+        # avoid long standing tasks. I.e. sending lots of emails might take more
+        # time.
+        for i in conditions:
+            async_task(
+                process_condition,
+                i.id,
+                user.id,
+                task_name=f"Process condition: {i.id} for {user.full_name}",
+            )
@@ -3,6 +3,7 @@ from datetime import timedelta
 from unittest.mock import Mock, patch
 
 import pytest
+from django.contrib.auth import get_user_model
 from django.core.cache import cache
 from django.urls import reverse
 from django.utils import timezone
@@ -38,6 +39,7 @@ from admin.sequences.forms import (
 )
 from admin.sequences.models import (
     Condition,
+    ConditionSchedule,
     ExternalMessage,
     IntegrationConfig,
     PendingAdminTask,
@@ -1289,6 +1291,226 @@ def test_sequence_trigger_two_people_same_time(
     assert new_hire2.to_do.all().count() == 1
 
 
+@pytest.mark.django_db
+@freeze_time("2022-05-13 08:00:00")
+def test_sequence_trigger_legacy_engine(
+    settings,
+    sequence_factory,
+    new_hire_factory,
+    condition_timed_factory,
+    to_do_factory,
+):
+    settings.TIMED_TRIGGERS_ENGINE = "loop"
+    org = Organization.object.get()
+    org.timed_triggers_last_check = timezone.now() - timedelta(minutes=5)
+    org.save()
+
+    new_hire1 = new_hire_factory()
+    to_do1 = to_do_factory()
+
+    seq = sequence_factory()
+    condition = condition_timed_factory(days=1, time="08:00")
+    condition.add_item(to_do1)
+    seq.conditions.add(condition)
+    new_hire1.add_sequences([seq])
+
+    timed_triggers()
+
+    assert new_hire1.to_do.all().count() == 1
+
+
+@pytest.mark.django_db
+@freeze_time("2022-05-13 08:00:00")
+@pytest.mark.parametrize("engine", ["schedule", "set"])
+def test_sequence_trigger_uses_local_time_of_user(
+    engine,
+    settings,
+    sequence_factory,
+    new_hire_factory,
+    employee_factory,
+    condition_timed_factory,
+    to_do_factory,
+):
+    settings.TIMED_TRIGGERS_ENGINE = engine
+    org = Organization.object.get()
+    org.timed_triggers_last_check = timezone.now() - timedelta(minutes=5)
+    org.save()
+
+    # 08:00 UTC is 10:00 in Amsterdam
+    new_hire_utc = new_hire_factory()
+    new_hire_ams = new_hire_factory(timezone="Europe/Amsterdam")
+    new_hire_later = new_hire_factory(start_day=datetime.date(2022, 5, 16))
+    emp = employee_factory(
+        termination_date=datetime.date(2022, 5, 13), timezone="Europe/Amsterdam"
+    )
+
+    to_do1 = to_do_factory()
+    to_do2 = to_do_factory()
+    to_do3 = to_do_factory()
+
+    seq = sequence_factory()
+    condition_eight = condition_timed_factory(days=1, time="08:00")
+    condition_eight.add_item(to_do1)
+    condition_ten = condition_timed_factory(days=1, time="10:00")
+    condition_ten.add_item(to_do2)
+    # 3 days before starting (monday)
+    condition_before = condition_timed_factory(
+        days=3, time="08:00", condition_type=Condition.Type.BEFORE
+    )
+    condition_before.add_item(to_do3)
+    seq.conditions.add(condition_eight, condition_ten, condition_before)
+
+    for user in [new_hire_utc, new_hire_ams, new_hire_later]:
+        user.add_sequences([seq])
+
+    offboarding_seq = sequence_factory(category=Sequence.Category.OFFBOARDING)
+    condition_last_day = condition_timed_factory(
+        days=0, time="10:00", condition_type=Condition.Type.BEFORE
+    )
+    condition_last_day.add_item(to_do3)
+    offboarding_seq.conditions.add(condition_last_day)
+    emp.add_sequences([offboarding_seq])
+
+    timed_triggers()
+
+    assert list(new_hire_utc.to_do.all()) == [to_do1]
+    assert list(new_hire_ams.to_do.all()) == [to_do2]
+    assert list(new_hire_later.to_do.all()) == [to_do3]
+    assert list(emp.to_do.all()) == [to_do3]
+
+
+@pytest.mark.django_db
+@freeze_time("2022-05-13 08:00:00")
+@pytest.mark.parametrize("engine", ["schedule", "set"])
+def test_sequence_trigger_query_count_does_not_grow_with_users(
+    engine,
+    settings,
+    django_assert_max_num_queries,
+    sequence_factory,
+    new_hire_factory,
+    condition_timed_factory,
+    to_do_factory,
+):
+    settings.TIMED_TRIGGERS_ENGINE = engine
+    org = Organization.object.get()
+    org.timed_triggers_last_check = timezone.now() - timedelta(minutes=5)
+    org.save()
+
+    seq = sequence_factory()
+    condition = condition_timed_factory(days=2, time="08:00")
+    condition.add_item(to_do_factory())
+    seq.conditions.add(condition)
+
+    for tz in ["", "Europe/Amsterdam", "America/New_York", "Asia/Tokyo"] * 5:
+        new_hire_factory(timezone=tz).add_sequences([seq])
+
+    # get org, update org, timezones and conditions
+    with django_assert_max_num_queries(4):
+        timed_triggers()
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize("engine", ["schedule", "set", "loop"])
+def test_sequence_trigger_skips_holidays(
+    engine,
+    settings,
+    sequence_factory,
+    new_hire_factory,
+    condition_timed_factory,
+    to_do_factory,
+):
+    settings.TIMED_TRIGGERS_ENGINE = engine
+    # Friday is a holiday
+    org = Organization.object.get()
+    org.holidays = [datetime.date(2022, 5, 13)]
+    org.save()
+
+    # Started on thursday, so the second workday is monday
+    new_hire = new_hire_factory(start_day=datetime.date(2022, 5, 12))
+    seq = sequence_factory()
+    condition = condition_timed_factory(days=2, time="08:00")
+    condition.add_item(to_do_factory())
+    seq.conditions.add(condition)
+    new_hire.add_sequences([seq])
+
+    for day, amount_of_to_dos in [("2022-05-13", 0), ("2022-05-16", 1)]:
+        with freeze_time(f"{day} 08:00:00"):
+            org.timed_triggers_last_check = timezone.now() - timedelta(minutes=5)
+            org.save()
+
+            timed_triggers()
+
+            assert new_hire.to_do.all().count() == amount_of_to_dos
+
+
+@pytest.mark.django_db
+@freeze_time("2022-05-13 08:00:00")
+def test_sequence_trigger_schedule_catches_up_missed_window(
+    sequence_factory, new_hire_factory, condition_timed_factory, to_do_factory
+):
+    # Triggers haven't run for a day, all missed conditions should fire at once
+    org = Organization.object.get()
+    org.timed_triggers_last_check = timezone.now() - timedelta(days=1)
+    org.save()
+
+    # Started yesterday (thursday)
+    new_hire = new_hire_factory(start_day=datetime.date(2022, 5, 12))
+    to_do1 = to_do_factory()
+    to_do2 = to_do_factory()
+    to_do3 = to_do_factory()
+
+    seq = sequence_factory()
+    # Yesterday at 08:00, that was already checked during the last run
+    condition_first_day = condition_timed_factory(days=1, time="08:00")
+    condition_first_day.add_item(to_do1)
+    # Yesterday at 12:00
+    condition_first_day_noon = condition_timed_factory(days=1, time="12:00")
+    condition_first_day_noon.add_item(to_do2)
+    # Today at 08:00
+    condition_second_day = condition_timed_factory(days=2, time="08:00")
+    condition_second_day.add_item(to_do3)
+    seq.conditions.add(
+        condition_first_day, condition_first_day_noon, condition_second_day
+    )
+    new_hire.add_sequences([seq])
+
+    timed_triggers()
+
+    assert set(new_hire.to_do.all()) == {to_do2, to_do3}
+
+    org.refresh_from_db()
+    assert org.timed_triggers_last_check == timezone.now()
+
+    # Running it again doesn't trigger anything new
+    timed_triggers()
+    assert new_hire.to_do.all().count() == 2
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize("engine", ["schedule", "set", "loop"])
+@freeze_time("2022-05-13 08:00:00")
+def test_timed_triggers_only_moves_cursor(
+    settings, engine, django_capture_on_commit_callbacks
+):
+    settings.TIMED_TRIGGERS_ENGINE = engine
+    org = Organization.object.get()
+    org.timed_triggers_last_check = timezone.now() - timedelta(minutes=10)
+    org.save()
+    # Cache the organization, then change it from somewhere else
+    Organization.object.get()
+    Organization.objects.filter(pk=org.pk).update(name="Changed")
+    version = cache.get(Organization.object.version_key)
+
+    with django_capture_on_commit_callbacks(execute=True):
+        timed_triggers()
+
+    org.refresh_from_db()
+    assert org.timed_triggers_last_check == timezone.now()
+    assert org.name == "Changed"
+    # Other processes keep their copy of the organization
+    assert cache.get(Organization.object.version_key) == version
+
+
 # MODEL TESTS
 
 
@@ -1624,6 +1846,110 @@ def test_sequence_assign_to_user_merge_integrations_revoked_condition(
     assert new_hire.conditions.all().first().to_do.count() == 3
 
 
+@pytest.mark.django_db
+@freeze_time("2022-05-13 08:00:00")
+def test_add_sequences_to_multiple_users(
+    django_assert_max_num_queries,
+    sequence_factory,
+    new_hire_factory,
+    condition_timed_factory,
+    condition_to_do_factory,
+    to_do_factory,
+):
+    to_do1, to_do2, to_do3, to_do4 = to_do_factory.create_batch(4)
+    trigger_to_do = to_do_factory()
+
+    sequence1 = sequence_factory()
+    condition = condition_timed_factory(days=1, time="08:00", sequence=sequence1)
+    condition.to_do.add(to_do1)
+    condition = condition_to_do_factory(sequence=sequence1)
+    condition.condition_to_do.set([trigger_to_do])
+    condition.to_do.add(to_do2)
+
+    # Both conditions trigger at the same moment as the ones of the first sequence
+    sequence2 = sequence_factory()
+    condition = condition_timed_factory(days=1, time="08:00", sequence=sequence2)
+    condition.to_do.add(to_do3)
+    condition = condition_to_do_factory(sequence=sequence2)
+    condition.condition_to_do.set([trigger_to_do])
+    condition.to_do.add(to_do4)
+
+    new_hires = new_hire_factory.create_batch(10)
+    # One of them already had a condition on the same day
+    existing_condition = condition_timed_factory(days=1, time="08:00")
+    new_hires[0].conditions.add(existing_condition)
+
+    # Amount of queries doesn't depend on the amount of users or conditions
+    with django_assert_max_num_queries(50):
+        get_user_model().objects.add_sequences(new_hires, [sequence1, sequence2])
+
+    for new_hire in new_hires:
+        assert new_hire.conditions.count() == 2
+        timed_condition = new_hire.conditions.get(condition_type=Condition.Type.AFTER)
+        assert set(timed_condition.to_do.all()) == {to_do1, to_do3}
+        to_do_condition = new_hire.conditions.get(condition_type=Condition.Type.TODO)
+        assert list(to_do_condition.condition_to_do.all()) == [trigger_to_do]
+        assert set(to_do_condition.to_do.all()) == {to_do2, to_do4}
+        assert new_hire.condition_schedules.count() == 1
+        assert (
+            Notification.objects.filter(
+                created_for=new_hire,
+                notification_type=Notification.Type.ADDED_SEQUENCE,
+            ).count()
+            == 2
+        )
+
+    # Merged into the existing condition
+    assert new_hires[0].conditions.filter(id=existing_condition.id).exists()
+    # Copies were made for all others
+    assert Condition.objects.filter(sequence__isnull=True).count() == 20
+
+
+@pytest.mark.django_db
+@freeze_time("2022-05-13 08:00:00")
+def test_condition_schedule_follows_user_and_condition_changes(
+    sequence_factory,
+    new_hire_factory,
+    condition_timed_factory,
+    condition_to_do_factory,
+    to_do_factory,
+):
+    new_hire = new_hire_factory(start_day=datetime.date(2022, 5, 13))
+
+    seq = sequence_factory()
+    condition = condition_timed_factory(days=2, time="08:00")
+    condition.add_item(to_do_factory())
+    seq.conditions.add(condition, condition_to_do_factory())
+    new_hire.add_sequences([seq])
+
+    # Only the timed condition is scheduled, second workday is next monday
+    schedule = ConditionSchedule.objects.get(user=new_hire)
+    assert schedule.fire_at == datetime.datetime(2022, 5, 16, 8, tzinfo=datetime.UTC)
+
+    # Changing the timezone changes the moment (in UTC)
+    new_hire.timezone = "Europe/Amsterdam"
+    new_hire.save()
+    schedule = ConditionSchedule.objects.get(user=new_hire)
+    assert schedule.fire_at == datetime.datetime(2022, 5, 16, 6, tzinfo=datetime.UTC)
+
+    # Changing the start day moves it
+    new_hire.start_day = datetime.date(2022, 5, 16)
+    new_hire.save()
+    schedule = ConditionSchedule.objects.get(user=new_hire)
+    assert schedule.fire_at == datetime.datetime(2022, 5, 17, 6, tzinfo=datetime.UTC)
+
+    # Changing the condition of the user moves it as well
+    user_condition = new_hire.conditions.get(condition_type=Condition.Type.AFTER)
+    user_condition.time = "10:00"
+    user_condition.save()
+    schedule = ConditionSchedule.objects.get(user=new_hire)
+    assert schedule.fire_at == datetime.datetime(2022, 5, 17, 8, tzinfo=datetime.UTC)
+
+    # Removing the sequence removes the condition and its schedule
+    new_hire.remove_sequence(seq)
+    assert not ConditionSchedule.objects.filter(user=new_hire).exists()
+
+
 @pytest.mark.django_db
 def test_sequence_add_unconditional_item(
     sequence_factory,
@@ -1668,6 +1994,51 @@ def test_sequence_add_unconditional_item(
     assert new_hire.preboarding.all().count() == 2
 
 
+@pytest.mark.django_db
+def test_process_condition_for_users(
+    django_assert_max_num_queries,
+    new_hire_factory,
+    condition_with_items_factory,
+    badge_factory,
+):
+    condition = condition_with_items_factory()
+    condition.badges.add(badge_factory())
+    # Those get executed per user
+    condition.admin_tasks.clear()
+    condition.external_messages.clear()
+    condition.integration_configs.clear()
+    new_hires = new_hire_factory.create_batch(10)
+
+    # One of them already has one of the to do items
+    existing_to_do = condition.to_do.first()
+    new_hires[0].to_do.add(existing_to_do)
+
+    with django_assert_max_num_queries(25):
+        condition.process_condition_for_users(new_hires, skip_notification=True)
+
+    amount_of_items = (
+        condition.to_do.count()
+        + condition.resources.count()
+        + condition.badges.count()
+        + condition.appointments.count()
+        + condition.introductions.count()
+        + condition.preboarding.count()
+    )
+    for new_hire in new_hires:
+        assert set(new_hire.to_do.all()) == set(condition.to_do.all())
+        assert set(new_hire.resources.all()) == set(condition.resources.all())
+        assert set(new_hire.badges.all()) == set(condition.badges.all())
+        assert (
+            Notification.objects.filter(
+                created_for=new_hire, public_to_new_hire=True, notified_user=True
+            ).count()
+            == amount_of_items
+        )
+
+    # Not added twice
+    assert new_hires[0].to_do.filter(id=existing_to_do.id).count() == 1
+
+
 @pytest.mark.django_db
 def test_pending_email_message_item(
     new_hire_factory, admin_factory, pending_email_message_factory, mailoutbox
@@ -2062,6 +2433,57 @@ def test_condition_is_empty(condition_to_do_factory, to_do_factory):
 # TASKS
 
 
+@pytest.mark.django_db
+@pytest.mark.parametrize("amount", [1, 5])
+# Sending Slack messages in tests writes them to the cache (which takes queries)
+@pytest.mark.parametrize("slack_user_id, queries", [("test", 66), ("", 37)])
+def test_process_condition_query_count(
+    amount,
+    slack_user_id,
+    queries,
+    django_assert_max_num_queries,
+    condition_to_do_factory,
+    new_hire_factory,
+    to_do_factory,
+    resource_factory,
+    badge_factory,
+    introduction_factory,
+):
+    condition = condition_to_do_factory()
+    condition.to_do.add(*to_do_factory.create_batch(amount))
+    condition.resources.add(*resource_factory.create_batch(amount))
+    condition.badges.add(*badge_factory.create_batch(amount))
+    condition.introductions.add(*introduction_factory.create_batch(amount))
+    new_hire = new_hire_factory(slack_user_id=slack_user_id)
+
+    # Amount of queries doesn't depend on the amount of items
+    with django_assert_max_num_queries(queries):
+        process_condition(condition.id, new_hire.id)
+
+    assert not Notification.objects.filter(
+        created_for=new_hire, notified_user=False, public_to_new_hire=True
+    ).exists()
+
+
+@pytest.mark.django_db
+def test_send_email_after_process_condition(
+    mailoutbox, condition_to_do_factory, new_hire_factory, to_do_factory
+):
+    condition = condition_to_do_factory()
+    to_do1, to_do2 = to_do_factory.create_batch(2)
+    condition.to_do.add(to_do1, to_do2)
+    new_hire = new_hire_factory()
+
+    process_condition(condition.id, new_hire.id)
+
+    assert len(mailoutbox) == 1
+    assert mailoutbox[0].to == [new_hire.email]
+    html = mailoutbox[0].alternatives[0][0]
+    assert "Todo items" in html
+    assert to_do1.name in html
+    assert to_do2.name in html
+
+
 @pytest.mark.django_db
 def test_send_slack_message_after_process_condition(
     condition_to_do_factory,
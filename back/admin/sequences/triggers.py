@@ -0,0 +1,278 @@
+from datetime import datetime, timedelta
+
+import pytz
+from django.contrib.auth import get_user_model
+from django.db.models import Q
+
+from admin.sequences.models import Condition, ConditionSchedule
+
+
+def get_local_datetime(utc_datetime, tz_name):
+    # Same conversion as `User.get_local_time`, but without needing a user object
+    local_tz = pytz.timezone(tz_name)
+    utc = pytz.timezone("UTC").localize(utc_datetime.replace(tzinfo=None))
+    return local_tz.normalize(utc.astimezone(local_tz))
+
+
+def get_timezone_buckets(tick, org_timezone):
+    """
+    Group all timezones that are used by users who could have timed conditions by
+    their local time for this tick. Users without a timezone fall back on the
+    organization's timezone.
+
+    :param tick datetime: the (UTC) 5 minute window that is being processed
+    :param org_timezone str: the timezone of the organization
+    :return dict: {user timezone: local datetime}
+    """
+    timezones = (
+        get_user_model()
+        .objects.filter(
+            Q(role=get_user_model().Role.NEWHIRE, termination_date__isnull=True)
+            | Q(termination_date__isnull=False)
+        )
+        .order_by()
+        .values_list("timezone", flat=True)
+        .distinct()
+    )
+    return {
+        tz: get_local_datetime(tick, org_timezone if tz == "" else tz)
+        for tz in timezones
+    }
+
+
+def get_due_conditions(tick, org_timezone, calendar):
+    """
+    Resolve all BEFORE/AFTER conditions that should fire in this tick for all new
+    hires and offboarding users at once.
+
+    Timezones get bucketed first, so every local date/time only needs to be
+    calculated once. Then one query fetches all assigned conditions that match the
+    local time of their user. Only those few rows are checked on (work)days.
+
+    :param tick datetime: the (UTC) 5 minute window that is being processed
+    :param org_timezone str: the timezone of the organization
+    :param calendar WorkdayCalendar: the workdays of the organization
+    :return list: list of tuples (condition_id, user_id, user_full_name)
+    """
+    local_datetimes = get_timezone_buckets(tick, org_timezone)
+    if not len(local_datetimes):
+        return []
+
+    # Users in different timezones could share the same local time (i.e. UTC and
+    # Europe/London in the winter), group those to keep the query small
+    timezones_per_time = {}
+    for tz, local_datetime in local_datetimes.items():
+        timezones_per_time.setdefault(local_datetime.time(), []).append(tz)
+
+    time_filter = Q()
+    for local_time, timezones in timezones_per_time.items():
+        time_filter |= Q(user__timezone__in=timezones, condition__time=local_time)
+
+    user_conditions = (
+        get_user_model()
+        .conditions.through.objects.filter(
+            time_filter,
+            condition__condition_type__in=[
+                Condition.Type.BEFORE,
+                Condition.Type.AFTER,
+            ],
+        )
+        .filter(
+            Q(
+                user__role=get_user_model().Role.NEWHIRE,
+                user__termination_date__isnull=True,
+            )
+            | Q(user__termination_date__isnull=False)
+        )
+        .values_list(
+            "condition_id",
+            "condition__condition_type",
+            "condition__days",
+            "user_id",
+            "user__timezone",
+            "user__start_day",
+            "user__termination_date",
+            "user__first_name",
+            "user__last_name",
+        )
+        .order_by("user_id", "condition_id")
+    )
+
+    due_conditions = []
+    for (
+        condition_id,
+        condition_type,
+        days,
+        user_id,
+        user_timezone,
+        start_day,
+        termination_date,
+        first_name,
+        last_name,
+    ) in user_conditions:
+        local_datetime = local_datetimes[user_timezone]
+        local_day = local_datetime.date()
+        is_workday = calendar.is_workday(local_day)
+
+        if termination_date is not None:
+            # Offboarding: only conditions before the termination date, on workdays
+            is_due = (
+                is_workday
+                and condition_type == Condition.Type.BEFORE
+                and termination_date >= local_day
+                and calendar.workdays_between(local_day, termination_date) == days
+            )
+        elif start_day is None:
+            is_due = False
+        elif start_day > local_day:
+            # Before starting (not counting workdays here)
+            is_due = (
+                condition_type == Condition.Type.BEFORE
+                and (start_day - local_day).days == days
+            )
+        else:
+            # On workday x
+            is_due = (
+                is_workday
+                and condition_type == Condition.Type.AFTER
+                and calendar.workdays_between(start_day, local_day) + 1 == days
+            )
+
+        if is_due:
+            full_name = f"{first_name} {last_name}".strip()
+            due_conditions.append((condition_id, user_id, full_name))
+
+    return due_conditions
+
+
+def get_trigger_date(condition_type, days, start_day, termination_date, calendar):
+    """
+    Get the local date on which a timed condition will trigger. This follows the same
+    rules as the timed triggers: conditions before the start day trigger on any day,
+    conditions after the start day and before the termination date only on workdays.
+
+    :param condition_type int: `Condition.Type.BEFORE` or `Condition.Type.AFTER`
+    :param days int: the amount of days of the condition
+    :param start_day date: start day of the user (can be None)
+    :param termination_date date: termination date of the user (can be None)
+    :param calendar WorkdayCalendar: the workdays of the organization
+    :return date: the local date or None if it will never trigger
+    """
+    if termination_date is not None:
+        # Offboarding: the workday that is x workdays away from the termination date
+        if condition_type != Condition.Type.BEFORE or days < 0:
+            return None
+        if not calendar.is_workday(termination_date):
+            days += 1
+        return calendar.add_workdays(termination_date, -days)
+
+    if start_day is None:
+        return None
+
+    if condition_type == Condition.Type.BEFORE:
+        # Not counting workdays, day 0 is already the first workday
+        return start_day - timedelta(days=days) if days > 0 else None
+
+    if days < 1 or (days == 1 and not calendar.is_workday(start_day)):
+        # The first workday only triggers if the start day is a workday
+        return None
+
+    return calendar.add_workdays(start_day, days - 1)
+
+
+def get_fire_at(
+    condition_type, days, time, start_day, termination_date, tz_name, calendar
+):
+    """
+    Get the UTC datetime on which a timed condition will trigger for a user
+
+    :return datetime: the moment (UTC) or None if it will never trigger
+    """
+    date = get_trigger_date(condition_type, days, start_day, termination_date, calendar)
+    if date is None:
+        return None
+
+    local_datetime = pytz.timezone(tz_name).localize(datetime.combine(date, time))
+    return local_datetime.astimezone(pytz.utc)
+
+
+def rebuild_condition_schedule(users, org_timezone, calendar):
+    """
+    Recalculate the firing times of all timed conditions of the given users
+
+    :param users list: list or queryset of users
+    :param org_timezone str: the timezone of the organization (fallback for users)
+    :param calendar WorkdayCalendar: the workdays of the organization
+    """
+    users = list(users)
+    ConditionSchedule.objects.filter(user__in=users).delete()
+
+    users_by_id = {user.id: user for user in users}
+    user_conditions = (
+        get_user_model()
+        .conditions.through.objects.filter(
+            user__in=users,
+            condition__condition_type__in=[
+                Condition.Type.BEFORE,
+                Condition.Type.AFTER,
+            ],
+        )
+        .values_list(
+            "user_id",
+            "condition_id",
+            "condition__condition_type",
+            "condition__days",
+            "condition__time",
+        )
+    )
+
+    schedules = []
+    for user_id, condition_id, condition_type, days, time in user_conditions:
+        user = users_by_id[user_id]
+        if user.termination_date is None and user.role != user.Role.NEWHIRE:
+            continue
+
+        fire_at = get_fire_at(
+            condition_type,
+            days,
+            time,
+            user.start_day,
+            user.termination_date,
+            org_timezone if user.timezone == "" else user.timezone,
+            calendar,
+        )
+        if fire_at is not None:
+            schedules.append(
+                ConditionSchedule(
+                    user_id=user_id, condition_id=condition_id, fire_at=fire_at
+                )
+            )
+
+    ConditionSchedule.objects.bulk_create(schedules)
+
+
+def get_scheduled_conditions(start, end):
+    """
+    Get all conditions that are scheduled to fire after `start` and up until `end`.
+    This is a single range scan on the schedule, no matter how long the window is.
+
+    :param start datetime: exclusive lower bound (UTC)
+    :param end datetime: inclusive upper bound (UTC)
+    :return list: list of tuples (condition_id, user_id, user_full_name)
+    """
+    schedules = (
+        ConditionSchedule.objects.filter(fire_at__gt=start, fire_at__lte=end)
+        .filter(
+            Q(
+                user__role=get_user_model().Role.NEWHIRE,
+                user__termination_date__isnull=True,
+            )
+            | Q(user__termination_date__isnull=False)
+        )
+        .values_list("condition_id", "user_id", "user__first_name", "user__last_name")
+        .order_by("fire_at", "user_id", "condition_id")
+    )
+    return [
+        (condition_id, user_id, f"{first_name} {last_name}".strip())
+        for condition_id, user_id, first_name, last_name in schedules
+    ]
@@ -0,0 +1,150 @@
+from django.utils.translation import gettext as _
+
+from admin.badges.models import Badge
+from admin.introductions.models import Introduction
+from organization.models import Notification
+from slack_bot.slack_intro import SlackIntro
+from slack_bot.slack_resource import SlackResource
+from slack_bot.slack_to_do import SlackToDo
+from slack_bot.utils import paragraph
+from users.models import ResourceUser, ToDoUser
+
+
+def order_by_ids(items, ids, key):
+    # Keep the order of the notifications, skip items that don't exist anymore
+    items_by_id = {key(item): item for item in items}
+    return [items_by_id[item_id] for item_id in ids if item_id in items_by_id]
+
+
+class SequenceUpdate:
+    """
+    Everything that got added to a user and that the user hasn't been notified
+    about yet. All items get loaded with one query per type, so the same bundle can
+    be rendered for Slack and for email.
+    """
+
+    notification_types = [
+        Notification.Type.ADDED_TODO,
+        Notification.Type.ADDED_RESOURCE,
+        Notification.Type.ADDED_BADGE,
+        Notification.Type.ADDED_INTRODUCTION,
+    ]
+
+    def __init__(self, user):
+        self.user = user
+        self.notifications = list(
+            Notification.objects.filter(
+                notification_type__in=self.notification_types,
+                created_for=user,
+                notified_user=False,
+            ).values_list("id", "notification_type", "item_id")
+        )
+
+        item_ids = {
+            notification_type: [] for notification_type in self.notification_types
+        }
+        for _id, notification_type, item_id in self.notifications:
+            item_ids[notification_type].append(item_id)
+
+        to_do_ids = item_ids[Notification.Type.ADDED_TODO]
+        self.to_do_users = order_by_ids(
+            ToDoUser.objects.filter(user=user, to_do__id__in=to_do_ids).select_related(
+                "to_do"
+            ),
+            to_do_ids,
+            key=lambda to_do_user: to_do_user.to_do_id,
+        )
+        resource_ids = item_ids[Notification.Type.ADDED_RESOURCE]
+        self.resource_users = order_by_ids(
+            ResourceUser.objects.filter(
+                user=user, resource__id__in=resource_ids
+            ).select_related("resource"),
+            resource_ids,
+            key=lambda resource_user: resource_user.resource_id,
+        )
+        badge_ids = item_ids[Notification.Type.ADDED_BADGE]
+        self.badges = order_by_ids(
+            Badge.objects.filter(id__in=badge_ids),
+            badge_ids,
+            key=lambda badge: badge.id,
+        )
+        intro_ids = item_ids[Notification.Type.ADDED_INTRODUCTION]
+        self.introductions = order_by_ids(
+            Introduction.objects.filter(id__in=intro_ids).select_related(
+                "intro_person__profile_image"
+            ),
+            intro_ids,
+            key=lambda intro: intro.id,
+        )
+
+    def __bool__(self):
+        return len(self.notifications) > 0
+
+    def get_slack_messages(self):
+        """
+        Render the Slack messages for this update. To do items are sent separately,
+        as that message gets updated when they are completed.
+
+        :return list: list of dicts with `text` and `blocks`
+        """
+        user = self.user
+        text = _("Here are some new items for you!")
+
+        to_do_blocks = [
+            SlackToDo(to_do_user, user).get_block() for to_do_user in self.to_do_users
+        ]
+        resource_blocks = [
+            SlackResource(resource_user, user).get_block()
+            for resource_user in self.resource_users
+        ]
+        badge_blocks = []
+        for badge in self.badges:
+            badge_blocks.append(
+                paragraph(
+                    _("*Congrats, you unlocked: %(item_name)s *")
+                    % {"item_name": user.personalize(badge.name)},
+                ),
+            )
+            badge_blocks += badge.to_slack_block(user)
+        intro_blocks = [
+            SlackIntro(intro, user).format_block() for intro in self.introductions
+        ]
+
+        other_blocks = [*intro_blocks, *badge_blocks, *resource_blocks]
+        if not len(to_do_blocks):
+            return [{"text": text, "blocks": [paragraph(text), *other_blocks]}]
+
+        messages = [{"text": text, "blocks": [paragraph(text), *to_do_blocks]}]
+        if len(other_blocks):
+            messages.append({"text": text, "blocks": other_blocks})
+        return messages
+
+    def get_email_blocks(self):
+        """
+        Render the content (editor blocks) of the update email
+
+        :return list: list of blocks
+        """
+        blocks = []
+        for items, single, plural in [
+            ([i.to_do for i in self.to_do_users], _("Todo item"), _("Todo items")),
+            ([i.resource for i in self.resource_users], _("Resource"), _("Resources")),
+            (self.badges, _("Badge"), _("Badges")),
+        ]:
+            if not len(items):
+                continue
+
+            blocks.append(
+                {
+                    "type": "paragraph",
+                    "data": {"text": single if len(items) == 1 else plural},
+                }
+            )
+            text = "".join(f"- {item.name} <br />" for item in items)
+            blocks.append({"type": "quote", "data": {"text": text}})
+        return blocks
+
+    def mark_as_sent(self):
+        Notification.objects.filter(
+            id__in=[notification[0] for notification in self.notifications]
+        ).update(notified_user=True)
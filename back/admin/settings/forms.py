@@ -41,6 +41,7 @@ class OrganizationGeneralForm(forms.ModelForm):
                     Field("name"),
                     Field("language"),
                     Field("timezone"),
+                    Field("holidays"),
                     Field("new_hire_email"),
                     Field("new_hire_email_reminders"),
                     Field("new_hire_email_overdue_reminders"),
@@ -66,6 +67,7 @@ class OrganizationGeneralForm(forms.ModelForm):
             "name",
             "language",
             "timezone",
+            "holidays",
             "base_color",
             "accent_color",
             "logo",
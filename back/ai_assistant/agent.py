@@ -9,6 +9,7 @@ except ImportError:
 
 from django.conf import settings
 from django.contrib.auth import get_user_model
+from django.core.serializers.json import DjangoJSONEncoder
 
 from admin.sequences.models import Condition, Sequence
 from admin.to_do.models import ToDo
@@ -784,7 +785,7 @@ class ChiefOnboardingAgent:
 
         try:
             result = function_map[function_name](**arguments)
-            return json.dumps(result)
+            return json.dumps(result, cls=DjangoJSONEncoder)
         except Exception as e:
             return json.dumps({"error": str(e)})
 
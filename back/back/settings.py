@@ -184,6 +184,38 @@ SLACK_BOT_TOKEN = env("SLACK_BOT_TOKEN", default="")
 SLACK_DISABLE_AUTO_UPDATE_CHANNELS = env.bool(
     "SLACK_DISABLE_AUTO_UPDATE_CHANNELS", default=False
 )
+# The Slack client is shared within a process. Amount of connections it keeps open and
+# the seconds after which it checks if the token of the bot changed.
+SLACK_POOL_MAXSIZE = env.int("SLACK_POOL_MAXSIZE", default=10)
+SLACK_CLIENT_CACHE_TIMEOUT = env.int("SLACK_CLIENT_CACHE_TIMEOUT", default=30)
+# Messages of tasks (i.e. the daily updates of new hires) go through a queue that keeps
+# the rate limits of Slack (calls per minute) and backs off when Slack asks for it
+SLACK_QUEUE_MESSAGES = env.bool("SLACK_QUEUE_MESSAGES", default=True)
+SLACK_QUEUE_BATCH_SIZE = env.int("SLACK_QUEUE_BATCH_SIZE", default=100)
+SLACK_QUEUE_MAX_CONCURRENT = env.int("SLACK_QUEUE_MAX_CONCURRENT", default=4)
+SLACK_QUEUE_MAX_ATTEMPTS = env.int("SLACK_QUEUE_MAX_ATTEMPTS", default=5)
+SLACK_QUEUE_DRAIN_SECONDS = env.int("SLACK_QUEUE_DRAIN_SECONDS", default=50)
+SLACK_RATE_LIMITS = {
+    "default": 20,
+    "chat.postMessage": 600,
+    "chat.update": 50,
+    "chat.postEphemeral": 100,
+}
+SLACK_CHANNEL_RATE_LIMIT = env.int("SLACK_CHANNEL_RATE_LIMIT", default=60)
+# Slack user/channel ids are mapped to users through the shared cache (for this amount
+# of seconds) and in memory (max amount of ids and seconds)
+SLACK_USER_LOOKUP_TIMEOUT = env.int("SLACK_USER_LOOKUP_TIMEOUT", default=3600)
+SLACK_USER_LOOKUP_SIZE = env.int("SLACK_USER_LOOKUP_SIZE", default=10000)
+SLACK_USER_LOOKUP_LOCAL_TIMEOUT = env.int("SLACK_USER_LOOKUP_LOCAL_TIMEOUT", default=30)
+# Slack events get acknowledged right away and handled by a pool of threads (with a
+# limited amount of events waiting, the rest goes to the task queue). "task" hands
+# all heavy handlers to the task queue.
+SLACK_HANDLER_MODE = env("SLACK_HANDLER_MODE", default="thread")
+SLACK_HANDLER_WORKERS = env.int("SLACK_HANDLER_WORKERS", default=10)
+SLACK_HANDLER_QUEUE_SIZE = env.int("SLACK_HANDLER_QUEUE_SIZE", default=100)
+# Every process logs the queue depth and handler durations it saw (at most once per
+# this amount of seconds, 0 disables it)
+SLACK_HANDLER_METRICS_INTERVAL = env.int("SLACK_HANDLER_METRICS_INTERVAL", default=300)
 
 MIDDLEWARE = [
     "django.middleware.security.SecurityMiddleware",
@@ -358,6 +390,74 @@ CACHES = {
     }
 }
 
+# The organization is kept in memory. Requests and tasks check once if it changed,
+# anything else (i.e. the Slack bot) checks again after this amount of seconds
+ORGANIZATION_CACHE_TIMEOUT = env.int("ORGANIZATION_CACHE_TIMEOUT", default=30)
+
+# Compiled templates that are used to personalize texts. Amount of templates that are
+# kept in memory and the max length of a text to be kept.
+TEMPLATE_CACHE_SIZE = env.int("TEMPLATE_CACHE_SIZE", default=1024)
+TEMPLATE_CACHE_MAX_LENGTH = env.int("TEMPLATE_CACHE_MAX_LENGTH", default=20000)
+
+# Amount of signed S3 download urls that are kept in memory (per process)
+SIGNED_URL_CACHE_SIZE = env.int("SIGNED_URL_CACHE_SIZE", default=10000)
+
+# Requests of integrations go through pooled sessions (one per integration and host),
+# so connections are reused between steps. Timeouts are in seconds.
+INTEGRATION_POOL_MAXSIZE = env.int("INTEGRATION_POOL_MAXSIZE", default=10)
+INTEGRATION_SESSIONS_MAX = env.int("INTEGRATION_SESSIONS_MAX", default=100)
+INTEGRATION_CONNECT_TIMEOUT = env.int("INTEGRATION_CONNECT_TIMEOUT", default=10)
+INTEGRATION_READ_TIMEOUT = env.int("INTEGRATION_READ_TIMEOUT", default=120)
+# "concurrent" sends the steps of a manifest that don't depend on each other at the
+# same time, "sequential" sends them one by one
+INTEGRATION_EXECUTE_MODE = env("INTEGRATION_EXECUTE_MODE", default="sequential")
+INTEGRATION_MAX_CONCURRENT_REQUESTS = env.int(
+    "INTEGRATION_MAX_CONCURRENT_REQUESTS", default=10
+)
+# Seconds that the result of checking if a user has an account in an integration is
+# reused for
+INTEGRATION_ACCESS_CACHE_TIMEOUT = env.int(
+    "INTEGRATION_ACCESS_CACHE_TIMEOUT", default=60
+)
+# Seconds that a failed check is shown for on the access pages, and that a check in
+# the background can take before it gets started again
+INTEGRATION_ACCESS_CHECK_TIMEOUT = env.int(
+    "INTEGRATION_ACCESS_CHECK_TIMEOUT", default=120
+)
+# Seconds that the overview of all access of a user (`{{ access_overview }}` in texts)
+# is reused for. Giving or revoking access through an integration clears it.
+INTEGRATION_ACCESS_SNAPSHOT_TIMEOUT = env.int(
+    "INTEGRATION_ACCESS_SNAPSHOT_TIMEOUT", default=3600
+)
+
+# OAuth tokens of integrations get refreshed by a task when they expire within this
+# amount of seconds. Requests only refresh them if they expire within the margin.
+INTEGRATION_TOKEN_REFRESH_AHEAD = env.int(
+    "INTEGRATION_TOKEN_REFRESH_AHEAD", default=900
+)
+INTEGRATION_TOKEN_REFRESH_MARGIN = env.int(
+    "INTEGRATION_TOKEN_REFRESH_MARGIN", default=60
+)
+
+# Steps of integrations that get stored to be shown in the tracker. "all" stores every
+# step, "errors" only the failed ones and "sampled" the failed ones plus a fraction
+# (0-1) of the successful ones. Payloads longer than the max (in characters) get cut.
+INTEGRATION_TRACKER_MODE = env("INTEGRATION_TRACKER_MODE", default="all")
+INTEGRATION_TRACKER_SAMPLE_RATE = env.float(
+    "INTEGRATION_TRACKER_SAMPLE_RATE", default=0.1
+)
+INTEGRATION_TRACKER_MAX_PAYLOAD = env.int(
+    "INTEGRATION_TRACKER_MAX_PAYLOAD", default=50000
+)
+# Trackers older than this amount of days are removed, as are the oldest trackers of an
+# integration that has more than the max. 0 (default) keeps all of them.
+INTEGRATION_TRACKER_RETENTION_DAYS = env.int(
+    "INTEGRATION_TRACKER_RETENTION_DAYS", default=0
+)
+INTEGRATION_TRACKER_MAX_PER_INTEGRATION = env.int(
+    "INTEGRATION_TRACKER_MAX_PER_INTEGRATION", default=0
+)
+
 Q_CLUSTER = {
     "name": "DjangORM",
     "workers": 1,
@@ -373,6 +473,11 @@ Q_CLUSTER = {
 if DEBUG and RUNNING_TESTS:
     Q_CLUSTER["sync"] = True
 
+# Timed sequence triggers. "schedule" reads the precalculated firing times of all
+# conditions, "set" resolves all conditions of a 5 minute window in a few grouped
+# queries, "loop" is the (slower) legacy engine that checks every user
+TIMED_TRIGGERS_ENGINE = env("TIMED_TRIGGERS_ENGINE", default="schedule")
+
 # AWS
 AWS_S3_ENDPOINT_URL = env(
     "AWS_S3_ENDPOINT_URL", default="https://s3.eu-west-1.amazonaws.com"
@@ -383,6 +488,10 @@ AWS_STORAGE_BUCKET_NAME = env("AWS_STORAGE_BUCKET_NAME", default="")
 # fallback for old environment variable, AWS_DEFAULT_REGION should be prefered
 AWS_REGION = env("AWS_REGION", default="eu-west-1")
 AWS_DEFAULT_REGION = env("AWS_DEFAULT_REGION", default=AWS_REGION)
+# One client (and connection pool) is shared by all threads of a process
+AWS_S3_MAX_POOL_CONNECTIONS = env.int("AWS_S3_MAX_POOL_CONNECTIONS", default=25)
+AWS_S3_CONNECT_TIMEOUT = env.int("AWS_S3_CONNECT_TIMEOUT", default=5)
+AWS_S3_READ_TIMEOUT = env.int("AWS_S3_READ_TIMEOUT", default=30)
 
 # Twilio
 TWILIO_FROM_NUMBER = env("TWILIO_FROM_NUMBER", default="")
@@ -6,6 +6,7 @@ from django import template
 from django.utils import timezone
 
 from admin.sequences.models import Condition
+from misc.s3 import get_file_urls
 from organization.models import File
 
 register = template.Library()
@@ -19,10 +20,29 @@ def parse_to_json(content):
         return content
 
 
+@register.filter(name="download_urls")
+def download_urls(blocks):
+    """
+    Signed urls of all files that got uploaded in these form blocks. Use with
+    `full_download_url` to avoid fetching and signing the files one by one.
+    """
+    file_ids = [
+        block["answer"]
+        for block in blocks
+        if block.get("data", {}).get("type") == "upload"
+        and str(block.get("answer", "")).isdigit()
+    ]
+    files = File.objects.in_bulk([int(id) for id in file_ids])
+    urls = get_file_urls([file.key for file in files.values()])
+    return {str(id): urls[file.key] for id, file in files.items()}
+
+
 @register.filter(name="full_download_url")
-def full_download_url(id):
+def full_download_url(id, urls=None):
     if id == "":
         return ""
+    if urls is not None:
+        return urls.get(str(id), "")
     return File.objects.get(id=id).get_url()
 
 
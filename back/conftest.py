@@ -37,11 +37,16 @@ from admin.sequences.factories import (
 )
 from admin.to_do.factories import ToDoFactory
 from misc.factories import FileFactory
+from misc.s3 import reset_client, signed_urls
 from organization.factories import (
     NotificationFactory,
     OrganizationFactory,
     WelcomeMessageFactory,
 )
+from organization.models import Organization
+from slack_bot.client import reset_client as reset_slack_client
+from slack_bot.dispatch import handler_metrics
+from slack_bot.lookup import slack_user_lookup
 from users.factories import (
     AdminFactory,
     DepartmentFactory,
@@ -58,6 +63,13 @@ from users.factories import (
 
 @pytest.fixture(autouse=True)
 def run_around_tests(request, settings):
+    # Tests roll back the database, so don't keep the organization around
+    Organization.object.clear_cache()
+    signed_urls.clear()
+    reset_client()
+    reset_slack_client()
+    slack_user_lookup.clear()
+    handler_metrics.clear()
     if request.node.get_closest_marker("no_run_around_tests"):
         yield
         return
@@ -1,39 +1,108 @@
 import json
 
+from django.core.serializers.json import DjangoJSONEncoder
 from django.db import models
 from django.db.models import JSONField
 from django.utils.encoding import force_bytes
+from django.utils.functional import Promise, lazy
 
 from misc.fernet_fields import EncryptedField
 
 from .models import File
+from .s3 import get_file_urls
+
+
+class ContentFileURLs:
+    """
+    Signed urls of the files that are used in one content value. Nothing is fetched
+    until the first url is used, then all files get fetched with one query and
+    their urls get signed in one go.
+    """
+
+    def __init__(self):
+        self.file_ids = []
+        self._urls = None
+
+    def add(self, file_id):
+        self.file_ids.append(file_id)
+
+    def get_url(self, file_id):
+        if self._urls is None:
+            files = File.objects.in_bulk(
+                [int(id) for id in self.file_ids if str(id).isdigit()]
+            )
+            urls = get_file_urls([file.key for file in files.values()])
+            self._urls = {id: urls[file.key] for id, file in files.items()}
+        if not str(file_id).isdigit():
+            return ""
+        return self._urls.get(int(file_id), "")
+
+
+def _get_file_url(file_urls, file_id):
+    return file_urls.get_url(file_id)
+
+
+get_lazy_file_url = lazy(_get_file_url, str)
 
 
 class ContentJSONField(JSONField):
     """
     Custom JSONField renderer. It will update the signed url of the files before
     pushing it to the frontend. Signed urls expire. We will always want to fetch a new
-    one, so users don't bump into files that can't be fetched in the editor
+    one, so users don't bump into files that can't be fetched in the editor.
+
+    Urls are lazy: they only get signed when the content is rendered, so loading
+    items (i.e. in lists) doesn't cost anything extra.
     """
 
+    def __init__(self, *args, **kwargs):
+        # Can serialize the lazy urls (forms and validation)
+        kwargs.setdefault("encoder", DjangoJSONEncoder)
+        super().__init__(*args, **kwargs)
+
+    def deconstruct(self):
+        name, path, args, kwargs = super().deconstruct()
+        if kwargs.get("encoder") is DjangoJSONEncoder:
+            del kwargs["encoder"]
+        return name, path, args, kwargs
+
     def from_db_value(self, value, expression, connection):
         value = super().from_db_value(value, expression, connection)
-        if "blocks" not in value:
+        if not isinstance(value, dict) or "blocks" not in value:
             return value
 
+        file_urls = ContentFileURLs()
         for block in value["blocks"]:
-            if block["type"] in ["attaches", "image"]:
-                if "id" in block["data"]["file"]:
-                    block["data"]["file"]["url"] = File.objects.get(
-                        id=block["data"]["file"]["id"]
-                    ).get_url()
-                else:
-                    block["data"]["title"] = (
-                        "File is invalid. Please remove and try again:"
-                        + block["data"]["title"]
-                    )
+            if block["type"] not in ["attaches", "image", "video"]:
+                continue
+
+            file = block["data"].get("file", {})
+            if "id" in file:
+                file_urls.add(file["id"])
+                file["url"] = get_lazy_file_url(file_urls, file["id"])
+            elif block["type"] != "video":
+                block["data"]["title"] = (
+                    "File is invalid. Please remove and try again:"
+                    + block["data"]["title"]
+                )
         return value
 
+    def get_prep_value(self, value):
+        # Signed urls that haven't been used yet are not worth storing, they get
+        # generated again when the content is loaded
+        if isinstance(value, dict) and "blocks" in value:
+            value = {
+                **value,
+                "blocks": [self._without_lazy_url(block) for block in value["blocks"]],
+            }
+        return super().get_prep_value(value)
+
+    def _without_lazy_url(self, block):
+        file = block.get("data", {}).get("file") if isinstance(block, dict) else None
+        if not isinstance(file, dict) or not isinstance(file.get("url"), Promise):
+            return block
+        return {**block, "data": {**block["data"], "file": {**file, "url": ""}}}
+
 
 class EncryptedJSONField(EncryptedField, models.JSONField):
     # would normally return jsonb, which doesn't work with fernet
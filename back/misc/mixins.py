@@ -1,4 +1,3 @@
-from misc.models import File
 from misc.urlparser import URLParser
 
 
@@ -137,25 +136,19 @@ class ContentMixin:
             elif item["type"] == "attaches":
                 files_text = (
                     "<"
-                    + File.objects.get(id=item["data"]["file"]["id"]).get_url()
+                    + str(item["data"]["file"]["url"])
                     + "|"
                     + item["data"]["file"]["title"]
                     + ">"
                 )
                 slack_block["text"]["text"] = files_text
             elif item["type"] == "video":
-                files_text = (
-                    "<"
-                    + File.objects.get(id=item["data"]["file"]["id"]).get_url()
-                    + "|Watch video>"
-                )
+                files_text = "<" + str(item["data"]["file"]["url"]) + "|Watch video>"
                 slack_block["text"]["text"] = files_text
             elif item["type"] == "image":
                 slack_block = {
                     "type": "image",
-                    "image_url": File.objects.get(
-                        id=item["data"]["file"]["id"]
-                    ).get_url(),
+                    "image_url": str(item["data"]["file"]["url"]),
                     "alt_text": "image",
                 }
             elif item["type"] == "question":
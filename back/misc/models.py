@@ -4,7 +4,7 @@ from django.db import models
 from django.db.models.signals import pre_delete
 from django.dispatch import receiver
 
-from .s3 import S3
+from .s3 import S3, get_file_url, signed_urls
 
 
 class File(models.Model):
@@ -14,7 +14,7 @@ class File(models.Model):
     uuid = models.UUIDField(default=uuid.uuid4, editable=False)
 
     def get_url(self):
-        return S3().get_file(self.key)
+        return get_file_url(self.key)
 
     def __str__(self):
         return self.key
@@ -22,6 +22,7 @@ class File(models.Model):
 
 @receiver(pre_delete, sender=File)
 def remove_file(sender, instance, **kwargs):
+    signed_urls.delete(instance.key)
     S3().delete_file(instance.key)
 
 
@@ -1,16 +1,58 @@
+import threading
+import time as time_module
+from collections import OrderedDict
+
 import boto3
 from botocore.config import Config
 from django.conf import settings
 
+# Signed download urls are valid for (almost) a week
+DOWNLOAD_URL_EXPIRY = 604799
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_client():
+    """
+    Get the S3 client of this process. Creating a client is slow, so it only gets
+    created when it's needed for the first time. Clients are thread-safe, so all
+    threads share the same one (and its connection pool).
+
+    :return S3.Client:
+    """
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                # The default session is not thread-safe, use a separate one
+                _client = boto3.session.Session().client(
+                    "s3",
+                    settings.AWS_DEFAULT_REGION,
+                    endpoint_url=settings.AWS_S3_ENDPOINT_URL,
+                    config=Config(
+                        signature_version="s3v4",
+                        max_pool_connections=settings.AWS_S3_MAX_POOL_CONNECTIONS,
+                        connect_timeout=settings.AWS_S3_CONNECT_TIMEOUT,
+                        read_timeout=settings.AWS_S3_READ_TIMEOUT,
+                        retries={"max_attempts": 3, "mode": "standard"},
+                        tcp_keepalive=True,
+                    ),
+                )
+    return _client
+
+
+def reset_client():
+    # Next call will create a new client (i.e. when the credentials changed)
+    global _client
+    with _client_lock:
+        _client = None
+
 
 class S3:
     def __init__(self):
-        self.client = boto3.client(
-            "s3",
-            settings.AWS_DEFAULT_REGION,
-            endpoint_url=settings.AWS_S3_ENDPOINT_URL,
-            config=Config(signature_version="s3v4"),
-        )
+        self.client = get_client()
 
     def get_presigned_url(self, key, time=3600):
         return self.client.generate_presigned_url(
@@ -19,23 +61,126 @@ class S3:
             Params={"Bucket": settings.AWS_STORAGE_BUCKET_NAME, "Key": key},
         )
 
-    def get_file(self, key, time=604799):
+    def get_file(self, key, time=DOWNLOAD_URL_EXPIRY):
+        return self.get_files([key], time)[key]
+
+    def get_files(self, keys, time=DOWNLOAD_URL_EXPIRY):
+        """
+        Sign download urls for multiple keys at once
+
+        :param keys list: S3 keys
+        :param time int: amount of seconds the urls are valid
+        :return dict: {key: url}, url is an empty string if it couldn't be signed
+        """
         # If a user uploads some files and then removes the keys, this would error
         # Therefore the quick check here
         if settings.AWS_STORAGE_BUCKET_NAME == "":
-            return ""
-
-        try:
-            return self.client.generate_presigned_url(
-                ClientMethod="get_object",
-                ExpiresIn=time,
-                Params={"Bucket": settings.AWS_STORAGE_BUCKET_NAME, "Key": key},
-            )
-        except Exception:
-            print("Credentials are not set or incorrect")
-            return ""
+            return {key: "" for key in keys}
+
+        urls = {}
+        for key in keys:
+            try:
+                urls[key] = self.client.generate_presigned_url(
+                    ClientMethod="get_object",
+                    ExpiresIn=time,
+                    Params={"Bucket": settings.AWS_STORAGE_BUCKET_NAME, "Key": key},
+                )
+            except Exception:
+                print("Credentials are not set or incorrect")
+                # Will fail for the other keys as well
+                return {key: urls.get(key, "") for key in keys}
+        return urls
 
     def delete_file(self, key):
         return self.client.delete_object(
             Bucket=settings.AWS_STORAGE_BUCKET_NAME, Key=key
         )
+
+
+class SignedURLCache:
+    """
+    Signed download urls, keyed by the S3 key. An url is reused as long as at
+    least half of its lifetime is left, so an url that is handed out is always
+    valid for a while.
+
+    :param max_size int: amount of urls to keep
+    """
+
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self._urls = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        return self.get_many([key]).get(key)
+
+    def get_many(self, keys):
+        """
+        :param keys list: S3 keys
+        :return dict: {key: url} for the keys that have a valid url
+        """
+        now = time_module.monotonic()
+        urls = {}
+        with self._lock:
+            for key in keys:
+                if key not in self._urls:
+                    continue
+                url, expires_at = self._urls[key]
+                if expires_at - now < DOWNLOAD_URL_EXPIRY / 2:
+                    del self._urls[key]
+                    continue
+                self._urls.move_to_end(key)
+                urls[key] = url
+        return urls
+
+    def set(self, key, url):
+        self.set_many({key: url})
+
+    def set_many(self, urls):
+        expires_at = time_module.monotonic() + DOWNLOAD_URL_EXPIRY
+        with self._lock:
+            for key, url in urls.items():
+                self._urls[key] = (url, expires_at)
+                self._urls.move_to_end(key)
+            while len(self._urls) > self.max_size:
+                self._urls.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._urls.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._urls.clear()
+
+
+signed_urls = SignedURLCache(max_size=settings.SIGNED_URL_CACHE_SIZE)
+
+
+def get_file_urls(keys):
+    """
+    Get signed download urls for multiple keys. Urls get reused until they are
+    about to expire, the others get signed in one go.
+
+    :param keys list: S3 keys of the files
+    :return dict: {key: url}, url is an empty string if S3 is not set up
+    """
+    urls = signed_urls.get_many(keys)
+    missing_keys = [key for key in keys if key not in urls]
+    if len(missing_keys):
+        new_urls = S3().get_files(missing_keys)
+        # Don't keep failed attempts, the credentials might be fixed later on
+        signed_urls.set_many({key: url for key, url in new_urls.items() if url != ""})
+        urls.update(new_urls)
+    return urls
+
+
+def get_file_url(key):
+    """
+    Get a signed download url for this key. Urls get reused until they are about
+    to expire.
+
+    :param key str: S3 key of the file
+    :return str: signed url or empty string if S3 is not set up
+    """
+    return get_file_urls([key])[key]
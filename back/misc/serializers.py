@@ -2,7 +2,7 @@ from django.conf import settings
 from rest_framework import serializers
 
 from .models import File
-from .s3 import S3
+from .s3 import get_file_url
 
 
 class FileSerializer(serializers.ModelSerializer):
@@ -15,4 +15,4 @@ class FileSerializer(serializers.ModelSerializer):
     def get_file_url(self, obj):
         if settings.AWS_STORAGE_BUCKET_NAME == "" or obj.key == "":
             return ""
-        return S3().get_file(obj.key)
+        return get_file_url(obj.key)
@@ -0,0 +1,80 @@
+import hashlib
+import threading
+from collections import OrderedDict
+
+from django.conf import settings
+from django.template import Template
+
+
+class TemplateCache:
+    """
+    Least recently used cache of compiled templates, keyed by a hash of their
+    source. Compiled templates are thread-safe, so they can be shared between
+    threads.
+
+    :param max_size int: amount of templates to keep
+    :param max_length int: longer sources are compiled, but not kept
+    """
+
+    def __init__(self, max_size, max_length):
+        self.max_size = max_size
+        self.max_length = max_length
+        self.hits = 0
+        self.misses = 0
+        self._templates = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, text):
+        if self.max_size <= 0 or len(text) > self.max_length:
+            with self._lock:
+                self.misses += 1
+            return Template(text)
+
+        key = hashlib.sha256(text.encode()).hexdigest()
+        with self._lock:
+            template = self._templates.get(key)
+            if template is not None:
+                self._templates.move_to_end(key)
+                self.hits += 1
+                return template
+            self.misses += 1
+
+        # Compile outside of the lock, worst case it gets compiled twice
+        template = Template(text)
+        with self._lock:
+            self._templates[key] = template
+            self._templates.move_to_end(key)
+            while len(self._templates) > self.max_size:
+                self._templates.popitem(last=False)
+        return template
+
+    def stats(self):
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "size": len(self._templates),
+                "max_size": self.max_size,
+            }
+
+    def clear(self):
+        with self._lock:
+            self._templates.clear()
+            self.hits = 0
+            self.misses = 0
+
+
+template_cache = TemplateCache(
+    max_size=settings.TEMPLATE_CACHE_SIZE,
+    max_length=settings.TEMPLATE_CACHE_MAX_LENGTH,
+)
+
+
+def get_template(text):
+    """
+    Get the compiled template of this text (from the cache if possible)
+
+    :param text str: template source
+    :return Template:
+    """
+    return template_cache.get(text)
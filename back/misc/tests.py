@@ -1,4 +1,13 @@
+import threading
+
 import pytest
+from django.template import Context
+from freezegun import freeze_time
+
+from admin.to_do.models import ToDo
+from back.templatetags.general import download_urls, full_download_url
+from misc.s3 import S3, signed_urls
+from misc.template_cache import TemplateCache
 
 
 @pytest.mark.django_db
@@ -20,3 +29,189 @@ def test_to_slack_block_questions(new_hire_factory, to_do_factory):
 
     assert to_do.to_slack_block(new_hire) == [{'type': 'input', 'block_id': 'item-0', 'element': {'type': 'radio_buttons', 'options': [{'text': {'type': 'plain_text', 'text': 'test', 'emoji': True}, 'value': 'temp-54be'}, {'text': {'type': 'plain_text', 'text': 'tesstt', 'emoji': True}, 'value': 'temp-4eb2'}, {'text': {'type': 'plain_text', 'text': 'testttttt', 'emoji': True}, 'value': 'temp-7300'}, {'text': {'type': 'plain_text', 'text': 'test2', 'emoji': True}, 'value': 'temp-215a'}], 'action_id': 'item-0'}, 'label': {'type': 'plain_text', 'text': 'TEst', 'emoji': True}}, {'type': 'input', 'block_id': 'item-1', 'element': {'type': 'radio_buttons', 'options': [{'text': {'type': 'plain_text', 'text': 'option1', 'emoji': True}, 'value': 'temp-6272'}, {'text': {'type': 'plain_text', 'text': 'option2', 'emoji': True}, 'value': 'temp-6e14'}], 'action_id': 'item-1'}, 'label': {'type': 'plain_text', 'text': 'Another question', 'emoji': True}}]  # noqa: E231, E501
     # fmt: on
+
+
+@pytest.mark.django_db
+def test_template_cache():
+    cache = TemplateCache(max_size=2, max_length=20)
+
+    template = cache.get("Hi {{ first_name }}")
+    assert template.render(Context({"first_name": "John"})) == "Hi John"
+    assert cache.get("Hi {{ first_name }}") is template
+    assert cache.stats() == {"hits": 1, "misses": 1, "size": 1, "max_size": 2}
+
+    # Least recently used one gets removed
+    cache.get("Hi {{ last_name }}")
+    cache.get("Hi {{ first_name }}")
+    cache.get("Hi {{ email }}")
+    assert cache.stats()["size"] == 2
+    assert cache.get("Hi {{ first_name }}") is template
+    assert cache.get("Hi {{ last_name }}") is not None
+    assert cache.stats()["misses"] == 4
+
+    # Long texts are not kept
+    cache.get("Hello {{ first_name }} {{ last_name }}")
+    assert cache.stats()["misses"] == 5
+    assert cache.stats()["size"] == 2
+
+    cache.clear()
+    assert cache.stats() == {"hits": 0, "misses": 0, "size": 0, "max_size": 2}
+
+
+@pytest.mark.django_db
+def test_content_urls_are_signed_when_used(
+    django_assert_num_queries, monkeypatch, to_do_factory, file_factory
+):
+    signed_keys = []
+
+    def get_files(self, keys):
+        signed_keys.extend(keys)
+        return {key: f"https://aws.com/{key}" for key in keys}
+
+    monkeypatch.setattr(S3, "get_files", get_files)
+
+    files = file_factory.create_batch(3)
+    to_do = to_do_factory(
+        content={
+            "blocks": [
+                {"type": "image", "data": {"file": {"id": files[0].id}}},
+                {"type": "attaches", "data": {"file": {"id": files[1].id}}},
+                {"type": "video", "data": {"file": {"id": files[2].id}}},
+                {"type": "image", "data": {"file": {"id": 9999}}},
+                {"type": "image", "data": {"file": {}, "title": "test"}},
+            ]
+        }
+    )
+
+    # Loading items doesn't sign anything
+    with django_assert_num_queries(1):
+        to_do = ToDo.objects.get(id=to_do.id)
+    assert signed_keys == []
+
+    # All files are fetched at once
+    blocks = to_do.content["blocks"]
+    with django_assert_num_queries(1):
+        urls = [str(block["data"]["file"].get("url", "")) for block in blocks]
+    assert urls == [f"https://aws.com/{file.key}" for file in files] + ["", ""]
+    assert blocks[4]["data"]["title"] == (
+        "File is invalid. Please remove and try again:test"
+    )
+
+    # Signed urls are reused
+    to_do = ToDo.objects.get(id=to_do.id)
+    str(to_do.content["blocks"][0]["data"]["file"]["url"])
+    assert signed_keys == [file.key for file in files]
+
+    # Lazy urls are not stored
+    to_do.save()
+    to_do.refresh_from_db()
+    assert ToDo.objects.filter(content__blocks__0__data__file__url="").exists()
+
+
+@pytest.mark.django_db
+def test_lazy_file_urls_manager_or_buddy_tags(monkeypatch, to_do_factory, file_factory):
+    signed_keys = []
+
+    def get_files(self, keys):
+        signed_keys.extend(keys)
+        return {key: f"https://aws.com/{key}" for key in keys}
+
+    monkeypatch.setattr(S3, "get_files", get_files)
+    to_do = to_do_factory(
+        content={
+            "blocks": [
+                {"type": "paragraph", "data": {"text": "Ask {{ manager }}"}},
+                {"type": "image", "data": {"file": {"id": file_factory().id}}},
+            ]
+        }
+    )
+
+    to_do = ToDo.objects.get(id=to_do.id)
+    assert to_do.requires_assigned_manager_or_buddy == (True, False)
+    # Checking tags doesn't sign the urls
+    assert signed_keys == []
+
+
+@pytest.mark.django_db
+def test_signed_urls_are_renewed_before_expiry(monkeypatch, file_factory):
+    signed_keys = []
+
+    def get_files(self, keys):
+        signed_keys.extend(keys)
+        return {key: f"https://aws.com/{key}?{len(signed_keys)}" for key in keys}
+
+    monkeypatch.setattr(S3, "get_files", get_files)
+    monkeypatch.setattr(S3, "delete_file", lambda self, key: None)
+    file = file_factory()
+
+    with freeze_time("2022-05-13 08:00:00") as frozen_time:
+        url = file.get_url()
+        assert file.get_url() == url
+
+        # Still valid for more than half of its lifetime
+        frozen_time.tick(60 * 60 * 24 * 3)
+        assert file.get_url() == url
+
+        frozen_time.tick(60 * 60 * 24)
+        assert file.get_url() != url
+        assert len(signed_keys) == 2
+
+        # Gets removed with the file
+        file.delete()
+        assert signed_urls.get(file.key) is None
+
+
+@pytest.mark.django_db
+def test_s3_client_is_shared(settings, monkeypatch):
+    settings.AWS_STORAGE_BUCKET_NAME = "test"
+    monkeypatch.setenv("AWS_ACCESS_KEY_ID", "test")
+    monkeypatch.setenv("AWS_SECRET_ACCESS_KEY", "test")
+
+    clients = []
+    threads = [
+        threading.Thread(target=lambda: clients.append(S3().client)) for _ in range(5)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert all(client is S3().client for client in clients)
+    assert S3().client.meta.config.max_pool_connections == 25
+
+    urls = S3().get_files(["file1.png", "file2.png"])
+    assert "file1.png" in urls["file1.png"]
+    assert "file2.png" in urls["file2.png"]
+    assert "file1.png" in S3().get_file("file1.png")
+
+    # No bucket, no urls
+    settings.AWS_STORAGE_BUCKET_NAME = ""
+    assert S3().get_files(["file1.png"]) == {"file1.png": ""}
+
+
+@pytest.mark.django_db
+def test_download_urls(django_assert_num_queries, monkeypatch, file_factory):
+    signed_keys = []
+
+    def get_files(self, keys):
+        signed_keys.append(keys)
+        return {key: f"https://aws.com/{key}" for key in keys}
+
+    monkeypatch.setattr(S3, "get_files", get_files)
+    file1, file2 = file_factory.create_batch(2)
+    blocks = [
+        {"data": {"type": "upload"}, "answer": str(file1.id)},
+        {"data": {"type": "input"}, "answer": "test"},
+        {"data": {"type": "upload"}, "answer": file2.id},
+        {"data": {"type": "upload"}, "answer": ""},
+    ]
+
+    with django_assert_num_queries(1):
+        urls = download_urls(blocks)
+
+    assert signed_keys == [[file1.key, file2.key]]
+    assert full_download_url(file1.id, urls) == f"https://aws.com/{file1.key}"
+    assert full_download_url(str(file2.id), urls) == f"https://aws.com/{file2.key}"
+    assert full_download_url("", urls) == ""
+    # Without the urls
+    assert full_download_url(file1.id) == f"https://aws.com/{file1.key}"
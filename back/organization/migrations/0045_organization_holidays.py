@@ -0,0 +1,25 @@
+# Generated by Django 5.2.7 on 2026-10-18 17:51
+
+import django.contrib.postgres.fields
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("organization", "0044_remove_organization_credentials_login_and_more"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="organization",
+            name="holidays",
+            field=django.contrib.postgres.fields.ArrayField(
+                base_field=models.DateField(),
+                blank=True,
+                default=list,
+                help_text="Comma separated list of dates (YYYY-MM-DD). These are not counted as workdays, so timed conditions will skip them.",
+                size=None,
+                verbose_name="Holidays",
+            ),
+        ),
+    ]
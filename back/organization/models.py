@@ -1,25 +1,79 @@
+import copy
+import threading
+import time
+import uuid
 from datetime import datetime, timedelta
 
 import pytz
 from django.conf import settings
 from django.contrib.postgres.fields import ArrayField
 from django.core.cache import cache
-from django.db import models
+from django.core.signals import request_started
+from django.db import models, transaction
 from django.db.models import CheckConstraint, Q
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
 from django.template import Context, Template
 from django.template.loader import render_to_string
 from django.urls import reverse
 from django.utils import timezone
 from django.utils.functional import cached_property
 from django.utils.translation import gettext_lazy as _
+from django_q.signals import pre_execute
 
 from misc.mixins import ContentMixin
 from misc.models import File
+from organization.workdays import get_workday_calendar
 
 
 class ObjectManager(models.Manager):
+    """
+    Keeps one copy of the organization per process. Every save bumps a version key
+    in the cache, other processes compare against it once per request/task (or
+    after `ORGANIZATION_CACHE_TIMEOUT` seconds for anything else) and reload it
+    when it changed.
+    """
+
+    version_key = "organization_version"
+    _lock = threading.Lock()
+    # (version, organization) shared by all threads
+    _cached = None
+    # Moment the version got checked, per thread
+    _checked = threading.local()
+
     def get(self):
-        return self.get_queryset().first()
+        cached = self._cached
+        checked_at = getattr(self._checked, "at", None)
+        if (
+            cached is None
+            or checked_at is None
+            or time.monotonic() - checked_at > settings.ORGANIZATION_CACHE_TIMEOUT
+        ):
+            # No version (nothing got saved yet or it was culled) is a version too
+            version = cache.get(self.version_key)
+
+            if cached is None or cached[0] != version:
+                cached = (version, self.get_queryset().first())
+                with self._lock:
+                    ObjectManager._cached = cached
+            self._checked.at = time.monotonic()
+
+        # Never hand out the shared one, callers are free to change their copy
+        return copy.deepcopy(cached[1])
+
+    def invalidate(self):
+        # Let all processes know that they need to reload the organization
+        cache.set(self.version_key, uuid.uuid4().hex, None)
+        self.clear_cache()
+
+    def clear_cache(self):
+        with self._lock:
+            ObjectManager._cached = None
+        self.check_on_next_get()
+
+    def check_on_next_get(self):
+        # Start of a new request or task: compare with the version again
+        self._checked.at = None
 
 
 class Organization(models.Model):
@@ -143,6 +197,16 @@ class Organization(models.Model):
         default=list,
         help_text="Emails which get ignored by the importer",
     )
+    holidays = ArrayField(
+        models.DateField(),
+        default=list,
+        blank=True,
+        verbose_name=_("Holidays"),
+        help_text=_(
+            "Comma separated list of dates (YYYY-MM-DD). These are not counted as "
+            "workdays, so timed conditions will skip them."
+        ),
+    )
 
     object = ObjectManager()
     objects = models.Manager()
@@ -156,6 +220,45 @@ class Organization(models.Model):
             ),
         ]
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_timezone = instance.__dict__.get("timezone")
+        instance._loaded_holidays = list(instance.__dict__.get("holidays") or [])
+        return instance
+
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+
+        from django.contrib.auth import get_user_model
+
+        from admin.sequences.triggers import rebuild_condition_schedule
+
+        if getattr(self, "_loaded_holidays", self.holidays) != self.holidays:
+            # Workdays shift for everyone, recalculate all timed conditions
+            rebuild_condition_schedule(
+                get_user_model().objects.filter(
+                    Q(role=get_user_model().Role.NEWHIRE, termination_date__isnull=True)
+                    | Q(termination_date__isnull=False)
+                ),
+                self.timezone,
+                self.workday_calendar,
+            )
+        elif getattr(self, "_loaded_timezone", self.timezone) != self.timezone:
+            # Users without their own timezone use the one from the organization, so
+            # their timed conditions will trigger at a different moment now
+            rebuild_condition_schedule(
+                get_user_model().objects.filter(timezone=""),
+                self.timezone,
+                self.workday_calendar,
+            )
+        self._loaded_timezone = self.timezone
+        self._loaded_holidays = list(self.holidays)
+
+    @property
+    def workday_calendar(self):
+        return get_workday_calendar(self.holidays)
+
     @property
     def base_color_rgb(self):
         base_color = self.base_color.strip("#")
@@ -195,6 +298,19 @@ class Organization(models.Model):
         return cache.get("logo_url")
 
 
+@receiver([post_save, post_delete], sender=Organization)
+def invalidate_organization(sender, instance, **kwargs):
+    # Forget the copy of this process right away, but only tell other processes
+    # once the change is committed (they would cache the old row again otherwise)
+    Organization.object.clear_cache()
+    transaction.on_commit(Organization.object.invalidate)
+
+
+@receiver([request_started, pre_execute])
+def check_organization_version(sender, **kwargs):
+    Organization.object.check_on_next_get()
+
+
 class Tag(models.Model):
     name = models.CharField(max_length=500)
 
@@ -1,5 +1,5 @@
 import json
-from datetime import timedelta
+from datetime import date, timedelta
 
 import pytest
 from django.contrib.auth import get_user_model
@@ -11,6 +11,7 @@ from django.utils import timezone
 from misc.models import File
 
 from .models import Notification, Organization
+from .workdays import WorkdayCalendar
 
 
 @pytest.mark.django_db
@@ -98,6 +99,64 @@ def test_use_custom_email_template(new_hire_factory):
     assert f"hi {new_hire.first_name}!" in email
 
 
+@pytest.mark.django_db
+def test_organization_is_cached(django_assert_num_queries):
+    org = Organization.object.get()
+
+    with django_assert_num_queries(0):
+        cached_org = Organization.object.get()
+    assert cached_org.id == org.id
+
+    # Changing the copy doesn't change the cached one
+    cached_org.name = "Changed"
+    cached_org.ignored_user_emails += ["stan@chiefonboarding.com"]
+    assert Organization.object.get().name != "Changed"
+    assert Organization.object.get().ignored_user_emails == []
+
+    # Saving it does
+    cached_org.save()
+    assert Organization.object.get().name == "Changed"
+
+
+@pytest.mark.django_db
+def test_organization_cache_reloads_when_changed_elsewhere(settings, client):
+    Organization.object.get()
+
+    # Another process updated the organization
+    Organization.objects.update(name="Changed")
+    cache.set(Organization.object.version_key, "other_version", None)
+
+    # Still cached within the same request/task
+    assert Organization.object.get().name != "Changed"
+
+    # New request
+    client.get("/health")
+    assert Organization.object.get().name == "Changed"
+
+    # Outside of requests/tasks, it checks again after the timeout
+    Organization.objects.update(name="Changed again")
+    cache.set(Organization.object.version_key, "another_version", None)
+    settings.ORGANIZATION_CACHE_TIMEOUT = 0
+    assert Organization.object.get().name == "Changed again"
+
+
+@pytest.mark.django_db
+def test_organization_version_changes_on_commit(django_capture_on_commit_callbacks):
+    org = Organization.object.get()
+    version = cache.get(Organization.object.version_key)
+
+    with django_capture_on_commit_callbacks() as callbacks:
+        org.name = "Changed"
+        org.save()
+        # This process sees the change, others only after the commit
+        assert Organization.object.get().name == "Changed"
+        assert cache.get(Organization.object.version_key) == version
+
+    for callback in callbacks:
+        callback()
+    assert cache.get(Organization.object.version_key) != version
+
+
 @pytest.mark.django_db
 def test_cache_logo_url(settings, file_factory, monkeypatch):
     settings.AWS_ACCESS_KEY_ID = "xxx"
@@ -293,6 +352,37 @@ def test_reset_timed_triggers_last_check_command_with_no_org():
     call_command("reset_timed_triggers_last_check")
 
 
+@pytest.mark.django_db
+def test_workday_calendar():
+    # Wednesday 6th is a holiday, the one in the weekend doesn't matter
+    calendar = WorkdayCalendar([date(2021, 1, 6), date(2021, 1, 9)])
+
+    assert calendar.is_workday(date(2021, 1, 5))
+    assert not calendar.is_workday(date(2021, 1, 6))
+    assert not calendar.is_workday(date(2021, 1, 10))
+
+    # Tuesday to next Tuesday
+    assert calendar.workdays_between(date(2021, 1, 5), date(2021, 1, 12)) == 4
+    assert calendar.workdays_between(date(2021, 1, 12), date(2021, 1, 5)) == 0
+    assert calendar.add_workdays(date(2021, 1, 5), 4) == date(2021, 1, 12)
+    assert calendar.add_workdays(date(2021, 1, 12), -4) == date(2021, 1, 5)
+    # From a day in the weekend
+    assert calendar.add_workdays(date(2021, 1, 10), 1) == date(2021, 1, 11)
+    assert calendar.add_workdays(date(2021, 1, 10), -2) == date(2021, 1, 7)
+    assert calendar.add_workdays(date(2021, 1, 10), 0) == date(2021, 1, 10)
+
+    # Over multiple years (without holidays, 5 workdays every 7 days)
+    assert (
+        WorkdayCalendar().workdays_between(
+            date(2021, 1, 4), date(2021, 1, 4) + timedelta(weeks=520)
+        )
+        == 5 * 520
+    )
+    assert WorkdayCalendar().add_workdays(date(2021, 1, 4), 5 * 520) == date(
+        2021, 1, 4
+    ) + timedelta(weeks=520)
+
+
 @pytest.mark.django_db()
 def test_health_check(client):
     response = client.get("/health")
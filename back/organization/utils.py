@@ -8,6 +8,7 @@ from anymail.exceptions import (
 )
 from django.conf import settings
 from django.core.mail import send_mail
+from django.utils.functional import Promise
 
 from organization.models import Notification
 
@@ -60,12 +61,20 @@ def send_email_with_notification(
         )
 
 
+def _skip_lazy_values(value):
+    # Lazy values (signed file urls of content) can't contain tags, so don't sign
+    # them just to check this
+    if isinstance(value, Promise):
+        return ""
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
 def has_manager_or_buddy_tags(content_json):
     if content_json is None:
         return False, False
 
     # convert to string and then remove all spaces, so we can easily match
-    content_str = json.dumps(content_json)
+    content_str = json.dumps(content_json, default=_skip_lazy_values)
     content_str_no_spaces = "".join(content_str.split())
 
     manager_tags = ["{{manager}}", "{{manager_email}}"]
@@ -0,0 +1,97 @@
+from bisect import bisect_left, bisect_right
+from datetime import date, timedelta
+from functools import lru_cache
+
+# Monday, so the weekday of any date can be derived from the amount of days since
+EPOCH = date(1, 1, 1)
+
+
+def _weekdays_before(day):
+    # Amount of weekdays (mon-fri) between the epoch and the day (not included)
+    weeks, days = divmod((day - EPOCH).days, 7)
+    return weeks * 5 + min(days, 5)
+
+
+def _weekday_at(index):
+    # Inverse of `_weekdays_before`: the weekday with this (0 based) index
+    weeks, days = divmod(index, 5)
+    return EPOCH + timedelta(days=weeks * 7 + days)
+
+
+class WorkdayCalendar:
+    """
+    Business day arithmetic in constant time (plus a binary search through the
+    holidays). Weekends and the given holidays are not workdays.
+
+    :param holidays list: list of dates that are not workdays
+    """
+
+    def __init__(self, holidays=()):
+        self.holidays = frozenset(day for day in holidays if day.weekday() < 5)
+        self._sorted_holidays = sorted(self.holidays)
+
+    def is_workday(self, day):
+        return day.weekday() < 5 and day not in self.holidays
+
+    def _workdays_before(self, day):
+        # Amount of workdays between the epoch and the day (not included)
+        return _weekdays_before(day) - bisect_left(self._sorted_holidays, day)
+
+    def _workday_at(self, index):
+        # The workday with this (0 based) index. Every step skips at least as many
+        # weekdays as there are holidays in between, so this only loops when there
+        # are holidays in the way.
+        weekday_index = index
+        while True:
+            day = _weekday_at(weekday_index)
+            workdays = weekday_index + 1 - bisect_right(self._sorted_holidays, day)
+            if workdays == index + 1:
+                return day
+            weekday_index += index + 1 - workdays
+
+    def workdays_between(self, start, end):
+        """
+        Amount of workdays after the start day up to (and including) the end day
+
+        :param start date: first day (not counted)
+        :param end date: last day (counted)
+        :return int: amount of workdays, 0 if end is not after start
+        """
+        if end <= start:
+            return 0
+        return self._workdays_before(end + timedelta(days=1)) - self._workdays_before(
+            start + timedelta(days=1)
+        )
+
+    def add_workdays(self, day, workdays):
+        """
+        Move an amount of workdays away from a day. The day itself doesn't need to
+        be a workday.
+
+        :param day date: day to start from
+        :param workdays int: amount of workdays, negative to go back in time
+        :return date: the workday that is reached or the day itself if 0
+        """
+        if workdays == 0:
+            return day
+        if workdays > 0:
+            return self._workday_at(
+                self._workdays_before(day + timedelta(days=1)) + workdays - 1
+            )
+        return self._workday_at(self._workdays_before(day) + workdays)
+
+
+@lru_cache(maxsize=32)
+def _get_workday_calendar(holidays):
+    return WorkdayCalendar(holidays)
+
+
+def get_workday_calendar(holidays=()):
+    """
+    Get a (shared) calendar for these holidays. Calendars don't change, so they can
+    be reused for every user.
+
+    :param holidays list: list of dates that are not workdays
+    :return WorkdayCalendar:
+    """
+    return _get_workday_calendar(tuple(sorted(set(holidays))))
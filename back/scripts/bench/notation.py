@@ -0,0 +1,123 @@
+"""
+Compares extracting users with compiled notations with splitting the notations for
+every value. Run from the `back` folder:
+
+    python scripts/bench/notation.py --users 100000
+"""
+
+import argparse
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[2]))
+
+from admin.integrations.utils import compile_notation, get_value_from_path  # noqa: E402
+
+DATA_STRUCTURE = {
+    "email": "primaryEmail",
+    "first_name": "name.givenName",
+    "last_name": "name.familyName",
+    "phone": "phones.0.value",
+    "department": "organizations.0.department",
+    "manager": "relations.0.value",
+}
+
+
+def get_value_with_split(notation, value):
+    # The way `get_value_from_notation` used to dig into values
+    if notation == "":
+        return value
+
+    for notation in notation.split("."):
+        try:
+            value = value[notation]
+        except TypeError:
+            if not isinstance(value, list):
+                raise KeyError
+
+            try:
+                index = int(notation)
+            except (TypeError, ValueError):
+                raise KeyError
+
+            try:
+                value = value[index]
+            except (TypeError, ValueError, IndexError):
+                raise KeyError
+
+    return value
+
+
+def build_users(amount):
+    users = []
+    for idx in range(amount):
+        user = {
+            "primaryEmail": f"user{idx}@chiefonboarding.com",
+            "name": {"givenName": f"First {idx}", "familyName": f"Last {idx}"},
+            "phones": [{"value": f"+31 {idx:08}", "type": "work"}],
+            "organizations": [{"department": f"Department {idx % 20}"}],
+        }
+        # Not every user has a manager, the notation fails for those
+        if idx % 10:
+            user["relations"] = [{"value": f"manager{idx % 100}@chiefonboarding.com"}]
+        users.append(user)
+    return {"users": users}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--users", type=int, default=100000)
+    amount = parser.parse_args().users
+    payload = build_users(amount)
+
+    def run(name, func):
+        started = time.perf_counter()
+        results = func()
+        duration = time.perf_counter() - started
+        print(
+            f"{name}: {duration * 1000:.2f}ms "
+            f"({duration / amount * 1_000_000:.2f}µs per user)"
+        )
+        return results
+
+    def extract_with_split():
+        users = []
+        for user_data in get_value_with_split("users", payload):
+            user = {}
+            for prop, notation in DATA_STRUCTURE.items():
+                try:
+                    user[prop] = get_value_with_split(notation, user_data)
+                except KeyError:
+                    pass
+            users.append(user)
+        return users
+
+    def extract_compiled():
+        paths = [
+            (prop, compile_notation(notation))
+            for prop, notation in DATA_STRUCTURE.items()
+        ]
+        users = []
+        for user_data in get_value_from_path(compile_notation("users"), payload):
+            user = {}
+            for prop, path in paths:
+                try:
+                    user[prop] = get_value_from_path(path, user_data)
+                except KeyError:
+                    pass
+            users.append(user)
+        return users
+
+    print(f"{amount} users, {len(DATA_STRUCTURE)} fields per user")
+
+    split_users = run("Extract users (split notation)", extract_with_split)
+    compiled_users = run("Extract users (compiled notation)", extract_compiled)
+
+    if split_users != compiled_users:
+        sys.exit("Results of both extractions don't match")
+    print("Results match")
+
+
+if __name__ == "__main__":
+    main()
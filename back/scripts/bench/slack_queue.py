@@ -0,0 +1,119 @@
+"""
+Compares sending messages one by one with sending them through the outbound queue,
+against a local fake Slack server that enforces a rate limit. Needs the database of
+the app (nothing gets stored). Run from the `back` folder:
+
+    python scripts/bench/slack_queue.py --messages 300 --channels 30
+"""
+
+import argparse
+import os
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[2]))
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "back.settings")
+
+import django  # noqa: E402
+
+django.setup()
+
+from django.conf import settings  # noqa: E402
+from django.db import transaction  # noqa: E402
+from django.db.models import Min  # noqa: E402
+from django.utils import timezone  # noqa: E402
+
+from slack_bot.client import PooledWebClient  # noqa: E402
+from slack_bot.fake_slack import FakeSlackServer  # noqa: E402
+from slack_bot.models import OutboundSlackMessage  # noqa: E402
+from slack_bot.outbound import RateLimiter, drain, queue_messages  # noqa: E402
+
+
+def build_messages(amount, channels):
+    return [
+        {
+            "channel": f"C{idx % channels:04}",
+            "text": f"Message {idx}",
+            "blocks": [],
+        }
+        for idx in range(amount)
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--messages", type=int, default=300)
+    parser.add_argument("--channels", type=int, default=30)
+    # Calls per second the fake server accepts for chat.postMessage
+    parser.add_argument("--rate", type=int, default=50)
+    parser.add_argument("--latency", type=float, default=0.02)
+    parser.add_argument(
+        "--channel-rate", type=int, default=settings.SLACK_CHANNEL_RATE_LIMIT
+    )
+    options = parser.parse_args()
+
+    messages = build_messages(options.messages, options.channels)
+    expected = {}
+    for message in messages:
+        expected.setdefault(message["channel"], []).append(message["text"])
+
+    def run(name, func):
+        with FakeSlackServer(
+            rate_limits={"chat.postMessage": options.rate},
+            latency=options.latency,
+        ) as server:
+            client = PooledWebClient(token="xoxb-benchmark", base_url=server.url)
+            started = time.perf_counter()
+            func(client)
+            duration = time.perf_counter() - started
+        delivered = len(server.messages())
+        print(
+            f"{name}: {delivered}/{len(messages)} delivered, "
+            f"{server.rate_limited} rate limited, {duration:.2f}s "
+            f"({delivered / duration:.1f} messages/s)"
+        )
+        return {channel: server.messages(channel) for channel in expected}
+
+    def send_inline(client):
+        # Like `Slack.send_message`, errors only end up in a notification
+        for message in messages:
+            try:
+                client.chat_postMessage(**message)
+            except Exception:
+                pass
+
+    def send_queued(client):
+        limiter = RateLimiter(
+            method_rates={"default": 20, "chat.postMessage": options.rate * 60},
+            channel_rate=options.channel_rate,
+        )
+        # Nothing of this run is kept
+        with transaction.atomic():
+            queue_messages(messages)
+            while OutboundSlackMessage.objects.exists():
+                drain(client=client, limiter=limiter)
+                # Wait for messages that have to be retried later
+                send_after = OutboundSlackMessage.objects.aggregate(
+                    first=Min("send_after")
+                )["first"]
+                if send_after is not None:
+                    wait = (send_after - timezone.now()).total_seconds()
+                    time.sleep(max(0, wait))
+            transaction.set_rollback(True)
+
+    print(
+        f"{len(messages)} messages in {options.channels} channels, "
+        f"Slack accepts {options.rate} messages/s"
+    )
+
+    run("Send inline", send_inline)
+    queued = run("Send through queue", send_queued)
+
+    if queued != expected:
+        sys.exit("Not all queued messages arrived in order")
+    print("Results match")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+"""
+Compares the workday calculations of the workday calendar with the day-by-day loops
+over multi-year ranges. Run from the `back` folder:
+
+    python scripts/bench/workdays.py --years 5 --iterations 2000
+"""
+
+import argparse
+import random
+import sys
+import time
+from datetime import date, timedelta
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[2]))
+
+from organization.workdays import WorkdayCalendar  # noqa: E402
+
+
+def count_workdays_with_loop(start_day, local_day):
+    # The way `User.workday` used to count
+    if start_day > local_day:
+        return 0
+
+    amount_of_workdays = 1
+    while local_day != start_day:
+        start_day += timedelta(days=1)
+        if start_day.weekday() not in [5, 6]:
+            amount_of_workdays += 1
+
+    return amount_of_workdays
+
+
+def add_workdays_with_loop(start_day, workdays):
+    # The way `User.workday_to_datetime` used to count
+    start = 1
+    while start != workdays:
+        start_day += timedelta(days=1)
+        if start_day.weekday() not in [5, 6]:
+            start += 1
+    return start_day
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--years", type=int, default=5)
+    parser.add_argument("--iterations", type=int, default=2000)
+    options = parser.parse_args()
+    years = options.years
+    iterations = options.iterations
+
+    rand = random.Random(42)
+    today = date.today()
+    start_days = [
+        today - timedelta(days=rand.randint(0, years * 365)) for _ in range(iterations)
+    ]
+    workdays = [rand.randint(1, years * 260) for _ in range(iterations)]
+    calendar = WorkdayCalendar()
+
+    def run(name, func):
+        started = time.perf_counter()
+        results = func()
+        duration = time.perf_counter() - started
+        print(
+            f"{name}: {duration * 1000:.2f}ms "
+            f"({duration / iterations * 1_000_000:.2f}µs per call)"
+        )
+        return results
+
+    print(f"{iterations} users, up to {years} years employed")
+
+    loop_counts = run(
+        "Count workdays (loop)",
+        lambda: [count_workdays_with_loop(day, today) for day in start_days],
+    )
+    calendar_counts = run(
+        "Count workdays (calendar)",
+        lambda: [calendar.workdays_between(day, today) + 1 for day in start_days],
+    )
+    loop_dates = run(
+        "Add workdays (loop)",
+        lambda: [
+            add_workdays_with_loop(day, amount)
+            for day, amount in zip(start_days, workdays)
+        ],
+    )
+    calendar_dates = run(
+        "Add workdays (calendar)",
+        lambda: [
+            calendar.add_workdays(day, amount - 1)
+            for day, amount in zip(start_days, workdays)
+        ],
+    )
+
+    if loop_counts != calendar_counts or loop_dates != calendar_dates:
+        sys.exit("Results of the calendar and the loops don't match")
+    print("Results match")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,169 @@
+import threading
+import time
+
+import requests
+import slack_sdk
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+from slack_sdk.errors import SlackApiError, SlackRequestError
+
+# Errors of the Slack API that mean that the token we have is not valid (anymore)
+TOKEN_ERRORS = ["invalid_auth", "not_authed", "token_revoked", "token_expired"]
+
+
+class SSLContextAdapter(HTTPAdapter):
+    # Connection pool that uses the SSL context of the Slack client (if it has one)
+
+    def __init__(self, ssl_context=None, **kwargs):
+        self.ssl_context = ssl_context
+        super().__init__(**kwargs)
+
+    def init_poolmanager(self, *args, **kwargs):
+        if self.ssl_context is not None:
+            kwargs["ssl_context"] = self.ssl_context
+        super().init_poolmanager(*args, **kwargs)
+
+    def proxy_manager_for(self, *args, **kwargs):
+        if self.ssl_context is not None:
+            kwargs["ssl_context"] = self.ssl_context
+        return super().proxy_manager_for(*args, **kwargs)
+
+
+class PooledWebClient(slack_sdk.WebClient):
+    """
+    Slack client that sends its requests through a pooled session, so connections
+    to Slack are kept alive between calls instead of opening a new one (including
+    the TLS handshake) for every message.
+
+    The SDK has no public way to change how requests are sent, so this replaces
+    `_perform_urllib_http_request_internal`. That method is private, which is why
+    slack-sdk is pinned in the Pipfile. `test_slack_client_private_method` fails
+    when its signature changes.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.session = requests.Session()
+        adapter = SSLContextAdapter(
+            ssl_context=self.ssl, pool_maxsize=settings.SLACK_POOL_MAXSIZE
+        )
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+    def _perform_urllib_http_request_internal(self, url, req):
+        # Same result as the urllib version, errors (4xx/5xx) are returned as well
+        if not url.lower().startswith("http"):
+            raise SlackRequestError(f"Invalid URL detected: {url}")
+
+        proxies = None
+        if self.proxy is not None:
+            if not isinstance(self.proxy, str):
+                raise SlackRequestError(
+                    f"Invalid proxy detected: {self.proxy} must be a str value"
+                )
+            proxies = {"http": self.proxy, "https": self.proxy}
+        response = self.session.request(
+            req.get_method(),
+            url,
+            data=req.data,
+            headers={key: str(value) for key, value in req.header_items()},
+            timeout=self.timeout,
+            proxies=proxies,
+        )
+        headers = dict(response.headers.items())
+        if "Retry-After" in headers:
+            headers["retry-after"] = headers["Retry-After"]
+        if response.headers.get("Content-Type", "").startswith("application/gzip"):
+            body = response.content
+        else:
+            body = response.content.decode(response.encoding or "utf-8")
+        return {"status": response.status_code, "headers": headers, "body": body}
+
+    def api_call(self, *args, **kwargs):
+        try:
+            return super().api_call(*args, **kwargs)
+        except SlackApiError as e:
+            if e.response.get("error") in TOKEN_ERRORS:
+                # The token got rotated or revoked, get it again on the next call
+                slack_clients.discard(self)
+            raise
+
+
+class SlackClients:
+    """
+    Holds the Slack client of this process. The client gets created when it's needed
+    for the first time and is shared between threads. The token is checked again
+    after the timeout (and when the Slack bot integration gets saved), so a rotated
+    token gets picked up without restarting.
+
+    :param timeout int: seconds after which the token gets checked again
+    """
+
+    def __init__(self, timeout):
+        self.timeout = timeout
+        self._client = None
+        self._token = None
+        self._checked_at = 0
+        self._lock = threading.Lock()
+
+    def _get_token(self):
+        if settings.SLACK_USE_SOCKET:
+            if settings.SLACK_BOT_TOKEN == "":
+                raise Exception("Access token not available")
+            return settings.SLACK_BOT_TOKEN
+
+        from admin.integrations.models import Integration
+
+        team = Integration.objects.get(integration=Integration.Type.SLACK_BOT)
+        return team.token
+
+    def _get_fresh(self):
+        # The current client if its token was checked recently enough
+        client = self._client
+        if client is not None and time.monotonic() - self._checked_at < self.timeout:
+            return client
+        return None
+
+    def get(self):
+        client = self._get_fresh()
+        if client is not None:
+            return client
+
+        with self._lock:
+            if self._get_fresh() is None:
+                token = self._get_token()
+                if self._client is None or token != self._token:
+                    # Requests that are still running keep using the old client
+                    self._client = PooledWebClient(token=token)
+                    self._token = token
+                self._checked_at = time.monotonic()
+            return self._client
+
+    def discard(self, client):
+        # Only forget the client if no other thread replaced it already
+        with self._lock:
+            if self._client is client:
+                self._client = None
+                self._token = None
+
+    def reset(self):
+        with self._lock:
+            self._client = None
+            self._token = None
+
+
+slack_clients = SlackClients(timeout=settings.SLACK_CLIENT_CACHE_TIMEOUT)
+
+
+def get_client():
+    """
+    Get the Slack client of this process, see `SlackClients`
+
+    :return PooledWebClient:
+    """
+    return slack_clients.get()
+
+
+def reset_client():
+    # Next call will create a new client (i.e. when the token changed)
+    slack_clients.reset()
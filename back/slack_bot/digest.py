@@ -0,0 +1,166 @@
+from datetime import datetime
+
+import pytz
+from django.contrib.auth import get_user_model
+from django.db.models import Q
+from django.utils import translation
+from django.utils.translation import gettext as _
+
+from organization.models import Organization
+from users.models import ResourceUser, ToDoUser
+
+from .slack_resource import SlackResource
+from .slack_to_do import SlackToDo
+from .utils import paragraph
+
+# Local hour at which new hires get their daily digest
+DIGEST_HOUR = 8
+
+
+def get_digest_users(hour=DIGEST_HOUR):
+    """
+    Get the new hires (with Slack) for whom it's now the given hour on a weekday and
+    who already started. Users are grouped by timezone, so the local time only gets
+    calculated once per timezone.
+
+    :param hour int: local hour
+    :return list: users
+    """
+    org = Organization.object.get()
+    new_hires = get_user_model().new_hires.with_slack()
+    utc_now = pytz.utc.localize(datetime.now())
+
+    conditions = Q()
+    for user_timezone in new_hires.values_list("timezone", flat=True).distinct():
+        local_tz = pytz.timezone(user_timezone or org.timezone)
+        local_datetime = local_tz.normalize(utc_now.astimezone(local_tz))
+        if local_datetime.hour == hour and local_datetime.weekday() < 5:
+            conditions |= Q(
+                timezone=user_timezone, start_day__lte=local_datetime.date()
+            )
+
+    if not len(conditions):
+        return []
+    return list(new_hires.filter(conditions).order_by("id"))
+
+
+class DailyDigest:
+    """
+    The to do items that are due (or overdue) and the courses that still need to be
+    completed of one new hire, rendered as Slack messages.
+    """
+
+    def __init__(self, user, to_do_users, courses):
+        self.user = user
+        self.to_do_users = to_do_users
+        self.courses = courses
+
+    @property
+    def has_overdue(self):
+        return any(
+            to_do_user.to_do.due_on_day < self.user.workday
+            for to_do_user in self.to_do_users
+        )
+
+    def get_slack_messages(self):
+        """
+        Render the messages of the digest, in the language of the user
+
+        :return list: list of dicts with `channel`, `text` and `blocks`
+        """
+        user = self.user
+        messages = []
+        with translation.override(user.language):
+            if len(self.courses):
+                text = _("Here are some courses that you need to complete")
+                blocks = [
+                    paragraph(text),
+                    *[
+                        SlackResource(course, user).get_block()
+                        for course in self.courses
+                    ],
+                ]
+                messages.append(
+                    {"channel": user.slack_user_id, "text": text, "blocks": blocks}
+                )
+
+            if len(self.to_do_users):
+                if self.has_overdue:
+                    text = _(
+                        "Good morning! These are the tasks you need to complete. Some "
+                        "to do items are overdue. Please complete those as soon as "
+                        "possible!"
+                    )
+                else:
+                    text = _(
+                        "Good morning! These are the tasks you need to complete today:"
+                    )
+                blocks = [
+                    paragraph(text),
+                    *[
+                        SlackToDo(to_do_user, user).get_block()
+                        for to_do_user in self.to_do_users
+                    ],
+                ]
+                messages.append(
+                    {"channel": user.slack_user_id, "text": text, "blocks": blocks}
+                )
+        return messages
+
+
+def build_daily_digests(users):
+    """
+    Build the digests of these users. The to do items and courses of all users get
+    loaded with one query each.
+
+    :param users list: users, see `get_digest_users`
+    :return list: `DailyDigest` for every user that has something to do
+    """
+    if not len(users):
+        return []
+
+    max_workday = max(user.workday for user in users)
+    to_do_users = {}
+    for to_do_user in (
+        ToDoUser.objects.filter(
+            user__in=users,
+            completed=False,
+            to_do__due_on_day__gt=0,
+            to_do__due_on_day__lte=max_workday,
+        )
+        .select_related("to_do")
+        .order_by("id")
+    ):
+        to_do_users.setdefault(to_do_user.user_id, []).append(to_do_user)
+
+    courses = {}
+    for resource_user in (
+        ResourceUser.objects.filter(
+            user__in=users,
+            resource__course=True,
+            completed_course=False,
+            resource__on_day__lte=max_workday,
+        )
+        .select_related("resource")
+        .order_by("id")
+    ):
+        courses.setdefault(resource_user.user_id, []).append(resource_user)
+
+    digests = []
+    for user in users:
+        digest = DailyDigest(
+            user,
+            [
+                to_do_user
+                for to_do_user in to_do_users.get(user.id, [])
+                if to_do_user.to_do.due_on_day <= user.workday
+            ],
+            [
+                course
+                for course in courses.get(user.id, [])
+                if course.resource.on_day <= user.workday
+            ],
+        )
+        if len(digest.to_do_users) or len(digest.courses):
+            digests.append(digest)
+    return digests
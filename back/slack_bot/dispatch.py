@@ -0,0 +1,245 @@
+import json
+import logging
+import os
+import threading
+import time
+from concurrent.futures import Executor, Future, ThreadPoolExecutor
+from functools import wraps
+
+from django.conf import settings
+from django.db import close_old_connections
+from django.utils.module_loading import import_string
+from django_q.tasks import async_task
+from sentry_sdk import capture_exception
+
+logger = logging.getLogger(__name__)
+
+
+class HandlerMetrics:
+    """
+    Metrics of the Slack handlers of this process: how many events are waiting for a
+    thread and how long every handler took. Thread-safe.
+
+    Every process keeps its own numbers: the web processes for the handlers that ran
+    in their threads, the task workers for the handlers they got (with
+    `SLACK_HANDLER_MODE` set to "task" or when the queue was full). Each of them
+    logs its numbers at most once per `log_interval` seconds.
+
+    :param log_interval int: seconds between two log lines, 0 to never log
+    """
+
+    def __init__(self, log_interval=0):
+        self.log_interval = log_interval
+        self._lock = threading.Lock()
+        self.clear()
+
+    def clear(self):
+        with self._lock:
+            self.queue_depth = 0
+            self.max_queue_depth = 0
+            # Handlers that didn't fit in the queue
+            self.overflowed = 0
+            self.handlers = {}
+            self._logged_at = time.monotonic()
+
+    def _should_log(self):
+        # Call with the lock held
+        now = time.monotonic()
+        if self.log_interval <= 0 or now - self._logged_at < self.log_interval:
+            return False
+        self._logged_at = now
+        return True
+
+    def queued(self, amount):
+        with self._lock:
+            self.queue_depth += amount
+            self.max_queue_depth = max(self.max_queue_depth, self.queue_depth)
+
+    def overflow(self):
+        with self._lock:
+            self.overflowed += 1
+            should_log = self._should_log()
+        if should_log:
+            self.log()
+
+    def record(self, name, duration, failed=False):
+        with self._lock:
+            handler = self.handlers.setdefault(
+                name, {"calls": 0, "errors": 0, "total_ms": 0, "max_ms": 0}
+            )
+            handler["calls"] += 1
+            handler["errors"] += int(failed)
+            handler["total_ms"] += duration
+            handler["max_ms"] = max(handler["max_ms"], duration)
+            should_log = self._should_log()
+        if should_log:
+            self.log()
+
+    def log(self):
+        logger.info(
+            "Slack handler metrics of process %s: %s",
+            os.getpid(),
+            json.dumps(self.stats()),
+        )
+
+    def stats(self):
+        with self._lock:
+            return {
+                "queue_depth": self.queue_depth,
+                "max_queue_depth": self.max_queue_depth,
+                "overflowed": self.overflowed,
+                "handlers": {
+                    name: {
+                        **handler,
+                        "avg_ms": round(handler["total_ms"] / handler["calls"]),
+                    }
+                    for name, handler in self.handlers.items()
+                },
+            }
+
+
+handler_metrics = HandlerMetrics(log_interval=settings.SLACK_HANDLER_METRICS_INTERVAL)
+
+# Set while a handler runs in the calling thread because the queue was full
+_overflow = threading.local()
+
+
+def _with_cleanup(fn, *args, **kwargs):
+    try:
+        return fn(*args, **kwargs)
+    finally:
+        # Threads of the pool don't go through a request, so clean up connections
+        # like the end of a request would
+        close_old_connections()
+
+
+class BoundedExecutor(Executor):
+    """
+    Executor of the Slack app. Handlers (see `lazy`) run in a pool of threads with
+    a bounded queue. When all threads are busy and the queue is full, they go to the
+    task queue instead, only handlers that open a modal run in the calling thread.
+
+    Anything else Bolt submits (the ack functions of the listeners) runs in a small
+    separate pool, so acknowledging an event never waits for a handler.
+
+    :param max_workers int: amount of threads for the handlers
+    :param max_queue int: amount of handlers that can wait for a thread
+    :param metrics HandlerMetrics: gets the depth of the queue
+    :param listener_workers int: amount of threads for everything else
+    """
+
+    def __init__(self, max_workers, max_queue, metrics, listener_workers=5):
+        self.metrics = metrics
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="slack"
+        )
+        self._listener_executor = ThreadPoolExecutor(
+            max_workers=listener_workers, thread_name_prefix="slack-listener"
+        )
+        # Running and waiting handlers
+        self._slots = threading.BoundedSemaphore(max_workers + max_queue)
+
+    def submit(self, fn, /, *args, **kwargs):
+        # Bolt wraps the lazy listener with `functools.wraps`, which copies the marker
+        if not getattr(fn, "slack_handler", False):
+            return self._listener_executor.submit(_with_cleanup, fn, *args, **kwargs)
+
+        if not self._slots.acquire(blocking=False):
+            self.metrics.overflow()
+            future = Future()
+            _overflow.active = True
+            try:
+                future.set_result(fn(*args, **kwargs))
+            except Exception as e:
+                future.set_exception(e)
+            finally:
+                _overflow.active = False
+            return future
+
+        self.metrics.queued(1)
+
+        def run():
+            self.metrics.queued(-1)
+            try:
+                return _with_cleanup(fn, *args, **kwargs)
+            finally:
+                self._slots.release()
+
+        try:
+            return self._executor.submit(run)
+        except Exception:
+            self.metrics.queued(-1)
+            self._slots.release()
+            raise
+
+    def shutdown(self, wait=True, *, cancel_futures=False):
+        self._executor.shutdown(wait=wait, cancel_futures=cancel_futures)
+        self._listener_executor.shutdown(wait=wait, cancel_futures=cancel_futures)
+
+
+handler_executor = BoundedExecutor(
+    max_workers=settings.SLACK_HANDLER_WORKERS,
+    max_queue=settings.SLACK_HANDLER_QUEUE_SIZE,
+    metrics=handler_metrics,
+)
+
+
+def acknowledge(ack):
+    # Ack function of listeners that do all their work in a lazy listener
+    ack()
+
+
+def run_handler(func, kwargs):
+    """
+    Run a handler and keep track of how long it took. Errors are reported, but not
+    raised (Slack already got its answer).
+
+    :param func function: handler or the dotted path to it
+    :param kwargs dict: arguments of the handler
+    """
+    if isinstance(func, str):
+        func = import_string(func)
+
+    started = time.perf_counter()
+    failed = False
+    try:
+        func(**kwargs)
+    except Exception as e:
+        failed = True
+        logger.exception(f"Slack handler {func.__name__} failed")
+        capture_exception(e)
+    finally:
+        handler_metrics.record(
+            func.__name__, round((time.perf_counter() - started) * 1000), failed
+        )
+
+
+def lazy(func, queue=True):
+    """
+    Turn a handler into a lazy listener for the Slack app, so the event gets
+    acknowledged right away. The handler runs in one of the threads of the app or,
+    with `SLACK_HANDLER_MODE` set to "task" or when all threads are busy, as a task.
+
+    :param func function: handler, the names of its arguments decide what it gets
+    :param queue bool: `False` to never run it as a task, i.e. when it opens a
+        modal (trigger ids are only valid for 3 seconds)
+    :return function:
+    """
+
+    @wraps(func)
+    def lazy_listener(**kwargs):
+        if queue and (
+            settings.SLACK_HANDLER_MODE == "task" or getattr(_overflow, "active", False)
+        ):
+            async_task(
+                run_handler,
+                f"{func.__module__}.{func.__name__}",
+                kwargs,
+                task_name=f"Slack: {func.__name__}",
+            )
+        else:
+            run_handler(func, kwargs)
+
+    # Lets `BoundedExecutor` tell handlers apart from the rest
+    lazy_listener.slack_handler = True
+    return lazy_listener
@@ -0,0 +1,150 @@
+import json
+import threading
+import time
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl
+
+
+class FakeSlackServer:
+    """
+    Local stand-in for the Slack Web API, used by tests and benchmarks. It accepts
+    every method, keeps track of the calls and answers with `ok`, unless a rate limit
+    is hit (`429` with `Retry-After`) or the channel is set up to fail.
+
+    Use it as a context manager and point a client at `url`.
+
+    :param rate_limits dict: {method: calls per second}
+    :param errors dict: {channel: Slack error}, calls for that channel fail
+    :param latency float: seconds to wait before answering
+    :param retry_after int: seconds sent along with a rate limited response
+    :param rate_limit_first dict: {method: amount}, the first calls always get a 429
+    """
+
+    def __init__(
+        self,
+        rate_limits=None,
+        errors=None,
+        latency=0,
+        retry_after=1,
+        rate_limit_first=None,
+    ):
+        self.rate_limits = rate_limits or {}
+        self.errors = errors or {}
+        self.latency = latency
+        self.retry_after = retry_after
+        self.rate_limit_first = dict(rate_limit_first or {})
+        # [(method, arguments)] of the calls that were accepted
+        self.calls = []
+        self.rate_limited = 0
+        self._recent = {}
+        self._lock = threading.Lock()
+        self._server = None
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}/api/"
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *args):
+        self.stop()
+
+    def start(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length", 0))
+                body = self.rfile.read(length).decode()
+                if self.headers.get("Content-Type", "").startswith("application/json"):
+                    arguments = json.loads(body or "{}")
+                else:
+                    arguments = dict(parse_qsl(body))
+                status, headers, data = fake.handle(
+                    self.path.rsplit("/", 1)[-1], arguments
+                )
+                content = json.dumps(data).encode()
+                self.send_response(status)
+                for key, value in headers.items():
+                    self.send_header(key, value)
+                self.send_header("Content-Type", "application/json; charset=utf-8")
+                self.send_header("Content-Length", str(len(content)))
+                self.end_headers()
+                self.wfile.write(content)
+
+            def log_message(self, *args):
+                pass
+
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+        self._thread.join()
+
+    def _is_rate_limited(self, method):
+        # Called with the lock held
+        if self.rate_limit_first.get(method, 0) > 0:
+            self.rate_limit_first[method] -= 1
+            return True
+
+        limit = self.rate_limits.get(method)
+        if limit is None:
+            return False
+        now = time.monotonic()
+        recent = self._recent.setdefault(method, deque())
+        while len(recent) and recent[0] <= now - 1:
+            recent.popleft()
+        if len(recent) >= limit:
+            return True
+        recent.append(now)
+        return False
+
+    def handle(self, method, arguments):
+        if self.latency:
+            time.sleep(self.latency)
+
+        with self._lock:
+            if self._is_rate_limited(method):
+                self.rate_limited += 1
+                return (
+                    429,
+                    {"Retry-After": str(self.retry_after)},
+                    {"ok": False, "error": "ratelimited"},
+                )
+
+            channel = arguments.get("channel", "")
+            if channel in self.errors:
+                return 200, {}, {"ok": False, "error": self.errors[channel]}
+
+            self.calls.append((method, arguments))
+            return (
+                200,
+                {},
+                {"ok": True, "channel": channel, "ts": f"{len(self.calls)}.000000"},
+            )
+
+    def messages(self, channel=None):
+        """
+        Texts of the messages that got posted, in the order in which they arrived
+
+        :param channel str: only the messages of this channel
+        :return list:
+        """
+        with self._lock:
+            return [
+                arguments.get("text", "")
+                for method, arguments in self.calls
+                if method == "chat.postMessage"
+                and (channel is None or arguments.get("channel") == channel)
+            ]
@@ -0,0 +1,122 @@
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db.models import Q
+
+
+class SlackUserLookup:
+    """
+    Maps Slack user ids and channel ids to `(user id, language)`, `None` if no user
+    has that id. Matches are kept in memory (for `local_timeout` seconds) and all
+    results in the shared cache, so most events of Slack don't need a query to find
+    the user. Saving or deleting a user removes its ids, other processes pick that
+    up after `local_timeout`.
+
+    :param max_size int: amount of ids to keep in memory
+    :param timeout int: seconds to keep the ids in the shared cache
+    :param local_timeout int: seconds to keep the ids in memory
+    """
+
+    def __init__(self, max_size, timeout, local_timeout):
+        self.max_size = max_size
+        self.timeout = timeout
+        self.local_timeout = local_timeout
+        # {slack id: (moment it got stored, match)}
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _get_cache_key(self, slack_id):
+        return f"slack_user_lookup_{slack_id}"
+
+    def _get_local(self, slack_id):
+        with self._lock:
+            entry = self._entries.get(slack_id)
+            if entry is None:
+                return False, None
+            if time.monotonic() - entry[0] > self.local_timeout:
+                del self._entries[slack_id]
+                return False, None
+            self._entries.move_to_end(slack_id)
+            return True, entry[1]
+
+    def _set_local(self, slack_id, match):
+        with self._lock:
+            self._entries[slack_id] = (time.monotonic(), match)
+            self._entries.move_to_end(slack_id)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def _query(self, slack_id):
+        users = list(
+            get_user_model()
+            .objects.filter(Q(slack_user_id=slack_id) | Q(slack_channel_id=slack_id))
+            .order_by("id")
+            .values_list("id", "language", "slack_user_id")
+        )
+        # A match on the user id wins from one on the channel id
+        users.sort(key=lambda user: user[2] != slack_id)
+        if not len(users):
+            return None
+        return users[0][0], users[0][1]
+
+    def get(self, slack_id):
+        """
+        Find the user with this Slack user or channel id
+
+        :param slack_id str: Slack user or channel id
+        :return tuple: `(user id, language)` or `None`
+        """
+        if not slack_id:
+            return None
+
+        found, match = self._get_local(slack_id)
+        if found:
+            return match
+
+        cached = cache.get(self._get_cache_key(slack_id))
+        if cached is not None:
+            # Stored as a list, an empty one if there is no user
+            match = tuple(cached) if len(cached) else None
+        else:
+            match = self._query(slack_id)
+            cache.set(
+                self._get_cache_key(slack_id),
+                list(match) if match is not None else [],
+                self.timeout,
+            )
+        if match is not None:
+            # Users that aren't linked yet might be soon (in another process), so
+            # only the shared cache (which gets cleared on save) keeps those
+            self._set_local(slack_id, match)
+        return match
+
+    def invalidate(self, slack_ids):
+        """
+        Forget these ids, here and in the shared cache
+
+        :param slack_ids list: Slack user and/or channel ids
+        """
+        slack_ids = [slack_id for slack_id in slack_ids if slack_id]
+        if not len(slack_ids):
+            return
+
+        with self._lock:
+            for slack_id in slack_ids:
+                self._entries.pop(slack_id, None)
+        cache.delete_many([self._get_cache_key(slack_id) for slack_id in slack_ids])
+
+    def clear(self):
+        # Only clears the ids in memory of this process
+        with self._lock:
+            self._entries.clear()
+
+
+slack_user_lookup = SlackUserLookup(
+    max_size=settings.SLACK_USER_LOOKUP_SIZE,
+    timeout=settings.SLACK_USER_LOOKUP_TIMEOUT,
+    local_timeout=settings.SLACK_USER_LOOKUP_LOCAL_TIMEOUT,
+)
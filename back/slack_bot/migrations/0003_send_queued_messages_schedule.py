@@ -0,0 +1,33 @@
+# Generated by Django 5.2.7 on 2026-10-18 19:34
+
+from django.db import migrations
+
+
+def add_schedule(apps, schema_editor):
+    from django_q.models import Schedule
+
+    Schedule.objects.get_or_create(
+        func="slack_bot.tasks.send_queued_messages",
+        defaults={
+            "name": "Send queued Slack messages",
+            "schedule_type": Schedule.CRON,
+            "cron": "* * * * *",
+        },
+    )
+
+
+def remove_schedule(apps, schema_editor):
+    from django_q.models import Schedule
+
+    Schedule.objects.filter(func="slack_bot.tasks.send_queued_messages").delete()
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("django_q", "0018_task_success_index"),
+        ("slack_bot", "0002_outboundslackmessage"),
+    ]
+
+    operations = [
+        migrations.RunPython(add_schedule, remove_schedule),
+    ]
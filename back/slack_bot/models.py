@@ -1,4 +1,5 @@
 from django.db import models
+from django.utils import timezone
 
 from .utils import Slack
 
@@ -21,3 +22,16 @@ class SlackChannel(models.Model):
 
     def __str__(self):
         return self.name
+
+
+class OutboundSlackMessage(models.Model):
+    # Messages that still need to be sent, they get deleted once they are sent (or
+    # failed for good). See `slack_bot.outbound`.
+    method = models.CharField(max_length=100, default="chat.postMessage")
+    channel = models.CharField(max_length=255)
+    # Arguments of the API call, besides the channel
+    data = models.JSONField(default=dict)
+    attempts = models.IntegerField(default=0)
+    send_after = models.DateTimeField(default=timezone.now)
+    error = models.TextField(default="", blank=True)
+    created = models.DateTimeField(auto_now_add=True)
@@ -0,0 +1,385 @@
+import json
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Exists, Min, OuterRef, Q
+from django.utils import timezone
+from django_q.tasks import async_task
+from slack_sdk.errors import SlackApiError
+
+from organization.models import Notification
+
+from .client import get_client
+from .models import OutboundSlackMessage
+
+# Requests to start draining the queue within this amount of seconds are combined
+DRAIN_REQUEST_TIMEOUT = 10
+
+# Claimed messages that aren't handled within this amount of seconds (i.e. the worker
+# died) are sent again
+CLAIM_SECONDS = 300
+
+# Outcomes of sending one message
+SENT = "sent"
+FAILED = "failed"
+RETRY = "retry"
+
+
+class TokenBucket:
+    """
+    Allows `rate` calls per second, with bursts of up to `capacity` calls. Thread-safe.
+
+    :param rate float: calls per second
+    :param capacity float: max amount of calls in a burst
+    """
+
+    def __init__(self, rate, capacity, clock=time.monotonic):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.clock = clock
+        self.updated = clock()
+        self.paused_until = 0
+        self._lock = threading.Lock()
+
+    def reserve(self):
+        """
+        Take a token if there is one
+
+        :return float: 0 if a token got taken, otherwise the seconds to wait
+        """
+        with self._lock:
+            now = self.clock()
+            self.tokens = min(
+                self.capacity, self.tokens + (now - self.updated) * self.rate
+            )
+            self.updated = now
+            if now < self.paused_until:
+                return self.paused_until - now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return 0
+            return (1 - self.tokens) / self.rate
+
+    def acquire(self, sleep=time.sleep):
+        # Block until a token is available
+        while (wait := self.reserve()) > 0:
+            sleep(wait)
+
+    def pause(self, seconds):
+        # Slack told us to back off, don't hand out tokens for a while
+        with self._lock:
+            self.paused_until = max(self.paused_until, self.clock() + seconds)
+            self.tokens = 0
+
+
+class RateLimiter:
+    """
+    Token buckets for the methods of the Slack API (Slack limits them per workspace)
+    and for posting messages in a channel (about one per second per channel).
+
+    :param method_rates dict: {method: calls per minute}, `default` for all others
+    :param channel_rate int: messages per minute in one channel
+    :param max_channels int: amount of channel buckets to keep
+    """
+
+    def __init__(self, method_rates, channel_rate, max_channels=1000):
+        self.method_rates = method_rates
+        self.channel_rate = channel_rate
+        self.max_channels = max_channels
+        self._methods = {}
+        self._channels = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _create_bucket(self, per_minute):
+        rate = per_minute / 60
+        return TokenBucket(rate=rate, capacity=max(1, rate))
+
+    def _get_method_bucket(self, method):
+        with self._lock:
+            if method not in self._methods:
+                self._methods[method] = self._create_bucket(
+                    self.method_rates.get(method, self.method_rates["default"])
+                )
+            return self._methods[method]
+
+    def _get_channel_bucket(self, channel):
+        with self._lock:
+            bucket = self._channels.get(channel)
+            if bucket is None:
+                bucket = self._channels[channel] = self._create_bucket(
+                    self.channel_rate
+                )
+            self._channels.move_to_end(channel)
+            # Buckets of channels that weren't used for a while are full anyway
+            while len(self._channels) > self.max_channels:
+                self._channels.popitem(last=False)
+            return bucket
+
+    def acquire(self, method, channel):
+        if method == "chat.postMessage":
+            self._get_channel_bucket(channel).acquire()
+        self._get_method_bucket(method).acquire()
+
+    def pause(self, method, seconds):
+        self._get_method_bucket(method).pause(seconds)
+
+
+rate_limiter = RateLimiter(
+    method_rates=settings.SLACK_RATE_LIMITS,
+    channel_rate=settings.SLACK_CHANNEL_RATE_LIMIT,
+)
+
+
+def queue_messages(messages):
+    """
+    Add messages to the queue, they get sent by the `send_queued_messages` task
+
+    :param messages list: list of dicts with `channel`, `text` and `blocks`
+    """
+    OutboundSlackMessage.objects.bulk_create(
+        [
+            OutboundSlackMessage(
+                channel=message["channel"],
+                data={
+                    "text": message.get("text", ""),
+                    "blocks": message.get("blocks", []),
+                },
+            )
+            for message in messages
+        ]
+    )
+    transaction.on_commit(request_drain)
+
+
+def request_drain():
+    # The queue also gets drained every minute, this just makes it faster
+    if cache.add("slack_queue_drain_requested", True, DRAIN_REQUEST_TIMEOUT):
+        async_task("slack_bot.tasks.send_queued_messages")
+
+
+def get_retry_after(response):
+    headers = response.headers or {}
+    try:
+        return int(headers.get("Retry-After", headers.get("retry-after", 1)))
+    except (TypeError, ValueError):
+        return 1
+
+
+def send_lane(client, limiter, messages):
+    """
+    Send the messages of one channel in order. Sending stops at the first message
+    that needs to be retried, so the ones after it don't overtake it.
+
+    :param client WebClient: Slack client
+    :param limiter RateLimiter: rate limits to keep
+    :param messages list: messages of one channel
+    :return list: `(message, outcome, details)` tuples, details is the response
+        data, the error or the seconds to wait before retrying
+    """
+    results = []
+    for message in messages:
+        limiter.acquire(message.method, message.channel)
+        try:
+            response = client.api_call(
+                message.method, json={"channel": message.channel, **message.data}
+            )
+        except SlackApiError as e:
+            if e.response.status_code == 429:
+                retry_after = get_retry_after(e.response)
+                limiter.pause(message.method, retry_after)
+                results.append((message, RETRY, (retry_after, str(e))))
+                break
+            # Slack refused the message (i.e. channel_not_found), no use retrying
+            results.append((message, FAILED, str(e)))
+        except Exception as e:
+            # Connection issues, try again a bit later
+            results.append((message, RETRY, (2 ** (message.attempts + 1), str(e))))
+            break
+        else:
+            results.append((message, SENT, response.data))
+    return results
+
+
+def get_lanes(messages):
+    """
+    Group the messages by channel. A channel is skipped completely when an earlier
+    message of it isn't part of this batch (it's waiting or being sent by someone
+    else).
+
+    :param messages list: due messages ordered by id
+    :return dict: {channel: [messages]}
+    """
+    lanes = OrderedDict()
+    for message in messages:
+        lanes.setdefault(message.channel, []).append(message)
+
+    earlier = (
+        OutboundSlackMessage.objects.filter(channel__in=list(lanes.keys()))
+        .exclude(id__in=[message.id for message in messages])
+        .values("channel")
+        .annotate(first_id=Min("id"))
+    )
+    for item in earlier:
+        if item["first_id"] < lanes[item["channel"]][0].id:
+            del lanes[item["channel"]]
+    return lanes
+
+
+def claim_batch(batch_size):
+    """
+    Claim the first due messages of channels that aren't waiting for an earlier
+    message. Claimed messages are pushed back by `CLAIM_SECONDS`, so other workers
+    skip them while they are being sent (and pick them up again if this worker
+    dies halfway).
+
+    :param batch_size int: max amount of messages to claim
+    :return dict: {channel: [messages]}
+    """
+    with transaction.atomic():
+        now = timezone.now()
+        waiting = OutboundSlackMessage.objects.filter(
+            channel=OuterRef("channel"), id__lt=OuterRef("id"), send_after__gt=now
+        )
+        messages = list(
+            OutboundSlackMessage.objects.select_for_update(skip_locked=True)
+            .filter(send_after__lte=now)
+            .exclude(Exists(waiting))
+            .order_by("id")[:batch_size]
+        )
+        lanes = get_lanes(messages)
+        OutboundSlackMessage.objects.filter(
+            id__in=[message.id for lane in lanes.values() for message in lane]
+        ).update(send_after=now + timedelta(seconds=CLAIM_SECONDS))
+    return lanes
+
+
+def create_notifications(results):
+    # Log the messages in the same way `Slack.send_message` does
+    channels = {message.channel for message, _outcome, _details in results}
+    users = {}
+    for user in (
+        get_user_model()
+        .objects.filter(
+            Q(slack_user_id__in=channels) | Q(slack_channel_id__in=channels)
+        )
+        .order_by("id")
+    ):
+        users.setdefault(user.slack_user_id, user)
+        users.setdefault(user.slack_channel_id, user)
+
+    notifications = []
+    for message, outcome, details in results:
+        user = users.get(message.channel)
+        if user is None or outcome == RETRY:
+            continue
+        blocks = message.data.get("blocks", [])
+        notifications.append(
+            Notification(
+                notification_type=Notification.Type.SENT_SLACK_MESSAGE
+                if outcome == SENT
+                else Notification.Type.FAILED_SEND_SLACK_MESSAGE,
+                extra_text=message.data.get("text", ""),
+                created_for=user,
+                description=json.dumps(blocks) if outcome == SENT else details,
+                blocks=blocks,
+            )
+        )
+    Notification.objects.bulk_create(notifications)
+
+
+def drain_batch(client, limiter, batch_size, max_concurrent):
+    """
+    Send one batch of due messages. Channels get sent concurrently, the messages of
+    a channel one by one. Messages are claimed first, sending happens outside of a
+    transaction and the results get stored afterwards.
+
+    :return dict: amount of messages that got sent, failed or have to be retried
+    """
+    stats = {SENT: 0, FAILED: 0, RETRY: 0}
+    lanes = claim_batch(batch_size)
+    if not len(lanes):
+        return stats
+
+    with ThreadPoolExecutor(max_workers=max_concurrent) as executor:
+        futures = [
+            executor.submit(send_lane, client, limiter, lane) for lane in lanes.values()
+        ]
+        results = [result for future in futures for result in future.result()]
+
+    done_ids = []
+    retried = []
+    for message, outcome, details in results:
+        if outcome == RETRY:
+            retry_after, error = details
+            message.attempts += 1
+            message.error = error
+            message.send_after = timezone.now() + timedelta(seconds=retry_after)
+            if message.attempts < settings.SLACK_QUEUE_MAX_ATTEMPTS:
+                retried.append(message)
+                stats[RETRY] += 1
+                continue
+            outcome = FAILED
+        stats[outcome] += 1
+        done_ids.append(message.id)
+
+    # Messages after a retried one weren't sent, they can go as soon as it did
+    handled_ids = {message.id for message, _outcome, _details in results}
+    with transaction.atomic():
+        OutboundSlackMessage.objects.filter(id__in=done_ids).delete()
+        OutboundSlackMessage.objects.bulk_update(
+            retried, ["attempts", "error", "send_after"]
+        )
+        OutboundSlackMessage.objects.filter(
+            id__in=[
+                message.id
+                for lane in lanes.values()
+                for message in lane
+                if message.id not in handled_ids
+            ]
+        ).update(send_after=timezone.now())
+
+    # Only logging, the messages are gone from the queue at this point so they
+    # never get sent twice
+    create_notifications(
+        [
+            (message, outcome, details[1] if outcome == RETRY else details)
+            for message, outcome, details in results
+            if message.id in done_ids
+        ]
+    )
+    return stats
+
+
+def drain(client=None, limiter=None, batch_size=None, max_concurrent=None):
+    """
+    Send the queued messages in batches until none are due anymore (or the time of
+    `SLACK_QUEUE_DRAIN_SECONDS` is up)
+
+    :param client WebClient: Slack client, defaults to the shared one
+    :param limiter RateLimiter: rate limits, defaults to the ones of this process
+    :param batch_size int: amount of messages to take at once
+    :param max_concurrent int: amount of channels to send to at the same time
+    :return dict: amount of messages that got sent, failed or have to be retried
+    """
+    client = client or get_client()
+    limiter = limiter or rate_limiter
+    batch_size = batch_size or settings.SLACK_QUEUE_BATCH_SIZE
+    max_concurrent = max_concurrent or settings.SLACK_QUEUE_MAX_CONCURRENT
+
+    stats = {SENT: 0, FAILED: 0, RETRY: 0}
+    started = time.monotonic()
+    while time.monotonic() - started < settings.SLACK_QUEUE_DRAIN_SECONDS:
+        batch_stats = drain_batch(client, limiter, batch_size, max_concurrent)
+        for key, amount in batch_stats.items():
+            stats[key] += amount
+        if batch_stats[SENT] + batch_stats[FAILED] == 0:
+            break
+    return stats
@@ -6,12 +6,13 @@ from django.utils.translation import gettext as _
 
 from admin.integrations.models import Integration
 from organization.models import Organization, WelcomeMessage
+from slack_bot.digest import build_daily_digests, get_digest_users
+from slack_bot.outbound import drain
 from slack_bot.slack_intro import SlackIntro
 from slack_bot.slack_misc import get_new_hire_first_message_buttons
-from slack_bot.slack_resource import SlackResource
 from slack_bot.slack_to_do import SlackToDoManager
 from slack_bot.utils import Slack, actions, button, paragraph
-from users.models import ResourceUser, ToDoUser
+from users.models import ToDoUser
 
 
 def link_slack_users(users=[]):
@@ -73,7 +74,7 @@ def link_slack_users(users=[]):
                     tasks.values_list("id", flat=True),
                     text=_("These are the tasks you need to complete:"),
                 )
-                Slack().send_message(
+                Slack().queue_message(
                     blocks=blocks,
                     text=_("These are the tasks you need to complete:"),
                     channel=user.slack_user_id,
@@ -87,58 +88,12 @@ def update_new_hire():
     ):
         return
 
-    for user in get_user_model().new_hires.with_slack():
-        local_datetime = user.get_local_time()
+    # New hires for whom it's 8 am now, with all their items loaded at once
+    messages = []
+    for digest in build_daily_digests(get_digest_users()):
+        messages.extend(digest.get_slack_messages())
 
-        if not (
-            local_datetime.hour == 8
-            and local_datetime.weekday() < 5
-            and local_datetime.date() >= user.start_day
-        ):
-            continue
-
-        translation.activate(user.language)
-
-        overdue_items = ToDoUser.objects.overdue(user)
-        tasks = ToDoUser.objects.due_today(user) | overdue_items
-
-        courses_due = ResourceUser.objects.filter(
-            user=user, resource__on_day__lte=user.workday
-        )
-        # Filter out completed courses
-        course_blocks = [
-            SlackResource(course, user).get_block()
-            for course in courses_due
-            if course.is_course
-        ]
-
-        if len(course_blocks):
-            course_blocks.insert(
-                0, paragraph(_("Here are some courses that you need to complete"))
-            )
-            Slack().send_message(
-                blocks=course_blocks,
-                text=_("Here are some courses that you need to complete"),
-                channel=user.slack_user_id,
-            )
-
-        # If any overdue tasks exist, then notify the user
-        if tasks.exists():
-            if overdue_items.exists():
-                text = _(
-                    "Good morning! These are the tasks you need to complete. Some to "
-                    "do items are overdue. Please complete those as soon as possible!"
-                )
-            else:
-                text = _(
-                    "Good morning! These are the tasks you need to complete today:"
-                )
-
-            blocks = SlackToDoManager(user).get_blocks(
-                tasks.values_list("id", flat=True),
-                text=text,
-            )
-            Slack().send_message(blocks=blocks, text=text, channel=user.slack_user_id)
+    Slack().queue_messages(messages)
 
 
 def first_day_reminder():
@@ -172,7 +127,7 @@ def first_day_reminder():
             if org.slack_default_channel is not None
             else "general"
         )
-        Slack().send_message(text=text, channel="#" + send_to)
+        Slack().queue_message(text=text, channel="#" + send_to)
 
 
 def birthday_reminder():
@@ -195,7 +150,7 @@ def birthday_reminder():
         text = _("It's %(names)s birthday today!") % {"names": names}
 
         send_to = org.slack_birthday_wishes_channel.name
-        Slack().send_message(text=text, channel="#" + send_to)
+        Slack().queue_message(text=text, channel="#" + send_to)
 
 
 def introduce_new_people():
@@ -284,7 +239,18 @@ def introduce_new_people():
         if org.slack_default_channel is not None
         else "general"
     )
-    Slack().send_message(channel="#" + send_to, text=text, blocks=blocks)
+    Slack().queue_message(channel="#" + send_to, text=text, blocks=blocks)
 
     # Make sure they aren't introduced again
     new_hires.update(is_introduced_to_colleagues=True)
+
+
+def send_queued_messages():
+    # Drop if Slack is not enabled
+    if (
+        not Integration.objects.filter(integration=Integration.Type.SLACK_BOT).exists()
+        and settings.SLACK_APP_TOKEN == ""
+    ):
+        return
+
+    return drain()
@@ -1,16 +1,35 @@
+import inspect
 import json
+import logging
+import os
+import ssl
+import threading
 from datetime import datetime, timedelta
+from functools import wraps
 from unittest.mock import Mock, patch
 
 import pytest
 from django.contrib.auth import get_user_model
 from django.core.cache import cache
+from django.utils import timezone
 from django.utils.formats import localize
 from freezegun import freeze_time
+from slack_bolt.lazy_listener.internals import build_runnable_function
+from slack_sdk.web.base_client import BaseClient
 
 from admin.integrations.models import Integration
-from organization.models import Organization, WelcomeMessage
-from slack_bot.models import SlackChannel
+from organization.models import Notification, Organization, WelcomeMessage
+from slack_bot.client import PooledWebClient, get_client, slack_clients
+from slack_bot.dispatch import (
+    BoundedExecutor,
+    HandlerMetrics,
+    handler_metrics,
+    lazy,
+)
+from slack_bot.fake_slack import FakeSlackServer
+from slack_bot.lookup import slack_user_lookup
+from slack_bot.models import OutboundSlackMessage, SlackChannel
+from slack_bot.outbound import RateLimiter, drain
 from slack_bot.tasks import (
     birthday_reminder,
     first_day_reminder,
@@ -18,7 +37,9 @@ from slack_bot.tasks import (
     link_slack_users,
     update_new_hire,
 )
+from slack_bot.utils import Slack
 from slack_bot.views import (
+    get_user,
     slack_add_sequences_to_new_hire,
     slack_catch_all_message_search_resources,
     slack_change_resource_page,
@@ -2414,3 +2435,375 @@ def test_introduce_new_hire(new_hire_factory, integration_factory):
             ],
         },
     ]
+
+
+@pytest.mark.django_db
+def test_slack_client_is_shared(settings, django_assert_num_queries):
+    settings.FAKE_SLACK_API = False
+    integration = Integration.objects.create(
+        integration=Integration.Type.SLACK_BOT, token="xoxb-first"
+    )
+
+    with django_assert_num_queries(1):
+        clients = [Slack().client for _ in range(5)]
+
+    assert all(client is clients[0] for client in clients)
+    assert clients[0].token == "xoxb-first"
+
+    # Saving the integration (i.e. a rotated token) creates a new client
+    integration.token = "xoxb-second"
+    integration.save()
+
+    assert Slack().client is not clients[0]
+    assert Slack().client.token == "xoxb-second"
+
+    # Other processes check the token again after the timeout
+    Integration.objects.filter(id=integration.id).update(token="xoxb-third")
+    assert Slack().client.token == "xoxb-second"
+    with patch.object(slack_clients, "timeout", 0):
+        assert Slack().client.token == "xoxb-third"
+
+
+@pytest.mark.django_db
+def test_slack_client_pooled_requests(settings):
+    settings.FAKE_SLACK_API = False
+    Integration.objects.create(integration=Integration.Type.SLACK_BOT, token="xoxb")
+    client = get_client()
+
+    with patch(
+        "requests.Session.request",
+        Mock(
+            return_value=Mock(
+                status_code=200,
+                headers={"Content-Type": "application/json"},
+                content=b'{"ok": true, "channel": "C123"}',
+                encoding="utf-8",
+            )
+        ),
+    ) as mock_request:
+        response = Slack().client.chat_postMessage(channel="C123", text="Hi")
+
+    assert response["channel"] == "C123"
+    assert mock_request.call_args[0] == (
+        "POST",
+        "https://slack.com/api/chat.postMessage",
+    )
+    assert mock_request.call_args[1]["headers"]["Authorization"] == "Bearer xoxb"
+
+    # A revoked token gets the client recreated on the next call
+    with patch(
+        "requests.Session.request",
+        Mock(
+            return_value=Mock(
+                status_code=200,
+                headers={"Content-Type": "application/json"},
+                content=b'{"ok": false, "error": "token_revoked"}',
+                encoding="utf-8",
+            )
+        ),
+    ):
+        Slack().send_message(channel="C123", text="Hi")
+
+    assert get_client() is not client
+
+
+@pytest.mark.django_db
+def test_slack_client_private_method():
+    # PooledWebClient replaces this private method of the SDK, make sure it still
+    # gets called the same way after upgrading slack-sdk
+    method = BaseClient._perform_urllib_http_request_internal
+    assert list(inspect.signature(method).parameters) == ["self", "url", "req"]
+    assert "_perform_urllib_http_request_internal(url, req)" in inspect.getsource(
+        BaseClient._perform_urllib_http_request
+    )
+
+    ssl_context = ssl.create_default_context()
+    client = PooledWebClient(token="xoxb", ssl=ssl_context)
+    assert client.session.get_adapter("https://slack.com").ssl_context is ssl_context
+
+
+@pytest.mark.django_db
+def test_outbound_queue(settings, new_hire_factory):
+    settings.FAKE_SLACK_API = False
+    Integration.objects.create(integration=Integration.Type.SLACK_BOT, token="xoxb")
+    new_hire = new_hire_factory(slack_user_id="C1")
+    colleague = new_hire_factory(slack_user_id="C3")
+
+    Slack().queue_message(channel="C1", text="First")
+    Slack().queue_message(channel="C2", text="Other channel")
+    Slack().queue_message(channel="C1", text="Second")
+    Slack().queue_message(channel="C3", text="Unknown channel")
+
+    assert OutboundSlackMessage.objects.count() == 4
+
+    limiter = RateLimiter(method_rates={"default": 6000}, channel_rate=6000)
+    with (
+        FakeSlackServer(
+            errors={"C3": "channel_not_found"},
+            rate_limit_first={"chat.postMessage": 1},
+            retry_after=30,
+        ) as server,
+        patch.object(limiter, "pause") as mock_pause,
+    ):
+        client = PooledWebClient(token="xoxb", base_url=server.url)
+
+        # First message got rate limited, the second one has to wait for it
+        stats = drain(client=client, limiter=limiter, max_concurrent=1)
+        assert stats == {"sent": 1, "failed": 1, "retry": 1}
+        mock_pause.assert_called_once_with("chat.postMessage", 30)
+        assert server.messages() == ["Other channel"]
+        first = OutboundSlackMessage.objects.order_by("id").first()
+        assert first.attempts == 1
+        assert first.send_after > timezone.now()
+
+        # Nothing is due yet
+        assert drain(client=client, limiter=limiter)["sent"] == 0
+
+        OutboundSlackMessage.objects.update(send_after=timezone.now())
+        assert drain(client=client, limiter=limiter)["sent"] == 2
+
+    assert server.messages("C1") == ["First", "Second"]
+    assert not OutboundSlackMessage.objects.exists()
+    assert (
+        Notification.objects.filter(
+            created_for=new_hire,
+            notification_type=Notification.Type.SENT_SLACK_MESSAGE,
+        ).count()
+        == 2
+    )
+    assert Notification.objects.filter(
+        created_for=colleague,
+        notification_type=Notification.Type.FAILED_SEND_SLACK_MESSAGE,
+    ).exists()
+
+
+@pytest.mark.django_db
+def test_outbound_queue_skips_waiting_channels():
+    OutboundSlackMessage.objects.create(
+        channel="C1", send_after=timezone.now() + timedelta(minutes=5)
+    )
+    OutboundSlackMessage.objects.create(channel="C1", data={"text": "Waits"})
+    OutboundSlackMessage.objects.create(channel="C2", data={"text": "Due"})
+
+    limiter = RateLimiter(method_rates={"default": 6000}, channel_rate=6000)
+    with FakeSlackServer() as server:
+        client = PooledWebClient(token="xoxb", base_url=server.url)
+
+        # The waiting channel doesn't block the batch
+        stats = drain(client=client, limiter=limiter, batch_size=1)
+        assert stats == {"sent": 1, "failed": 0, "retry": 0}
+        assert server.messages() == ["Due"]
+
+        # Sent messages are removed before they get logged
+        OutboundSlackMessage.objects.create(channel="C2", data={"text": "Again"})
+        with (
+            patch(
+                "slack_bot.outbound.create_notifications",
+                Mock(side_effect=Exception("Something went wrong")),
+            ),
+            pytest.raises(Exception),
+        ):
+            drain(client=client, limiter=limiter)
+        assert drain(client=client, limiter=limiter)["sent"] == 0
+
+    assert server.messages() == ["Due", "Again"]
+    assert list(OutboundSlackMessage.objects.values_list("channel", flat=True)) == [
+        "C1",
+        "C1",
+    ]
+
+
+@pytest.mark.django_db
+def test_outbound_queue_disabled(settings):
+    # Tests (fake Slack) and disabled queues send the message right away
+    Slack().queue_message(channel="C1", text="Hi")
+
+    assert not OutboundSlackMessage.objects.exists()
+    assert cache.get("slack_text") == "Hi"
+
+
+@pytest.mark.django_db
+@freeze_time("2022-05-13 08:00:00")
+def test_update_new_hire_digest(
+    settings,
+    new_hire_factory,
+    to_do_user_factory,
+    resource_user_factory,
+    django_assert_max_num_queries,
+):
+    settings.FAKE_SLACK_API = False
+    Integration.objects.create(integration=Integration.Type.SLACK_BOT, token="xoxb")
+    start_day = datetime.now().date() - timedelta(days=2)
+
+    # 8 am for the first two (the organization is in UTC), not for the others
+    users = [
+        new_hire_factory(start_day=start_day, slack_user_id="U1"),
+        new_hire_factory(
+            start_day=start_day, slack_user_id="U2", timezone="Atlantic/Reykjavik"
+        ),
+        new_hire_factory(
+            start_day=start_day, slack_user_id="U3", timezone="Europe/Amsterdam"
+        ),
+        new_hire_factory(start_day=datetime.now().date(), slack_user_id="U4"),
+    ]
+    # Hasn't started yet
+    new_hire_factory(
+        start_day=datetime.now().date() + timedelta(days=1), slack_user_id="U5"
+    )
+    for user in users:
+        to_do_user_factory(user=user, to_do__due_on_day=1)
+        to_do_user_factory(user=user, to_do__due_on_day=3)
+        to_do_user_factory(user=user, to_do__due_on_day=5)
+    resource_user_factory(user=users[0], resource__course=True, resource__on_day=2)
+    resource_user_factory(user=users[0], resource__course=True, resource__on_day=4)
+    resource_user_factory(user=users[1], resource__course=False)
+
+    # Doesn't depend on the amount of users
+    with django_assert_max_num_queries(10):
+        update_new_hire()
+
+    messages = list(OutboundSlackMessage.objects.order_by("id"))
+    assert [message.channel for message in messages] == ["U1", "U1", "U2", "U4"]
+    # Course first, then the to do items (one overdue)
+    assert len(messages[0].data["blocks"]) == 2
+    assert "overdue" in messages[1].data["text"]
+    assert len(messages[1].data["blocks"]) == 3
+    # First day, only the item of today
+    assert messages[3].data["text"] == (
+        "Good morning! These are the tasks you need to complete today:"
+    )
+    assert len(messages[3].data["blocks"]) == 2
+
+
+@pytest.mark.django_db
+def test_slack_user_lookup(new_hire_factory, django_assert_num_queries):
+    new_hire = new_hire_factory(slack_user_id="U1", slack_channel_id="D1")
+
+    assert slack_user_lookup.get("U1") == (new_hire.id, "en")
+    assert slack_user_lookup.get("D1") == (new_hire.id, "en")
+    assert slack_user_lookup.get("U2") is None
+
+    # Kept in memory, only the user itself gets fetched
+    with django_assert_num_queries(1):
+        assert get_user("U1") == new_hire
+
+    # Other processes only have the shared cache
+    slack_user_lookup.clear()
+    with django_assert_num_queries(1):
+        assert slack_user_lookup.get("U1") == (new_hire.id, "en")
+
+    # Saving the user forgets the old and new ids
+    new_hire.slack_user_id = "U2"
+    new_hire.language = "nl"
+    new_hire.save()
+
+    assert slack_user_lookup.get("U1") is None
+    assert slack_user_lookup.get("U2") == (new_hire.id, "nl")
+
+    new_hire.delete()
+    assert slack_user_lookup.get("U2") is None
+
+
+@pytest.mark.django_db
+def test_bounded_executor_overflow(settings):
+    started = threading.Event()
+    release = threading.Event()
+    threads = {}
+
+    def handler(body):
+        threads[body["id"]] = threading.current_thread().name
+        if body["id"] == "busy":
+            started.set()
+            release.wait(5)
+
+    def bolt_lazy_listener(listener, body):
+        # Bolt builds the arguments in a wrapper, see `build_runnable_function`
+        return wraps(listener)(lambda: listener(body=body))
+
+    handler.__module__ = "slack_bot.views"
+    executor = BoundedExecutor(max_workers=1, max_queue=0, metrics=handler_metrics)
+    busy = executor.submit(bolt_lazy_listener(lazy(handler), {"id": "busy"}))
+    started.wait(5)
+
+    # Acknowledging doesn't need a free handler thread
+    ack = executor.submit(lambda: threading.current_thread().name)
+    assert ack.result(5).startswith("slack-listener")
+
+    # The only thread is busy and nothing can wait, so handlers become tasks...
+    with patch("slack_bot.dispatch.async_task") as mock_async_task:
+        executor.submit(bolt_lazy_listener(lazy(handler), {"id": "queued"})).result()
+        # ... unless they open a modal, those run right here
+        executor.submit(
+            bolt_lazy_listener(lazy(handler, queue=False), {"id": "modal"})
+        ).result()
+
+    assert mock_async_task.call_args.args[1:] == (
+        "slack_bot.views.handler",
+        {"body": {"id": "queued"}},
+    )
+    assert "queued" not in threads
+    assert threads["modal"] == threading.current_thread().name
+    assert handler_metrics.stats()["overflowed"] == 2
+
+    release.set()
+    busy.result(5)
+    assert threads["busy"].startswith("slack_")
+    assert handler_metrics.stats()["max_queue_depth"] == 1
+    assert handler_metrics.stats()["queue_depth"] == 0
+    executor.shutdown()
+
+
+@pytest.mark.django_db
+def test_bolt_lazy_listener_keeps_handler_marker():
+    # `BoundedExecutor` relies on Bolt copying the attributes of the lazy listener
+    runnable = build_runnable_function(
+        func=lazy(Mock(__name__="handler")), logger=Mock(), request=Mock()
+    )
+    assert runnable.slack_handler
+
+
+@pytest.mark.django_db
+def test_handler_metrics_get_logged(caplog):
+    metrics = HandlerMetrics(log_interval=60)
+    with caplog.at_level(logging.INFO, logger="slack_bot.dispatch"):
+        metrics.record("handler", 10)
+        assert caplog.records == []
+
+        # Logged once the interval passed
+        metrics._logged_at -= 60
+        metrics.record("handler", 30)
+        metrics.record("handler", 20)
+
+    assert len(caplog.records) == 1
+    assert str(os.getpid()) in caplog.records[0].getMessage()
+    assert '"avg_ms": 20' in caplog.records[0].getMessage()
+    assert '"calls": 2' in caplog.records[0].getMessage()
+
+
+@pytest.mark.django_db
+def test_lazy_slack_handler(settings):
+    handler = Mock(__name__="handler", __module__="slack_bot.views")
+    handler.side_effect = [None, Exception("Something went wrong"), None]
+    listener = lazy(handler)
+
+    listener(body={"id": 1})
+    # Errors get reported, but don't reach Slack
+    listener(body={"id": 2})
+
+    handler.assert_called_with(body={"id": 2})
+    stats = handler_metrics.stats()["handlers"]["handler"]
+    assert stats["calls"] == 2
+    assert stats["errors"] == 1
+
+    # Handlers get queued as tasks, except the ones that open a modal
+    settings.SLACK_HANDLER_MODE = "task"
+    with patch("slack_bot.dispatch.async_task") as mock_async_task:
+        listener(body={"id": 3})
+        lazy(handler, queue=False)(body={"id": 4})
+
+    mock_async_task.assert_called_once()
+    assert mock_async_task.call_args.args[1:] == (
+        "slack_bot.views.handler",
+        {"body": {"id": 3}},
+    )
+    handler.assert_called_with(body={"id": 4})
@@ -1,31 +1,19 @@
 import json
 
-import slack_sdk
 from django.conf import settings
 from django.core.cache import cache
-from django.db.models import Q
-from slack_bolt import App as SlackBoltApp
-from slack_bolt.adapter.socket_mode import SocketModeHandler
 
-from admin.integrations.models import Integration
 from organization.models import Notification
 
+from .client import get_client
+from .lookup import slack_user_lookup
+
 
 class Slack:
     def __init__(self):
         if not settings.FAKE_SLACK_API:
-            if not settings.SLACK_USE_SOCKET:
-                team = Integration.objects.get(integration=Integration.Type.SLACK_BOT)
-                self.client = slack_sdk.WebClient(token=team.token)
-            else:
-                if settings.SLACK_BOT_TOKEN != "":
-                    app = SlackBoltApp(token=settings.SLACK_BOT_TOKEN)
-                    handler = SocketModeHandler(app, settings.SLACK_APP_TOKEN)
-                    handler.connect()
-                    self.client = app.client
-                    return
-
-                raise Exception("Access token not available")
+            # Shared client, this doesn't query the token or connect again
+            self.client = get_client()
 
     def get_channels(self):
         try:
@@ -130,8 +118,6 @@ class Slack:
         )
 
     def send_message(self, blocks=[], channel="", text=""):
-        from users.models import User
-
         # if there is no channel, then drop
         if channel == "" or channel is None:
             Notification.objects.create(
@@ -148,33 +134,64 @@ class Slack:
             return {"channel": "slacky"}
 
         response = None
-        users = User.objects.filter(
-            Q(slack_user_id=channel) | Q(slack_channel_id=channel)
-        )
+        # (user id, language) of the user this message is for
+        match = slack_user_lookup.get(channel)
         try:
             response = self.client.chat_postMessage(
                 channel=channel, text=text, blocks=blocks
             )
-            if users.exists():
+            if match is not None:
                 Notification.objects.create(
                     notification_type=Notification.Type.SENT_SLACK_MESSAGE,
                     extra_text=text,
-                    created_for=users.first(),
+                    created_for_id=match[0],
                     description=json.dumps(blocks),
                     blocks=blocks,
                 )
         except Exception as e:
-            if users.exists():
+            if match is not None:
                 Notification.objects.create(
                     notification_type=Notification.Type.FAILED_SEND_SLACK_MESSAGE,
                     extra_text=text,
-                    created_for=users.first(),
+                    created_for_id=match[0],
                     description=str(e),
                     blocks=blocks,
                 )
 
         return response
 
+    def queue_message(self, blocks=[], channel="", text=""):
+        """
+        Send a message through the outbound queue, for messages that don't need the
+        response of Slack. Falls back to sending it right away if the queue is
+        disabled.
+        """
+        self.queue_messages([{"channel": channel, "text": text, "blocks": blocks}])
+
+    def queue_messages(self, messages):
+        """
+        Send multiple messages through the outbound queue at once, see
+        `queue_message`
+
+        :param messages list: list of dicts with `channel`, `text` and `blocks`
+        """
+        from .outbound import queue_messages
+
+        queued = []
+        for message in messages:
+            if (
+                settings.FAKE_SLACK_API
+                or not settings.SLACK_QUEUE_MESSAGES
+                or message["channel"] == ""
+                or message["channel"] is None
+            ):
+                self.send_message(**message)
+            else:
+                queued.append(message)
+
+        if len(queued):
+            queue_messages(queued)
+
     def open_modal(self, trigger_id, view):
         if settings.FAKE_SLACK_API:
             cache.set("slack_trigger_id", trigger_id)
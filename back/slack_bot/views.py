@@ -17,6 +17,8 @@ from admin.sequences.models import Sequence
 from organization.models import Notification, Organization
 from users.models import NewHireWelcomeMessage, ResourceUser, ToDoUser
 
+from .dispatch import acknowledge, handler_executor, lazy
+from .lookup import slack_user_lookup
 from .slack_misc import get_new_hire_approve_sequence_options
 from .slack_resource import SlackResource, SlackResourceCategory
 from .slack_to_do import SlackToDo, SlackToDoManager
@@ -34,6 +36,7 @@ else:
             token=settings.SLACK_BOT_TOKEN,
             logger=logger,
             raise_error_for_unhandled_request=True,
+            listener_executor=handler_executor,
         )
 
         slack_handler = SocketModeHandler(app, settings.SLACK_APP_TOKEN)
@@ -43,7 +46,9 @@ else:
             integration=Integration.Type.SLACK_BOT
         ).first()
         app = SlackBoltApp(
-            token=integration.token, signing_secret=integration.signing_secret
+            token=integration.token,
+            signing_secret=integration.signing_secret,
+            listener_executor=handler_executor,
         )
 
 
@@ -106,10 +111,22 @@ def slack_show_help(message):
 
 
 def get_user(slack_user_id):
-    users = get_user_model().objects.filter(slack_user_id=slack_user_id)
-    if users.exists():
-        translation.activate(users.first().language)
-        return users.first()
+    user = None
+    match = slack_user_lookup.get(slack_user_id)
+    if match is not None:
+        user = (
+            get_user_model()
+            .objects.filter(id=match[0], slack_user_id=slack_user_id)
+            .first()
+        )
+        if user is None:
+            # The user got unlinked (in another process), look it up again
+            slack_user_lookup.invalidate([slack_user_id])
+            user = get_user_model().objects.filter(slack_user_id=slack_user_id).first()
+
+    if user is not None:
+        translation.activate(user.language)
+        return user
     else:
         Slack().send_message(
             text=_(
@@ -181,13 +198,6 @@ def slack_show_to_do_items_based_on_message(message):
     )
 
 
-@exception_handler
-@app.action(re.compile("(dialog:to_do:)"))
-def open_todo_dialog(ack, payload, body):
-    ack()
-    slack_open_todo_dialog(payload, body)
-
-
 def slack_open_todo_dialog(payload, body):
     user = get_user(body["user"]["id"])
     if user is None:
@@ -370,13 +380,6 @@ def slack_create_new_hire_or_ask_perm(event):
         )
 
 
-@exception_handler
-@app.action("create:newhire:approve")
-def open_modal_for_selecting_seq_item(ack, body, payload):
-    ack()
-    slack_open_modal_for_selecting_seq_item(body, payload)
-
-
 def slack_open_modal_for_selecting_seq_item(body, payload):
     view = {
         "type": "modal",
@@ -397,13 +400,6 @@ def slack_open_modal_for_selecting_seq_item(body, payload):
     Slack().open_modal(trigger_id=body["trigger_id"], view=view)
 
 
-@exception_handler
-@app.view("approve:newhire")
-def add_sequences_to_new_hire(ack, body, view):
-    ack()
-    slack_add_sequences_to_new_hire(body, view)
-
-
 def slack_add_sequences_to_new_hire(body, view):
     user = get_user(body["user"]["id"])
     if user is None:
@@ -432,13 +428,6 @@ def slack_add_sequences_to_new_hire(body, view):
     )
 
 
-@exception_handler
-@app.action("create:newhire:deny")
-def deny_new_hire(ack, body):
-    ack()
-    slack_deny_new_hire(body)
-
-
 def slack_deny_new_hire(body):
     org = Organization.object.get()
     translation.activate(org.language)
@@ -450,20 +439,10 @@ def slack_deny_new_hire(body):
     )
 
 
-@exception_handler
-@app.action("show_resource_items")
-def show_resource_items(ack, body):
-    ack()
+def slack_show_resource_items(body):
     slack_show_all_resources_categories({"user": body["user"]["id"]})
 
 
-@exception_handler
-@app.action(re.compile("(category:)"))
-def show_resources_items_in_category(ack, payload, body):
-    ack()
-    slack_show_resources_items_in_category(payload, body)
-
-
 def slack_show_resources_items_in_category(payload, body):
     user = get_user(body["user"]["id"])
     if user is None:
@@ -490,13 +469,6 @@ def slack_show_resources_items_in_category(payload, body):
     )
 
 
-@exception_handler
-@app.action(re.compile("(dialog:resource:)"))
-def open_resource_dialog(ack, payload, body):
-    ack()
-    slack_open_resource_dialog(payload, body)
-
-
 def slack_open_resource_dialog(payload, body):
     user = get_user(body["user"]["id"])
     if user is None:
@@ -517,13 +489,6 @@ def slack_open_resource_dialog(payload, body):
     Slack().open_modal(trigger_id=body["trigger_id"], view=view)
 
 
-@exception_handler
-@app.action("change_resource_page")
-def change_resource_page(ack, payload, body):
-    ack()
-    slack_change_resource_page(payload, body)
-
-
 def slack_change_resource_page(payload, body):
     user = get_user(body["user"]["id"])
     if user is None:
@@ -550,13 +515,6 @@ def slack_change_resource_page(payload, body):
     )
 
 
-@exception_handler
-@app.action("show_to_do_items")
-def show_to_do_items(ack, body):
-    ack()
-    slack_show_to_do_items(body)
-
-
 def slack_show_to_do_items(body):
     user = get_user(body["user"]["id"])
     if user is None:
@@ -576,13 +534,6 @@ def slack_show_to_do_items(body):
     )
 
 
-@exception_handler
-@app.view("complete:to_do")
-def complete_to_do(ack, body, view):
-    ack()
-    slack_complete_to_do(body, view)
-
-
 def slack_complete_to_do(body, view):
     user = get_user(body["user"]["id"])
     if user is None:
@@ -693,13 +644,6 @@ def slack_next_page_resource(ack, body, view):
         )
 
 
-@exception_handler
-@app.action("admin_task:complete")
-def complete_admin_task(ack, body, payload):
-    ack()
-    slack_complete_admin_task(body, payload)
-
-
 def slack_complete_admin_task(body, payload):
     user = get_user(body["user"]["id"])
     if user is None:
@@ -715,13 +659,6 @@ def slack_complete_admin_task(body, payload):
     )
 
 
-@exception_handler
-@app.action("dialog:welcome")
-def show_welcome_dialog(ack, body, payload):
-    ack()
-    slack_show_welcome_dialog(body, payload)
-
-
 def slack_show_welcome_dialog(body, payload):
     org = Organization.object.get()
     translation.activate(org.language)
@@ -760,13 +697,6 @@ def slack_show_welcome_dialog(body, payload):
     Slack().open_modal(trigger_id=body["trigger_id"], view=view)
 
 
-@exception_handler
-@app.view("save:welcome")
-def save_welcome_message(ack, body, view):
-    ack()
-    slack_save_welcome_message(body, view)
-
-
 def slack_save_welcome_message(body, view):
     org = Organization.object.get()
 
@@ -795,3 +725,39 @@ def slack_save_welcome_message(body, view):
         user=user.slack_user_id,
         text=_('Message has been saved! Your message: "') + message_to_new_hire + '"',
     )
+
+
+# Listeners that acknowledge right away and leave the work to a lazy listener (see
+# `slack_bot.dispatch`). Handlers that open a modal always run in a thread, as the
+# trigger id is only valid for a few seconds.
+app.action(re.compile("(dialog:to_do:)"))(
+    ack=acknowledge, lazy=[lazy(slack_open_todo_dialog, queue=False)]
+)
+app.action("create:newhire:approve")(
+    ack=acknowledge, lazy=[lazy(slack_open_modal_for_selecting_seq_item, queue=False)]
+)
+app.view("approve:newhire")(
+    ack=acknowledge, lazy=[lazy(slack_add_sequences_to_new_hire)]
+)
+app.action("create:newhire:deny")(ack=acknowledge, lazy=[lazy(slack_deny_new_hire)])
+app.action("show_resource_items")(
+    ack=acknowledge, lazy=[lazy(slack_show_resource_items)]
+)
+app.action(re.compile("(category:)"))(
+    ack=acknowledge, lazy=[lazy(slack_show_resources_items_in_category)]
+)
+app.action(re.compile("(dialog:resource:)"))(
+    ack=acknowledge, lazy=[lazy(slack_open_resource_dialog, queue=False)]
+)
+app.action("change_resource_page")(
+    ack=acknowledge, lazy=[lazy(slack_change_resource_page)]
+)
+app.action("show_to_do_items")(ack=acknowledge, lazy=[lazy(slack_show_to_do_items)])
+app.view("complete:to_do")(ack=acknowledge, lazy=[lazy(slack_complete_to_do)])
+app.action("admin_task:complete")(
+    ack=acknowledge, lazy=[lazy(slack_complete_admin_task)]
+)
+app.action("dialog:welcome")(
+    ack=acknowledge, lazy=[lazy(slack_show_welcome_dialog, queue=False)]
+)
+app.view("save:welcome")(ack=acknowledge, lazy=[lazy(slack_save_welcome_message)])
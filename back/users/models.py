@@ -1,12 +1,15 @@
-from datetime import datetime, timedelta
+from datetime import datetime
 
 import pytz
 from django.conf import settings
 from django.contrib.auth import get_user_model
 from django.contrib.auth.models import AbstractBaseUser, BaseUserManager
+from django.core.cache import cache
 from django.db import models
 from django.db.models import CheckConstraint, Q
-from django.template import Context, Template
+from django.db.models.signals import post_delete
+from django.dispatch import receiver
+from django.template import Context
 from django.template.loader import render_to_string
 from django.urls import reverse
 from django.utils.crypto import get_random_string
@@ -17,14 +20,18 @@ from django_q.tasks import async_task
 from admin.appointments.models import Appointment
 from admin.badges.models import Badge
 from admin.hardware.models import Hardware
+from admin.integrations.access import get_access_snapshot_cache_key, iter_access
 from admin.integrations.models import Integration
 from admin.introductions.models import Introduction
 from admin.preboarding.models import Preboarding
 from admin.resources.models import CourseAnswer, Resource
 from admin.sequences.models import Condition
+from admin.sequences.triggers import rebuild_condition_schedule
 from admin.to_do.models import ToDo
 from misc.models import File
+from misc.template_cache import get_template
 from organization.models import Notification
+from slack_bot.lookup import slack_user_lookup
 from slack_bot.utils import Slack, paragraph
 
 from .utils import CompletedFormCheck
@@ -59,6 +66,31 @@ class CustomUserManager(BaseUserManager):
         """
         return get_random_string(length, allowed_chars)
 
+    def add_sequences(self, users, sequences):
+        """
+        Add sequences to a group of users at once (i.e. after an import)
+
+        :param users list: list or queryset of users
+        :param sequences list: list or queryset of sequences
+        """
+        from admin.sequences.assignment import assign_sequences
+
+        users = list(users)
+        sequences = list(sequences)
+        assign_sequences(sequences, users)
+        Notification.objects.bulk_create(
+            [
+                Notification(
+                    notification_type=Notification.Type.ADDED_SEQUENCE,
+                    item_id=sequence.id,
+                    created_for=user,
+                    extra_text=sequence.name,
+                )
+                for user in users
+                for sequence in sequences
+            ]
+        )
+
 
 class ManagerSlackManager(models.Manager):
     def get_queryset(self):
@@ -410,9 +442,33 @@ class User(AbstractBaseUser):
     def has_module_perms(self, app_label):
         return self.is_superuser
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_schedule_values = instance._schedule_values
+        instance._loaded_slack_values = instance._slack_values
+        return instance
+
+    @property
+    def _slack_values(self):
+        # Values that are kept in the lookup of Slack ids, see `slack_user_lookup`
+        return tuple(
+            self.__dict__.get(field)
+            for field in ["slack_user_id", "slack_channel_id", "language"]
+        )
+
+    @property
+    def _schedule_values(self):
+        # Values that have an impact on when the timed conditions of a user trigger
+        return tuple(
+            self.__dict__.get(field)
+            for field in ["start_day", "termination_date", "timezone", "role"]
+        )
+
     def save(self, *args, **kwargs):
         self.email = self.email.lower()
-        if not self.pk:
+        is_new = self.pk is None
+        if is_new:
             while True:
                 unique_string = get_random_string(length=8)
                 if not User.objects.filter(unique_url=unique_string).exists():
@@ -420,15 +476,28 @@ class User(AbstractBaseUser):
             self.unique_url = unique_string
         super(User, self).save(*args, **kwargs)
 
-    def add_sequences(self, sequences):
-        for sequence in sequences:
-            sequence.assign_to_user(self)
-            Notification.objects.create(
-                notification_type=Notification.Type.ADDED_SEQUENCE,
-                item_id=sequence.id,
-                created_for=self,
-                extra_text=sequence.name,
+        # A new user doesn't have any conditions yet
+        if not is_new and (
+            getattr(self, "_loaded_schedule_values", None) != self._schedule_values
+        ):
+            self.rebuild_condition_schedule()
+        self._loaded_schedule_values = self._schedule_values
+
+        loaded_slack_values = getattr(self, "_loaded_slack_values", None)
+        if loaded_slack_values != self._slack_values:
+            slack_user_lookup.invalidate(
+                [*(loaded_slack_values or [])[:2], *self._slack_values[:2]]
             )
+        self._loaded_slack_values = self._slack_values
+
+    def rebuild_condition_schedule(self):
+        from organization.models import Organization
+
+        org = Organization.object.get()
+        rebuild_condition_schedule([self], org.timezone, org.workday_calendar)
+
+    def add_sequences(self, sequences):
+        get_user_model().objects.add_sequences([self], sequences)
 
     def remove_sequence(self, sequence):
         sequence.remove_from_user(self)
@@ -441,55 +510,39 @@ class User(AbstractBaseUser):
         if start_day > local_day:
             return 0
 
-        amount_of_workdays = 1
-        while local_day != start_day:
-            start_day += timedelta(days=1)
-            if start_day.weekday() not in [5, 6]:
-                amount_of_workdays += 1
-
-        return amount_of_workdays
+        # The start day itself is always workday 1
+        return self.workday_calendar.workdays_between(start_day, local_day) + 1
 
     def workday_to_datetime(self, workdays):
-        start_day = self.start_day
         if workdays == 0:
             return None
 
-        start = 1
-        while start != workdays:
-            start_day += timedelta(days=1)
-            if start_day.weekday() not in [5, 6]:
-                start += 1
-        return start_day
+        return self.workday_calendar.add_workdays(self.start_day, workdays - 1)
 
     def offboarding_workday_to_date(self, workdays):
         # Converts the workday (before the end date) to the actual date on which it
-        # triggers. This will skip any weekends.
-        base_date = self.termination_date
-
-        while workdays > 0:
-            base_date -= timedelta(days=1)
-            if base_date.weekday() not in [5, 6]:
-                workdays -= 1
-
-        return base_date
+        # triggers. This will skip any weekends and holidays.
+        return self.workday_calendar.add_workdays(
+            self.termination_date, -max(workdays, 0)
+        )
 
     @cached_property
     def days_before_termination_date(self):
         # Checks how many workdays we are away from the employee's last day.
-        # This will skip any weekends.
+        # This will skip any weekends and holidays.
         date = self.get_local_time().date()
 
-        termination_date = self.termination_date
-        if termination_date < date:
+        if self.termination_date < date:
             # passed the termination date
             return -1
 
-        days = 0
-        while termination_date != date:
-            date += timedelta(days=1)
-            if date.weekday() not in [5, 6]:
-                days += 1
-        return days
+        return self.workday_calendar.workdays_between(date, self.termination_date)
+
+    @cached_property
+    def workday_calendar(self):
+        from organization.models import Organization
+
+        return Organization.object.get().workday_calendar
 
     @cached_property
     def days_before_starting(self):
@@ -521,7 +574,7 @@ class User(AbstractBaseUser):
     def personalize(self, text, extra_values=None):
         if extra_values is None:
             extra_values = {}
-        t = Template(text)
+        t = get_template(text)
         department = ""
         manager = ""
         manager_email = ""
@@ -570,13 +623,39 @@ class User(AbstractBaseUser):
         return ", ".join(all_access)
 
     def check_integration_access(self):
+        # Personalizing texts uses a snapshot, the integrations are only checked
+        # again when it expired or when access was given/revoked
+        cache_key = get_access_snapshot_cache_key(self.id)
+        items = cache.get(cache_key)
+        if items is not None:
+            return items
+
         items = {}
-        for integration_user in IntegrationUser.objects.filter(user=self):
+        for integration_user in IntegrationUser.objects.filter(
+            user=self
+        ).select_related("integration"):
             items[integration_user.integration.name] = not integration_user.revoked
 
-        for integration in Integration.objects.filter(manifest__exists__isnull=False):
-            items[integration.name] = integration.user_exists(self)
-
+        integrations = list(
+            Integration.objects.filter(manifest__exists__isnull=False).order_by("id")
+        )
+        access = {
+            integration.id: found_user
+            for integration, found_user in iter_access(integrations, self)
+        }
+        for integration in integrations:
+            items[integration.name] = access[integration.id]
+
+        # Try again soon if a service couldn't be reached
+        cache.set(
+            cache_key,
+            items,
+            (
+                settings.INTEGRATION_ACCESS_CACHE_TIMEOUT
+                if None in items.values()
+                else settings.INTEGRATION_ACCESS_SNAPSHOT_TIMEOUT
+            ),
+        )
         return items
 
     @property
@@ -595,6 +674,11 @@ class User(AbstractBaseUser):
         return "%s" % self.full_name
 
 
+@receiver(post_delete, sender=User)
+def forget_slack_ids(sender, instance, **kwargs):
+    slack_user_lookup.invalidate([instance.slack_user_id, instance.slack_channel_id])
+
+
 class ToDoUserManager(models.Manager):
     def all_to_do(self, user):
         return super().get_queryset().filter(user=user, completed=False)
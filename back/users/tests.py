@@ -119,6 +119,26 @@ def test_offboarding_workday_to_date(date, days_before, new_hire_factory):
     freezer.stop()
 
 
+@pytest.mark.django_db
+@freeze_time("2021-01-18")
+def test_workdays_skip_holidays(new_hire_factory):
+    # Thursday 14th is a holiday, Saturday 16th is ignored as it's in the weekend
+    org = Organization.object.get()
+    org.holidays = [datetime.date(2021, 1, 14), datetime.date(2021, 1, 16)]
+    org.save()
+
+    # Start day on Tuesday
+    user = new_hire_factory(
+        start_day=datetime.date(2021, 1, 12),
+        termination_date=datetime.date(2021, 1, 20),
+    )
+
+    assert user.workday == 4
+    assert user.workday_to_datetime(3) == datetime.date(2021, 1, 15)
+    assert user.days_before_termination_date == 2
+    assert user.offboarding_workday_to_date(4) == datetime.date(2021, 1, 13)
+
+
 @pytest.mark.django_db
 @pytest.mark.parametrize(
     "first_name, last_name, initials, full_name",
@@ -214,8 +234,8 @@ def test_personalize(
 
     # Service errored
     with patch(
-        "admin.integrations.models.Integration.user_exists",
-        Mock(return_value=(None)),
+        "admin.integrations.models.Integration.user_exists_steps",
+        Mock(side_effect=steps_without_requests(None)),
     ):
         assert new_hire.personalize(text) == expected_output
         assert (
@@ -223,6 +243,41 @@ def test_personalize(
         )
 
 
+@pytest.mark.django_db
+def test_personalize_uses_current_values(
+    django_assert_num_queries, manager_factory, new_hire_factory, department_factory
+):
+    new_hire = new_hire_factory(
+        manager=manager_factory(first_name="jane", last_name="smith"),
+        buddy=manager_factory(first_name="john", last_name="doe"),
+        department=department_factory(name="IT"),
+    )
+    new_hire = get_user_model().objects.get(id=new_hire.id)
+
+    # Manager, buddy and department are only fetched once
+    with django_assert_num_queries(3):
+        assert new_hire.personalize("{{ manager }}") == "jane smith"
+        assert new_hire.personalize("{{ buddy }}") == "john doe"
+        assert new_hire.personalize("{{ department }}") == "IT"
+
+    # Changes to the user or its related objects show up without saving the user
+    new_hire.manager = manager_factory(first_name="ann", last_name="lee")
+    new_hire.department.name = "HR"
+    new_hire.buddy = None
+    assert new_hire.personalize("{{ manager }}") == "ann lee"
+    assert new_hire.personalize("{{ department }}") == "HR"
+    assert new_hire.personalize("{{ buddy }}") == ""
+
+
+def steps_without_requests(outcome):
+    # Steps (see `executor.run_steps`) that finish right away with this outcome
+    def steps(*args, **kwargs):
+        return outcome
+        yield
+
+    return steps
+
+
 @pytest.mark.django_db
 def test_check_integration_access(
     new_hire_factory, custom_integration_factory, integration_user_factory
@@ -235,8 +290,8 @@ def test_check_integration_access(
 
     # integration service errored
     with patch(
-        "admin.integrations.models.Integration.user_exists",
-        Mock(return_value=(None)),
+        "admin.integrations.models.Integration.user_exists_steps",
+        Mock(side_effect=steps_without_requests(None)),
     ):
         access = new_hire.check_integration_access()
 
@@ -245,6 +300,58 @@ def test_check_integration_access(
     assert access[integration.name] is None
 
 
+@pytest.mark.django_db
+def test_check_integration_access_snapshot(
+    settings, new_hire_factory, custom_integration_factory
+):
+    new_hire = new_hire_factory()
+    integration = custom_integration_factory()
+
+    user_exists_steps = Mock(side_effect=steps_without_requests(True))
+    with patch(
+        "admin.integrations.models.Integration.user_exists_steps", user_exists_steps
+    ):
+        assert new_hire.check_integration_access() == {integration.name: True}
+        # Personalizing reads the snapshot, nothing gets checked again
+        assert new_hire.personalize("{{ access_overview }}") == (
+            f"{integration.name} (has access)"
+        )
+        assert user_exists_steps.call_count == 1
+
+        # Revoking clears the snapshot
+        with patch(
+            "admin.integrations.models.Integration.revoke_user_steps",
+            Mock(side_effect=steps_without_requests((True, ""))),
+        ):
+            integration.revoke_user(new_hire)
+        new_hire.check_integration_access()
+        assert user_exists_steps.call_count == 2
+
+        # And so does giving access
+        with patch(
+            "admin.integrations.models.Integration.execute_steps",
+            Mock(side_effect=steps_without_requests((True, None))),
+        ):
+            integration.execute(new_hire)
+        new_hire.check_integration_access()
+        assert user_exists_steps.call_count == 3
+
+    # Failed checks are tried again soon
+    settings.INTEGRATION_ACCESS_CACHE_TIMEOUT = 0
+    with patch(
+        "admin.integrations.models.Integration.revoke_user_steps",
+        Mock(side_effect=steps_without_requests((True, ""))),
+    ):
+        integration.revoke_user(new_hire)
+    with patch(
+        "admin.integrations.models.Integration.user_exists_steps",
+        Mock(side_effect=steps_without_requests(None)),
+    ) as user_exists_steps:
+        assert new_hire.check_integration_access() == {integration.name: None}
+        assert new_hire.check_integration_access() == {integration.name: None}
+        assert user_exists_steps.call_count == 2
+
+
 @pytest.mark.django_db
 def test_new_hire_manager(new_hire_factory):
     new_hire_factory(